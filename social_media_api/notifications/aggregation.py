@@ -0,0 +1,105 @@
+# notifications/aggregation.py
+"""
+Notification coalescing.
+
+Events with the same ``(recipient, verb, post)`` arriving within
+``NOTIFICATIONS['AGGREGATION_WINDOW']`` seconds of the group's last activity
+update one row instead of inserting a new one: ``actor_count`` grows,
+``recent_actors`` keeps the newest ``ACTOR_SAMPLE_SIZE`` actor ids, and the
+row is bumped to the top of the list and marked unread again. A viral post
+therefore costs its author one notification row per verb and window.
+
+``actor_count`` is exact: every distinct actor of a group has a
+``NotificationActor`` row, and only actors without one are counted.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Notification, NotificationActor
+
+
+def _group(events):
+    """Collapse a batch into ``{key: (actors newest first, latest comment id)}``."""
+    groups = {}
+    for event in events:
+        key = (event.recipient_id, event.verb, event.post_id)
+        actors, comment_id = groups.get(key, ([], None))
+        if event.actor_id in actors:
+            actors.remove(event.actor_id)
+        actors.insert(0, event.actor_id)
+        groups[key] = (actors, event.comment_id or comment_id)
+    return groups
+
+
+def _merge_sample(new_actors, sample, size):
+    merged = list(new_actors)
+    merged += [actor_id for actor_id in sample if actor_id not in merged]
+    return merged[:size]
+
+
+def write_aggregated(events, window, sample_size):
+    """
+    Upsert a batch of events into aggregated notifications. Returns the
+    ``(created, updated)`` notification rows.
+    """
+    groups = _group(events)
+    now = timezone.now()
+    with transaction.atomic():
+        keys = Q()
+        for recipient_id, verb, post_id in groups:
+            keys |= Q(recipient_id=recipient_id, verb=verb, post_id=post_id)
+        open_groups = {}
+        candidates = (
+            Notification.objects.select_for_update()
+            .filter(keys, timestamp__gte=now - timedelta(seconds=window))
+            .order_by('timestamp', 'id')
+        )
+        for notification in candidates:
+            # the newest row wins when a key has several open groups
+            open_groups[(notification.recipient_id, notification.verb, notification.post_id)] = notification
+        counted = set()
+        if open_groups:
+            counted = set(NotificationActor.objects.filter(
+                notification__in=open_groups.values(),
+                actor_id__in={actor_id for actors, _ in groups.values() for actor_id in actors},
+            ).values_list('notification_id', 'actor_id'))
+
+        created, updated, new_rows = [], [], []
+        for key, (actors, comment_id) in groups.items():
+            notification = open_groups.get(key)
+            if notification is None:
+                recipient_id, verb, post_id = key
+                notification = Notification(
+                    recipient_id=recipient_id, actor_id=actors[0], verb=verb, post_id=post_id,
+                    comment_id=comment_id, actor_count=len(actors), recent_actors=actors[:sample_size],
+                )
+                created.append(notification)
+                new_rows.extend((notification, actor_id) for actor_id in actors if actor_id is not None)
+                continue
+            new_actors = [actor_id for actor_id in actors if (notification.pk, actor_id) not in counted]
+            new_rows.extend((notification, actor_id) for actor_id in new_actors if actor_id is not None)
+            notification.reopened = notification.is_read
+            notification.previous_actor_count = notification.actor_count
+            notification.actor_id = actors[0]
+            notification.comment_id = comment_id or notification.comment_id
+            notification.recent_actors = _merge_sample(actors, notification.recent_actors, sample_size)
+            notification.actor_count = F('actor_count') + len(new_actors)
+            notification.new_actor_count = len(new_actors)
+            notification.timestamp = now
+            notification.is_read = False
+            updated.append(notification)
+
+        Notification.objects.bulk_create(created)
+        Notification.objects.bulk_update(
+            updated, ['actor', 'comment', 'recent_actors', 'actor_count', 'timestamp', 'is_read']
+        )
+        NotificationActor.objects.bulk_create(
+            [NotificationActor(notification=notification, actor_id=actor_id) for notification, actor_id in new_rows]
+        )
+    for notification in updated:
+        # replace the F() so callers see a plain number
+        notification.actor_count = notification.previous_actor_count + notification.new_actor_count
+    return created, updated
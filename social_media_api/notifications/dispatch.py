@@ -0,0 +1,221 @@
+# notifications/dispatch.py
+"""
+Notification delivery pipeline.
+
+Write paths call ``notifications.utils.notify()``, which only records the
+event; rows are written later in batches with ``bulk_create`` so likes,
+comments and follows don't pay for notification I/O inside the request.
+Events are handed over on transaction commit, so a rolled back action never
+notifies anyone.
+
+``settings.NOTIFICATIONS['DELIVERY']`` picks the dispatcher:
+
+``sync``
+    write immediately (one ``bulk_create`` per commit), used by tests.
+``thread``
+    buffer in memory and flush from a background thread every
+    ``FLUSH_INTERVAL`` seconds or ``BATCH_SIZE`` events, whichever comes
+    first. Buffered events are lost if the process dies.
+``durable``
+    like ``thread`` but events are first appended to a local SQLite spool
+    (``SPOOL_PATH``) and only removed once written, so they survive
+    restarts. ``manage.py flush_notifications`` drains the spool by hand.
+"""
+import atexit
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import closing
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+
+from .aggregation import write_aggregated
+from .models import Notification
+from . import realtime, unread
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'DELIVERY': 'thread',
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 0.5,
+    'SPOOL_PATH': None,
+    'AGGREGATION_WINDOW': 24 * 60 * 60,
+    'ACTOR_SAMPLE_SIZE': 3,
+}
+
+NotificationEvent = namedtuple(
+    'NotificationEvent', ['recipient_id', 'actor_id', 'verb', 'post_id', 'comment_id'], defaults=[None, None]
+)
+
+
+def notification_setting(name):
+    return getattr(settings, 'NOTIFICATIONS', {}).get(name, DEFAULTS[name])
+
+
+def write_events(events):
+    """
+    Persist a batch of events, coalescing them into existing notifications
+    unless ``AGGREGATION_WINDOW`` is 0.
+    """
+    window = notification_setting('AGGREGATION_WINDOW')
+    if window:
+        created, updated = write_aggregated(events, window, notification_setting('ACTOR_SAMPLE_SIZE'))
+    else:
+        created, updated = Notification.objects.bulk_create(
+            [Notification(recent_actors=[event.actor_id], **event._asdict()) for event in events],
+            batch_size=notification_setting('BATCH_SIZE'),
+        ), []
+    unread.record_delivery(created, updated)
+    realtime.publish_notifications(created + updated)
+    return created, updated
+
+
+class SyncDispatcher:
+    def put(self, events):
+        write_events(events)
+
+    def flush(self):
+        pass
+
+
+class ThreadedDispatcher:
+    """In-memory buffer drained by a daemon thread."""
+
+    def __init__(self):
+        self.batch_size = notification_setting('BATCH_SIZE')
+        self.interval = notification_setting('FLUSH_INTERVAL')
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        atexit.register(self.flush)
+
+    def put(self, events):
+        for event in events:
+            self._queue.put(event)
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='notification-dispatch', daemon=True)
+                self._worker.start()
+
+    def _take_batch(self, block=True):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.interval) if block else self._queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch, attempts=3):
+        for attempt in range(1, attempts + 1):
+            close_old_connections()
+            try:
+                write_events(batch)
+                return
+            except Exception:
+                if attempt == attempts:
+                    logger.exception("Dropped %d notification(s)", len(batch))
+                else:
+                    time.sleep(self.interval * attempt)
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write everything buffered so far from the calling thread."""
+        while batch := self._take_batch(block=False):
+            self._write(batch)
+
+
+class DurableDispatcher(ThreadedDispatcher):
+    """Events go through an on-disk SQLite spool before reaching the database."""
+
+    def __init__(self):
+        self.path = str(notification_setting('SPOOL_PATH') or settings.BASE_DIR / 'notification_spool.sqlite3')
+        with closing(self._connect()) as spool:
+            spool.execute('PRAGMA journal_mode=WAL')
+            spool.execute('CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, event TEXT NOT NULL)')
+        super().__init__()
+        # deliver whatever an earlier process left behind
+        self._ensure_worker()
+        self._queue.put(None)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def put(self, events):
+        with closing(self._connect()) as spool:
+            spool.executemany('INSERT INTO spool (event) VALUES (?)', [(json.dumps(event),) for event in events])
+        self._queue.put(None)
+        self._ensure_worker()
+
+    def _run(self):
+        while True:
+            # the in-memory queue only carries wake-ups, the spool holds the events
+            self._take_batch()
+            self.flush()
+
+    def flush(self):
+        with closing(self._connect()) as spool:
+            while True:
+                # BEGIN IMMEDIATE serializes drainers across processes; a crash
+                # between the database write and the DELETE redelivers the batch
+                spool.execute('BEGIN IMMEDIATE')
+                rows = spool.execute('SELECT id, event FROM spool ORDER BY id LIMIT ?', (self.batch_size,)).fetchall()
+                if not rows:
+                    spool.execute('COMMIT')
+                    return
+                close_old_connections()
+                try:
+                    write_events([NotificationEvent(*json.loads(event)) for _, event in rows])
+                except Exception:
+                    spool.execute('ROLLBACK')
+                    logger.exception("Notification spool flush failed, will retry")
+                    return
+                finally:
+                    close_old_connections()
+                spool.execute('DELETE FROM spool WHERE id <= ?', (rows[-1][0],))
+                spool.execute('COMMIT')
+
+
+DISPATCHERS = {
+    'sync': SyncDispatcher,
+    'thread': ThreadedDispatcher,
+    'durable': DurableDispatcher,
+}
+
+
+@lru_cache(maxsize=None)
+def get_dispatcher():
+    return DISPATCHERS[notification_setting('DELIVERY')]()
+
+
+@receiver(setting_changed)
+def _reset_dispatcher(setting, **kwargs):
+    if setting == 'NOTIFICATIONS':
+        get_dispatcher.cache_clear()
+
+
+def enqueue(events):
+    """Hand ``events`` to the dispatcher once the current transaction commits."""
+    events = list(events)
+    if events:
+        transaction.on_commit(lambda: get_dispatcher().put(events))
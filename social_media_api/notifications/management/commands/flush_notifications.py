@@ -0,0 +1,12 @@
+# notifications/management/commands/flush_notifications.py
+from django.core.management.base import BaseCommand
+
+from notifications.dispatch import get_dispatcher
+
+
+class Command(BaseCommand):
+    help = "Write out notifications still waiting in the delivery buffer or durable spool."
+
+    def handle(self, *args, **options):
+        get_dispatcher().flush()
+        self.stdout.write(self.style.SUCCESS("Notification queue flushed."))
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:45
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_actors(apps, schema_editor):
+    """Groups that are still open start from the actors they sampled."""
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationActor = apps.get_model('notifications', 'NotificationActor')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    window = getattr(settings, 'NOTIFICATIONS', {}).get('AGGREGATION_WINDOW', 24 * 60 * 60)
+    pairs = set()
+    open_groups = Notification.objects.filter(timestamp__gte=timezone.now() - timedelta(seconds=window))
+    for pk, actor_id, recent_actors in open_groups.values_list('pk', 'actor_id', 'recent_actors').iterator():
+        pairs.update((pk, user_id) for user_id in {actor_id, *recent_actors} if user_id is not None)
+    users = set(User.objects.values_list('pk', flat=True))
+    NotificationActor.objects.bulk_create(
+        [NotificationActor(notification_id=pk, actor_id=user_id) for pk, user_id in pairs if user_id in users],
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='notifications.notification')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('notification', 'actor'), name='notif_actor_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_actors, migrations.RunPython.noop),
+    ]
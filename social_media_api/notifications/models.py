@@ -25,5 +25,38 @@ class Notification(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    # aggregation (see notifications/aggregation.py): how many distinct actors
+    # this row stands for, and the ids of the most recent ones, newest first
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actors = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        indexes = [
+            # keyset pagination of a recipient's notifications on (timestamp, id)
+            models.Index(fields=['recipient', '-timestamp', '-id'], name='notif_recipient_ts_id_idx'),
+            # open aggregation group lookup
+            models.Index(fields=['recipient', 'verb', 'post', '-timestamp'], name='notif_group_idx'),
+            # unread only, stays small however much history a recipient has
+            models.Index(
+                fields=['recipient', '-timestamp'], condition=models.Q(is_read=False), name='notif_unread_idx',
+            ),
+        ]
+
     def __str__(self):
+        if self.actor_count > 1:
+            return f"{self.actor} and {self.actor_count - 1} others {self.verb} → {self.recipient}"
         return f"{self.actor} {self.verb} → {self.recipient}"
+
+
+class NotificationActor(models.Model):
+    """
+    The distinct actors of an aggregated notification, so an actor who
+    dropped out of ``recent_actors`` isn't counted twice.
+    """
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actors')
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'actor'], name='notif_actor_unique'),
+        ]
@@ -0,0 +1,338 @@
+# notifications/realtime.py
+"""
+Real-time push of notifications and new feed posts.
+
+A broker routes events published on named channels to the connections
+subscribed to them:
+
+``user:<id>``
+    new/updated notifications for that user, and new posts fanned out into
+    their home timeline.
+``author:<id>``
+    new posts by a celebrity author (see ``posts.timeline``); every
+    connected follower subscribes to it instead of receiving a per-follower
+    event.
+
+Publishing is synchronous and safe from any thread (request threads, the
+notification dispatcher). Subscriptions live on the ASGI event loop and are
+served either as Server-Sent Events (``notifications.views.notification_stream``)
+or over a WebSocket (``websocket_application``, mounted by ``asgi.py``).
+
+Each subscription has a bounded queue (``REALTIME['QUEUE_SIZE']``). A slow
+consumer loses its oldest events first; once it has lost a full queue's
+worth it is sent an ``overflow`` event and disconnected so the client
+refetches over REST. Idle connections get a heartbeat every
+``REALTIME['HEARTBEAT']`` seconds.
+
+``REALTIME['BROKER']`` selects the broker. ``LocalBroker`` only reaches
+connections held by the same process; ``RedisBroker`` (needs the ``redis``
+package and ``REDIS_URL``) fans out across processes.
+"""
+import asyncio
+import json
+import logging
+import threading
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.core.serializers.json import DjangoJSONEncoder
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BROKER': 'notifications.realtime.LocalBroker',
+    'QUEUE_SIZE': 100,
+    'HEARTBEAT': 15,
+}
+
+OVERFLOW = object()
+
+
+def realtime_setting(name):
+    return getattr(settings, 'REALTIME', {}).get(name, DEFAULTS[name])
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def author_channel(user_id):
+    return f'author:{user_id}'
+
+
+class Subscription:
+    """One connection's view of the broker, consumed on the event loop."""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = list(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(realtime_setting('QUEUE_SIZE'))
+        self.dropped = 0
+        self.closed = False
+
+    def deliver(self, message):
+        """Enqueue ``message``; must run on ``self.loop``."""
+        if self.closed:
+            return
+        if self.queue.full():
+            # drop the oldest event, give up on consumers that can't keep up
+            self.queue.get_nowait()
+            self.dropped += 1
+            if self.dropped >= self.queue.maxsize:
+                self.closed = True
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                self.queue.put_nowait(OVERFLOW)
+                return
+        self.queue.put_nowait(message)
+
+    def deliver_threadsafe(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self.deliver, message)
+        except RuntimeError:
+            # the loop is gone, the connection is being torn down
+            pass
+
+    async def get(self, timeout=None):
+        """Next message, ``OVERFLOW``, or ``None`` when ``timeout`` expires."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.closed = True
+        await self.broker.unsubscribe(self)
+
+
+class BaseBroker:
+    def publish(self, channel, event, data):
+        self.publish_many([channel], event, data)
+
+    def publish_many(self, channels, event, data):
+        raise NotImplementedError
+
+    async def subscribe(self, channels):
+        raise NotImplementedError
+
+    async def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class LocalBroker(BaseBroker):
+    """In-process hub, only reaches connections held by this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def publish_many(self, channels, event, data):
+        message = {'event': event, 'data': data}
+        with self._lock:
+            subscriptions = {sub for channel in channels for sub in self._channels.get(channel, ())}
+        for subscription in subscriptions:
+            subscription.deliver_threadsafe(message)
+
+    async def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+
+class RedisBroker(BaseBroker):
+    """Redis pub/sub, every process sees every event."""
+
+    prefix = 'social_media_api:realtime:'
+
+    def __init__(self):
+        import redis
+
+        self.url = settings.REDIS_URL
+        self._client = redis.Redis.from_url(self.url)
+
+    def publish_many(self, channels, event, data):
+        payload = json.dumps({'event': event, 'data': data}, cls=DjangoJSONEncoder)
+        with self._client.pipeline(transaction=False) as pipe:
+            for channel in channels:
+                pipe.publish(self.prefix + channel, payload)
+            pipe.execute()
+
+    async def subscribe(self, channels):
+        import redis.asyncio
+
+        subscription = Subscription(self, channels)
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(*[self.prefix + channel for channel in subscription.channels])
+
+        async def pump():
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    subscription.deliver(json.loads(message['data']))
+
+        subscription._redis = (client, pubsub, asyncio.create_task(pump()))
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        client, pubsub, task = subscription._redis
+        task.cancel()
+        await pubsub.aclose()
+        await client.aclose()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(realtime_setting('BROKER'))()
+
+
+@receiver(setting_changed)
+def _reset_broker(setting, **kwargs):
+    if setting == 'REALTIME':
+        get_broker.cache_clear()
+
+
+def _publish(channels, event, data):
+    try:
+        get_broker().publish_many(channels, event, data)
+    except Exception:
+        # real-time delivery is best effort, never break the write path
+        logger.exception("Could not publish %s event", event)
+
+
+def publish_notifications(notifications):
+    for notification in notifications:
+        _publish([user_channel(notification.recipient_id)], 'notification', {
+            'id': notification.pk,
+            'verb': notification.verb,
+            'actor_id': notification.actor_id,
+            'post_id': notification.post_id,
+            'comment_id': notification.comment_id,
+            'actor_count': notification.actor_count,
+            'timestamp': notification.timestamp.isoformat(),
+        })
+
+
+def publish_feed_post(post, follower_ids=None):
+    """Announce a new post to followers, or on the author channel for celebrities."""
+    data = {'post_id': post.pk, 'author_id': post.author_id}
+    if follower_ids is None:
+        _publish([author_channel(post.author_id)], 'feed.post', data)
+    else:
+        _publish([user_channel(pk) for pk in follower_ids], 'feed.post', data)
+
+
+def _channels_for(user):
+    from posts import timeline
+    from users import graph
+
+    celebrities = timeline.celebrity_ids(graph.following_ids(user.pk))
+    return [user_channel(user.pk)] + [author_channel(pk) for pk in celebrities]
+
+
+def _authenticate(raw_token):
+    from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+    from rest_framework.exceptions import AuthenticationFailed
+    from users.authentication import CachedJWTAuthentication
+
+    if not raw_token:
+        return None
+    # the API's authentication, so tokens retired by a password change are refused here too
+    auth = CachedJWTAuthentication()
+    try:
+        user = auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+    return user if user.is_active else None
+
+
+@sync_to_async
+def authenticate_and_route(raw_token):
+    """``(user, channels)`` for a JWT access token, or ``(None, [])``."""
+    user = _authenticate(raw_token)
+    if user is None:
+        return None, []
+    return user, _channels_for(user)
+
+
+def encode(message):
+    return json.dumps(message, cls=DjangoJSONEncoder)
+
+
+async def sse_stream(channels):
+    """Server-Sent Events body for a subscription to ``channels``."""
+    subscription = await get_broker().subscribe(channels)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            message = await subscription.get(timeout=realtime_setting('HEARTBEAT'))
+            if message is None:
+                yield ': ping\n\n'
+            elif message is OVERFLOW:
+                yield 'event: overflow\ndata: {}\n\n'
+                break
+            else:
+                yield f"event: {message['event']}\ndata: {encode(message['data'])}\n\n"
+    finally:
+        await subscription.close()
+
+
+async def websocket_application(scope, receive, send):
+    """
+    Raw ASGI WebSocket endpoint at ``/ws/stream/?token=<access token>``.
+    Sends ``{"event": ..., "data": ...}`` frames and ``{"event": "ping"}``
+    heartbeats; anything the client sends is ignored.
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if scope['path'].rstrip('/') != '/ws/stream':
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+    user, channels = await authenticate_and_route(token)
+    if user is None:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+    await send({'type': 'websocket.accept'})
+
+    subscription = await get_broker().subscribe(channels)
+
+    async def watch_client():
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass
+
+    watcher = asyncio.create_task(watch_client())
+    try:
+        while True:
+            # raced against the disconnect, so a client that left is never sent to
+            getter = asyncio.create_task(subscription.get(timeout=realtime_setting('HEARTBEAT')))
+            await asyncio.wait({getter, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if watcher.done():
+                getter.cancel()
+                break
+            message = getter.result()
+            if message is OVERFLOW:
+                await send({'type': 'websocket.send', 'text': encode({'event': 'overflow', 'data': {}})})
+                await send({'type': 'websocket.close', 'code': 4008})
+                break
+            await send({'type': 'websocket.send', 'text': encode(message or {'event': 'ping', 'data': {}})})
+    finally:
+        watcher.cancel()
+        await subscription.close()
@@ -1,40 +1,66 @@
 # notifications/serializers.py
+from django.db.models import F
 from rest_framework import serializers
 from .models import Notification
 from django.contrib.auth import get_user_model
 from posts.models import Post, Comment
+from social_media_api.fieldsets import SparseFieldsetMixin
+from social_media_api.readpath import ReadPlan
 
 User = get_user_model()
 
 
-class SimpleUserSerializer(serializers.ModelSerializer):
+def summarize(actor_name, actor_count, verb):
+    """e.g. 'alice and 41 others liked your post'."""
+    actor = 'Someone' if actor_name is None else actor_name
+    others = actor_count - 1
+    if others > 0:
+        return f"{actor} and {others} {'other' if others == 1 else 'others'} {verb}"
+    return f"{actor} {verb}"
+
+
+class SimpleUserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Lightweight user serializer to avoid circular imports"""
     class Meta:
         model = User
         fields = ['id', 'username', 'profile_picture']
 
 
-class MinimalPostSerializer(serializers.ModelSerializer):
+class MinimalPostSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Lightweight post serializer"""
     class Meta:
         model = Post
         fields = ['id', 'title', 'created_at']
 
 
-class MinimalCommentSerializer(serializers.ModelSerializer):
+class MinimalCommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Lightweight comment serializer"""
     class Meta:
         model = Comment
         fields = ['id', 'content', 'created_at']
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationListSerializer(serializers.ListSerializer):
+    """Resolves the recent actors of a whole page in one query."""
+    def to_representation(self, data):
+        notifications = list(data.all() if hasattr(data, 'all') else data)
+        if 'recent_actors' not in self.child.fields:
+            return super().to_representation(notifications)
+        actor_ids = {actor_id for n in notifications for actor_id in n.recent_actors}
+        self.context['recent_actor_map'] = User.objects.in_bulk(actor_ids)
+        return super().to_representation(notifications)
+
+
+class NotificationSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     actor = SimpleUserSerializer(read_only=True)
     post = MinimalPostSerializer(read_only=True)
     comment = MinimalCommentSerializer(read_only=True)
+    recent_actors = serializers.SerializerMethodField()
+    summary = serializers.SerializerMethodField()
 
     class Meta:
         model = Notification
+        list_serializer_class = NotificationListSerializer
         fields = [
             'id',
             'recipient',
@@ -44,5 +70,43 @@ class NotificationSerializer(serializers.ModelSerializer):
             'comment',
             'timestamp',
             'is_read',
+            'actor_count',
+            'recent_actors',
+            'summary',
         ]
-        read_only_fields = ['timestamp']
+        read_only_fields = ['timestamp', 'actor_count']
+        expandable_fields = ['actor', 'post', 'comment', 'recent_actors']
+
+    def get_recent_actors(self, obj):
+        users = self.context.get('recent_actor_map')
+        if users is None:
+            users = User.objects.in_bulk(obj.recent_actors)
+        actors = [users[actor_id] for actor_id in obj.recent_actors if actor_id in users]
+        return SimpleUserSerializer(
+            actors, many=True, context=self.context, fieldset=self.nested_fieldset('recent_actors')
+        ).data
+
+    def get_summary(self, obj):
+        return summarize(obj.actor.username if obj.actor else None, obj.actor_count, obj.verb)
+
+    # fast read path, see social_media_api.readpath
+
+    def plan_recent_actors(self, plan):
+        actors = ReadPlan(SimpleUserSerializer(context=self.context, fieldset=self.nested_fieldset('recent_actors')))
+        column = plan.column('recent_actors')
+        users = {}
+
+        def fetch(rows):
+            users.clear()
+            actor_ids = {actor_id for row in rows for actor_id in row[column]}
+            if actor_ids:
+                found = list(User.objects.filter(pk__in=actor_ids).values(*actors.columns, actor_pk=F('pk')))
+                users.update(zip([user['actor_pk'] for user in found], actors.render_many(found)))
+
+        plan.batch(fetch)
+        return lambda row: [users[actor_id] for actor_id in row[column] if actor_id in users]
+
+    def plan_summary(self, plan):
+        actor, name = plan.column('actor'), plan.column('actor__username')
+        count, verb = plan.column('actor_count'), plan.column('verb')
+        return lambda row: summarize(row[name] if row[actor] is not None else None, row[count], row[verb])
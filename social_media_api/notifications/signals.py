@@ -0,0 +1,14 @@
+# notifications/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Notification
+from . import unread
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    # also reached by cascades from deleted posts, comments and actors
+    if not instance.is_read:
+        transaction.on_commit(lambda: unread.adjust(instance.recipient_id, -1))
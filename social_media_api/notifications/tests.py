@@ -1,3 +1,310 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from posts.models import Comment, Post
+from social_media_api.readpath import ReadPlan
+from social_media_api.testing import QueryBudgetMixin, QueryPlanMixin, ReadPathParityMixin
+from . import dispatch, realtime, unread
+from .dispatch import NotificationEvent, write_events
+from .models import Notification
+from .serializers import NotificationSerializer
+from .utils import notify
+
+User = get_user_model()
+
+
+class HotPathIndexTests(QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipient = User.objects.create_user('recipient', password='pass')
+
+    def test_list_reads_the_recipient_index(self):
+        notifications = Notification.objects.filter(recipient=self.recipient).order_by('-timestamp', '-id')
+        self.assertUsesIndex(notifications[:11], 'notif_recipient_ts_id_idx')
+
+    def test_unread_reads_the_partial_index(self):
+        unread = Notification.objects.filter(recipient=self.recipient, is_read=False).order_by('-timestamp')
+        self.assertUsesIndex(unread, 'notif_unread_idx')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class FastReadPathParityTests(ReadPathParityMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipient = User.objects.create_user('recipient', password='pass')
+        actors = [User.objects.create_user(f'actor{i}', password='pass') for i in range(4)]
+        post = Post.objects.create(author=cls.recipient, title='Hello', content='World')
+        comment = Comment.objects.create(post=post, author=actors[0], content='Hi')
+        Notification.objects.bulk_create([
+            Notification(recipient=cls.recipient, actor=actors[0], verb='liked your post', post=post,
+                         actor_count=3, recent_actors=[actors[0].pk, actors[1].pk, actors[2].pk]),
+            Notification(recipient=cls.recipient, actor=actors[1], verb='commented on your post', post=post,
+                         comment=comment, recent_actors=[actors[1].pk], is_read=True),
+            Notification(recipient=cls.recipient, actor=None, verb='started following you', actor_count=2,
+                         recent_actors=[actors[3].pk, 999999]),
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.recipient)
+
+    def test_notification_serializer_has_a_read_plan(self):
+        ReadPlan(NotificationSerializer())
+
+    def test_notification_list(self):
+        for query in ['', '?page_size=2', '?fields=id,summary,recent_actors.username', '?expand=actor']:
+            with self.subTest(query=query):
+                self.assertSameAsSerializers(self.client, f'/api/notifications/{query}')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_notifications(self):
+        self.assertWithinBudget('notifications')
+
+
+@override_settings(NOTIFICATIONS={'DELIVERY': 'sync'})
+class RealtimeAuthenticationTests(TestCase):
+    def test_token_retired_by_a_password_change_cannot_open_a_stream(self):
+        from users.views import CustomTokenObtainPairSerializer
+
+        cache.clear()
+        user = User.objects.create_user('listener', password='old-password')
+        stale = str(CustomTokenObtainPairSerializer.get_token(user).access_token)
+        self.assertEqual(realtime._authenticate(stale), user)
+        user.set_password('new-password')
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertIsNone(realtime._authenticate(stale))
+        self.assertEqual(realtime._authenticate(str(CustomTokenObtainPairSerializer.get_token(user).access_token)), user)
+
+
+@override_settings(REALTIME={'BROKER': 'notifications.realtime.LocalBroker', 'QUEUE_SIZE': 2, 'HEARTBEAT': 60})
+class RealtimeDeliveryTests(SimpleTestCase):
+    async def test_broker_fans_out_to_subscribed_channels(self):
+        broker = realtime.get_broker()
+        both = await broker.subscribe(['user:1', 'author:2'])
+        other = await broker.subscribe(['user:3'])
+        broker.publish_many(['user:1', 'author:2'], 'feed.post', {'post_id': 1})
+        self.assertEqual(await both.get(timeout=1), {'event': 'feed.post', 'data': {'post_id': 1}})
+        # subscribed to both channels, delivered once
+        self.assertIsNone(await both.get(timeout=0.05))
+        self.assertIsNone(await other.get(timeout=0.05))
+        await both.close()
+        broker.publish('user:1', 'notification', {})
+        self.assertIsNone(await both.get(timeout=0.05))
+        await other.close()
+
+    async def test_slow_consumers_lose_the_oldest_events_then_overflow(self):
+        subscription = await realtime.get_broker().subscribe(['user:1'])
+        for n in range(3):
+            subscription.deliver(n)
+        self.assertEqual([await subscription.get(1), await subscription.get(1)], [1, 2])
+        for n in range(4):
+            subscription.deliver(n)
+        self.assertIs(await subscription.get(1), realtime.OVERFLOW)
+        self.assertTrue(subscription.closed)
+        await subscription.close()
+
+    async def connect(self):
+        """Run the WebSocket endpoint, returns the task, its sent frames and a disconnect trigger."""
+        incoming = asyncio.Queue()
+        incoming.put_nowait({'type': 'websocket.connect'})
+        sent = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': '/ws/stream/', 'query_string': b'token=t'}
+        with mock.patch.object(realtime, 'authenticate_and_route', mock.AsyncMock(return_value=(object(), ['user:1']))):
+            task = asyncio.create_task(realtime.websocket_application(scope, incoming.get, sent.put))
+            self.assertEqual(await asyncio.wait_for(sent.get(), 1), {'type': 'websocket.accept'})
+        return task, sent, lambda: incoming.put_nowait({'type': 'websocket.disconnect'})
+
+    async def frame(self, sent):
+        return json.loads((await asyncio.wait_for(sent.get(), 1))['text'])
+
+    async def test_websocket_sends_events_and_stops_on_disconnect(self):
+        task, sent, disconnect = await self.connect()
+        realtime.get_broker().publish('user:1', 'notification', {'id': 7})
+        self.assertEqual(await self.frame(sent), {'event': 'notification', 'data': {'id': 7}})
+        disconnect()
+        # well before the 60 second heartbeat
+        await asyncio.wait_for(task, 1)
+        self.assertTrue(sent.empty())
+
+    @override_settings(REALTIME={'HEARTBEAT': 0.01})
+    async def test_idle_websocket_gets_heartbeats(self):
+        task, sent, disconnect = await self.connect()
+        self.assertEqual(await self.frame(sent), {'event': 'ping', 'data': {}})
+        disconnect()
+        await asyncio.wait_for(task, 1)
+
+
+@override_settings(NOTIFICATIONS={'DELIVERY': 'sync', 'ACTOR_SAMPLE_SIZE': 2})
+class AggregationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.post = Post.objects.create(author=cls.author, title='t', content='c')
+        cls.fans = [User.objects.create_user(f'fan{n}', password='pass') for n in range(4)]
+
+    def like(self, *fans):
+        write_events([
+            NotificationEvent(self.author.pk, fan.pk, 'liked your post', self.post.pk) for fan in fans
+        ])
+        return Notification.objects.get(recipient=self.author)
+
+    def test_actors_outside_the_sample_are_not_counted_again(self):
+        self.like(*self.fans[:3])
+        # fans[0] has dropped out of the two-actor sample
+        notification = self.like(self.fans[0])
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.recent_actors, [self.fans[0].pk, self.fans[2].pk])
+        self.assertEqual(str(notification), 'fan0 and 2 others liked your post → author')
+
+    def test_new_actors_are_counted_once(self):
+        self.like(self.fans[0])
+        self.like(self.fans[1], self.fans[1], self.fans[0])
+        self.assertEqual(self.like(self.fans[2], self.fans[3]).actor_count, 4)
+        self.assertEqual(self.like(*self.fans).actor_count, 4)
+
+
+@override_settings(NOTIFICATIONS={'DELIVERY': 'sync'})
+class UnreadCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.fan = User.objects.create_user('fan', password='pass')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cascade_deletes_leave_the_counter_right(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(author=self.author, title='t', content='c')
+            read = Post.objects.create(author=self.author, title='r', content='c')
+        with self.captureOnCommitCallbacks(execute=True):
+            for target in [post, read]:
+                Comment.objects.create(post=target, author=self.fan, content='hi')
+        Notification.objects.filter(post=read).update(is_read=True)
+        cache.clear()
+        # cached from here on
+        self.assertEqual(unread.unread_count(self.author.pk), 1)
+        for deleted in [read, post]:
+            with self.captureOnCommitCallbacks(execute=True):
+                deleted.delete()
+            self.assertEqual(
+                unread.unread_count(self.author.pk),
+                Notification.objects.filter(recipient=self.author, is_read=False).count(),
+            )
+        self.assertEqual(unread.unread_count(self.author.pk), 0)
+
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_mark_read_validates_the_ids(self):
+        post = Post.objects.create(author=self.author, title='t', content='c')
+        write_events([NotificationEvent(self.author.pk, self.fan.pk, 'liked your post', post.pk)])
+        notification = Notification.objects.get()
+        client = APIClient()
+        client.force_authenticate(self.author)
+        for ids in [True, [True], [notification.pk, '2'], list(range(101))]:
+            with self.subTest(ids=ids):
+                response = client.post('/api/notifications/mark_read/', {'ids': ids}, format='json')
+                self.assertEqual(response.status_code, 400)
+        response = client.post('/api/notifications/mark_read/', {'ids': [notification.pk]}, format='json')
+        self.assertEqual(response.data, {'marked_read': 1})
+        self.assertEqual(unread.unread_count(self.author.pk), 0)
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class ListETagTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.fan = User.objects.create_user('fan', password='pass')
+        post = Post.objects.create(author=cls.author, title='t', content='c')
+        write_events([NotificationEvent(cls.author.pk, cls.fan.pk, 'liked your post', post.pk)])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_actor_rename_changes_the_etag(self):
+        etag = self.client.get('/api/notifications/')['ETag']
+        self.assertEqual(self.client.get('/api/notifications/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.fan.username = 'fan2'
+        self.fan.save()
+        response = self.client.get('/api/notifications/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['actor']['username'], 'fan2')
+
+
+class DispatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.fans = [User.objects.create_user(f'fan{n}', password='pass') for n in range(5)]
+        cls.post = Post.objects.create(author=cls.author, title='t', content='c')
+
+    def setUp(self):
+        cache.clear()
+        # the worker threads would write outside the test transaction, flush() is called by hand instead
+        self.enterContext(mock.patch.object(dispatch.ThreadedDispatcher, '_ensure_worker'))
+        self.enterContext(mock.patch.object(dispatch.atexit, 'register'))
+        self.writes = self.enterContext(mock.patch.object(dispatch, 'write_events', wraps=dispatch.write_events))
+
+    def events(self):
+        return [NotificationEvent(self.author.pk, fan.pk, 'followed you') for fan in self.fans]
+
+    def batch_sizes(self):
+        return [len(call.args[0]) for call in self.writes.call_args_list]
+
+    @override_settings(NOTIFICATIONS={'DELIVERY': 'sync'})
+    def test_events_are_handed_over_on_commit_only(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                notify(self.author.pk, self.fans[0].pk, 'followed you')
+                raise RuntimeError
+        self.assertEqual((callbacks, self.writes.call_count), ([], 0))
+        with self.captureOnCommitCallbacks() as callbacks:
+            notify(self.author.pk, self.fans[0].pk, 'followed you')
+        self.assertFalse(Notification.objects.exists())
+        callbacks[0]()
+        self.assertEqual(Notification.objects.get().actor, self.fans[0])
+
+    @override_settings(NOTIFICATIONS={'DELIVERY': 'thread', 'BATCH_SIZE': 2, 'AGGREGATION_WINDOW': 0})
+    def test_thread_dispatcher_writes_in_batches(self):
+        dispatcher = dispatch.ThreadedDispatcher()
+        dispatcher.put(self.events())
+        self.assertFalse(Notification.objects.exists())
+        dispatcher.flush()
+        self.assertEqual(self.batch_sizes(), [2, 2, 1])
+        self.assertEqual(Notification.objects.count(), 5)
+
+    def test_durable_spool_is_drained(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.enterContext(override_settings(NOTIFICATIONS={
+            'DELIVERY': 'durable', 'BATCH_SIZE': 2, 'AGGREGATION_WINDOW': 0,
+            'SPOOL_PATH': os.path.join(directory, 'spool.sqlite3'),
+        }))
+        dispatcher = dispatch.DurableDispatcher()
+        dispatcher.put(self.events())
+        with mock.patch.object(dispatch, 'write_events', side_effect=RuntimeError):
+            with self.assertLogs('notifications.dispatch', 'ERROR'):
+                dispatcher.flush()
+        # a failed write leaves the events spooled, a new process picks them up
+        dispatcher = dispatch.DurableDispatcher()
+        dispatcher.flush()
+        self.assertEqual(self.batch_sizes(), [2, 2, 1])
+        self.assertEqual(Notification.objects.count(), 5)
+        dispatcher.flush()
+        self.assertEqual(Notification.objects.count(), 5)
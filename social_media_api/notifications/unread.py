@@ -0,0 +1,56 @@
+# notifications/unread.py
+"""
+Per-user unread notification counter kept in the cache.
+
+Reads fall back to a ``COUNT(*)`` on a miss and cache the result for
+``UNREAD_COUNT_TTL`` seconds; deliveries increment it, read actions and
+deleted unread notifications (notifications.signals) decrement or reset it,
+so badge polling is normally a single cache hit. A counter that cannot be
+adjusted (e.g. evicted) is simply recomputed on the next read.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Notification
+
+
+def _key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def _ttl():
+    return getattr(settings, 'NOTIFICATIONS', {}).get('UNREAD_COUNT_TTL', 300)
+
+
+def unread_count(user_id):
+    count = cache.get(_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        cache.add(_key(user_id), count, _ttl())
+    return count
+
+
+def adjust(user_id, delta):
+    if not delta:
+        return
+    try:
+        count = cache.incr(_key(user_id), delta)
+    except ValueError:
+        # not cached, the next read recomputes it
+        return
+    if count < 0:
+        cache.delete(_key(user_id))
+
+
+def reset(user_id):
+    cache.set(_key(user_id), 0, _ttl())
+
+
+def record_delivery(created, updated):
+    """Count rows that became unread in a delivery batch."""
+    per_recipient = Counter(n.recipient_id for n in created)
+    per_recipient.update(n.recipient_id for n in updated if getattr(n, 'reopened', False))
+    for recipient_id, delta in per_recipient.items():
+        adjust(recipient_id, delta)
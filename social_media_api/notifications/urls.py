@@ -1,8 +1,11 @@
 # notifications/urls.py
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import NotificationViewSet
+from .views import NotificationViewSet, notification_stream
 
 router = DefaultRouter()
 router.register(r'', NotificationViewSet, basename='notifications')
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('stream/', notification_stream, name='notification-stream'),
+] + router.urls
@@ -1,21 +1,15 @@
 # notifications/utils.py
-from .models import Notification
-from django.contrib.contenttypes.models import ContentType
+from .dispatch import NotificationEvent, enqueue
 
-def create_notification(recipient, actor, verb, target=None):
+
+def notify(recipient_id, actor_id, verb, post_id=None, comment_id=None):
     """
-    Creates a Notification record. Accepts a model instance target or None.
+    Queue a notification; it is written in a batch after the current
+    transaction commits (see notifications/dispatch.py).
     """
-    nc = None
-    if target is not None:
-        content_type = ContentType.objects.get_for_model(target.__class__)
-        nc = Notification.objects.create(
-            recipient=recipient,
-            actor=actor,
-            verb=verb,
-            target_content_type=content_type,
-            target_object_id=target.pk
-        )
-    else:
-        nc = Notification.objects.create(recipient=recipient, actor=actor, verb=verb)
-    return nc
+    enqueue([NotificationEvent(recipient_id, actor_id, verb, post_id, comment_id)])
+
+
+def notify_many(events):
+    """Queue several ``NotificationEvent`` at once."""
+    enqueue(events)
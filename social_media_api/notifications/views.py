@@ -1,18 +1,70 @@
 # notifications/views.py
-from rest_framework import generics, permissions, viewsets
+from rest_framework import generics, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.http import JsonResponse, StreamingHttpResponse
 from .models import Notification
 from .serializers import NotificationSerializer
+from . import realtime, unread
+from social_media_api.conditional import ConditionalListMixin
+from social_media_api.fieldsets import SparseFieldsetViewMixin
+from social_media_api.readpath import FastListMixin
+from social_media_api.pagination import NotificationCursorPagination
 
-class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
+MARK_READ_LIMIT = 100
+
+
+class NotificationViewSet(SparseFieldsetViewMixin, ConditionalListMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationCursorPagination
+    # aggregation bumps timestamp; reading flips is_read
+    watermark_field = 'timestamp'
+    watermark_fields = ('actor_count', 'is_read', 'actor__updated_at', 'post__updated_at', 'comment__updated_at')
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        # the summary names the actor
+        related = [name for name in ('actor', 'post', 'comment') if self.renders(name)]
+        if 'actor' not in related and self.renders('summary'):
+            related.append('actor')
+        queryset = Notification.objects.filter(recipient=self.request.user)
+        return queryset.select_related(*related) if related else queryset
 
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+        unread.reset(request.user.pk)
         return Response({'status': 'all marked as read'})
+
+    @action(detail=False, methods=['post'])
+    def mark_read(self, request):
+        ids = request.data.get('ids')
+        # bool is an int subclass, True would mark notification 1
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            return Response({'ids': 'A list of notification ids is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MARK_READ_LIMIT:
+            return Response({'ids': f'At most {MARK_READ_LIMIT} ids are allowed.'}, status=status.HTTP_400_BAD_REQUEST)
+        updated = Notification.objects.filter(recipient=request.user, pk__in=ids, is_read=False).update(is_read=True)
+        unread.adjust(request.user.pk, -updated)
+        return Response({'marked_read': updated})
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        return Response({'unread_count': unread.unread_count(request.user.pk)})
+
+
+async def notification_stream(request):
+    """
+    Server-Sent Events stream of new notifications and feed posts for the
+    authenticated user. Needs an ASGI server; since EventSource cannot set
+    headers the access token may also be passed as ``?token=``.
+    """
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else request.GET.get('token')
+    user, channels = await realtime.authenticate_and_route(token)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+    response = StreamingHttpResponse(realtime.sse_stream(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
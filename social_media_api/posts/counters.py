@@ -0,0 +1,78 @@
+# posts/counters.py
+"""
+Denormalized counters on ``Post`` (likes, comments) and ``CustomUser``
+(followers, following, posts).
+
+Counters are adjusted in place with ``F()`` expressions from the signal
+receivers in ``posts.signals`` and ``users.signals`` so they commit together
+with the row that changed them; reads never aggregate. The ``*_total``
+subqueries compute the true values and are used by the migration that
+introduced the columns and by ``manage.py reconcile_counters``.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Post, Comment, Like
+
+User = get_user_model()
+Follow = User.following.through
+
+
+def adjust(model, pks, **deltas):
+    """
+    Add ``deltas`` (``field=n``) to the counters of every row in ``pks``.
+    Decrements are floored at zero so a drifted counter never goes negative.
+    """
+    if not isinstance(pks, (list, set, tuple, frozenset)):
+        pks = [pks]
+    if not pks:
+        return 0
+    changes = {
+        field: F(field) + delta if delta >= 0 else Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items() if delta
+    }
+    if not changes:
+        return 0
+    return model.objects.filter(pk__in=pks).update(**changes)
+
+
+def _total(queryset, group_by):
+    return Coalesce(
+        Subquery(queryset.order_by().values(group_by).annotate(n=Count('pk')).values('n')),
+        0,
+    )
+
+
+def likes_total():
+    return _total(Like.objects.filter(post=OuterRef('pk')), 'post')
+
+
+def comments_total():
+    return _total(Comment.objects.filter(post=OuterRef('pk')), 'post')
+
+
+def posts_total():
+    return _total(Post.objects.filter(author=OuterRef('pk')), 'author')
+
+
+def followers_total():
+    return _total(Follow.objects.filter(to_customuser=OuterRef('pk')), 'to_customuser')
+
+
+def following_total():
+    return _total(Follow.objects.filter(from_customuser=OuterRef('pk')), 'from_customuser')
+
+
+# model -> {counter field: expression computing its true value}
+COUNTERS = {
+    Post: {
+        'likes_count': likes_total,
+        'comments_count': comments_total,
+    },
+    User: {
+        'followers_count': followers_total,
+        'following_count': following_total,
+        'posts_count': posts_total,
+    },
+}
@@ -0,0 +1,19 @@
+# posts/filters.py
+from rest_framework import filters
+
+from . import search
+
+
+class PostSearchFilter(filters.BaseFilterBackend):
+    """
+    ``?search=`` backed by the full-text index in posts/search.py rather
+    than ``SearchFilter``'s ``LIKE '%term%'`` scan. Terms are ANDed and
+    prefix matched; the view's ordering is kept.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search.get_backend().filter(queryset, query)
@@ -0,0 +1,340 @@
+# posts/likes.py
+"""
+Likes without read-modify-write.
+
+``like()`` is one ``INSERT ... ON CONFLICT DO NOTHING`` (``INSERT OR IGNORE``
+on SQLite) and ``unlike()`` one conditional ``DELETE``. The affected row
+count says whether anything changed, and only then are the counter, the
+cached post and the notification updated, so repeating either call is a
+no-op and the like endpoints are safe to retry.
+
+Likes saved or deleted through the ORM (admin, fixtures, cascades) reach the
+same ``liked()``/``unliked()`` hooks from ``posts.signals``.
+
+A like notifies the post's author at most once per actor and post within
+``NOTIFICATIONS['AGGREGATION_WINDOW']``, so like/unlike/like doesn't notify
+again.
+
+``settings.LIKES['WRITE']`` picks how likes reach the database:
+
+``direct``
+    the statements above, in the request's transaction.
+``buffered``
+    write-behind for viral spikes. Requests only record the intent in
+    memory, where a later intent for the same (user, post) replaces an
+    earlier one; a background thread writes them every ``FLUSH_INTERVAL``
+    seconds in transactions of up to ``BATCH_SIZE`` intents, with one
+    ``INSERT ... RETURNING``, one ``DELETE ... RETURNING`` per post and one
+    counter ``UPDATE`` per distinct delta, so a hot post's row is locked
+    once per flush instead of once per like. The acting user sees their own pending likes
+    (``pending()`` is laid over ``liked_by_me``); counters and other users
+    catch up at the next flush. Intents are per process and lost if it
+    dies, ``manage.py reconcile_counters`` repairs the counters if needed.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import close_old_connections, connection, transaction
+from django.db.models.constants import OnConflict
+from django.dispatch import receiver
+from django.utils import timezone
+
+from notifications.dispatch import notification_setting
+from notifications.utils import notify
+from social_media_api import object_cache
+from .counters import adjust
+from .models import Like, Post
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WRITE': 'direct',
+    'FLUSH_INTERVAL': 0.5,
+    'BATCH_SIZE': 1000,
+}
+
+
+def likes_setting(name):
+    return getattr(settings, 'LIKES', {}).get(name, DEFAULTS[name])
+
+
+def _sql(template):
+    meta = Like._meta
+    quote = connection.ops.quote_name
+    return template.format(
+        table=quote(meta.db_table),
+        post=quote(meta.get_field('post').column),
+        user=quote(meta.get_field('user').column),
+        created_at=quote(meta.get_field('created_at').column),
+    )
+
+
+def _insert_sql(rows=1, returning=False):
+    ops = connection.ops
+    fields = [Like._meta.get_field(name) for name in ('post', 'user')]
+    values = ', '.join(['(%s, %s, %s)'] * rows)
+    return _sql(
+        f'{ops.insert_statement(on_conflict=OnConflict.IGNORE)} {{table}} ({{post}}, {{user}}, {{created_at}}) '
+        f'VALUES {values} {ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None)}'
+        + (' RETURNING {user}, {post}' if returning else '')
+    )
+
+
+def _now():
+    return Like._meta.get_field('created_at').get_db_prep_value(timezone.now(), connection)
+
+
+def _insert(user_id, post_id, author_id):
+    with connection.cursor() as cursor:
+        cursor.execute(_insert_sql(), [post_id, user_id, _now()])
+        created = cursor.rowcount == 1
+    if created:
+        liked(post_id, author_id, user_id)
+    return created
+
+
+def _delete(user_id, post_id):
+    with connection.cursor() as cursor:
+        deleted = _delete_row(cursor, user_id, post_id) == 1
+    if deleted:
+        unliked(post_id)
+    return deleted
+
+
+def _insert_many(pairs):
+    """Insert ``[(user_id, post_id)]``, returns the pairs that were actually new."""
+    created_at = _now()
+    inserted = set()
+    with connection.cursor() as cursor:
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # no RETURNING, one statement per like and its row count
+            for user_id, post_id in pairs:
+                cursor.execute(_insert_sql(), [post_id, user_id, created_at])
+                if cursor.rowcount == 1:
+                    inserted.add((user_id, post_id))
+            return inserted
+        size = connection.ops.bulk_batch_size(['post', 'user', 'created_at'], pairs)
+        for start in range(0, len(pairs), size):
+            chunk = pairs[start:start + size]
+            params = [value for user_id, post_id in chunk for value in (post_id, user_id, created_at)]
+            # only rows that didn't conflict come back
+            cursor.execute(_insert_sql(len(chunk), returning=True), params)
+            inserted.update(map(tuple, cursor.fetchall()))
+    return inserted
+
+
+def _delete_many(post_id, user_ids):
+    """Delete ``user_ids``' likes of ``post_id``, returns how many existed."""
+    with connection.cursor() as cursor:
+        if not connection.features.can_return_rows_from_bulk_insert:
+            return sum(_delete_row(cursor, user_id, post_id) for user_id in user_ids)
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        cursor.execute(
+            _sql(f'DELETE FROM {{table}} WHERE {{post}} = %s AND {{user}} IN ({placeholders}) RETURNING {{user}}'),
+            [post_id, *user_ids],
+        )
+        return len(cursor.fetchall())
+
+
+def _delete_row(cursor, user_id, post_id):
+    cursor.execute(_sql('DELETE FROM {table} WHERE {post} = %s AND {user} = %s'), [post_id, user_id])
+    return cursor.rowcount
+
+
+def liked(post_id, author_id, user_id):
+    adjust(Post, post_id, likes_count=1)
+    # counts are part of the cached post
+    object_cache.invalidate('post', post_id)
+    notify_liked(post_id, author_id, user_id)
+
+
+def notify_liked(post_id, author_id, user_id):
+    if author_id == user_id:
+        return
+    window = notification_setting('AGGREGATION_WINDOW')
+    if not window or cache.add(f'liked:{user_id}:{post_id}', 1, window):
+        notify(recipient_id=author_id, actor_id=user_id, verb='liked your post', post_id=post_id)
+
+
+def unliked(post_id):
+    adjust(Post, post_id, likes_count=-1)
+    object_cache.invalidate('post', post_id)
+
+
+def write_intents(intents):
+    """
+    Apply ``{(user_id, post_id): (liked, author_id)}`` in one transaction,
+    with counter deltas applied once per post. The deltas come from the rows
+    the statements actually inserted or deleted, so intents that another
+    process or a direct like already applied don't move the counters twice.
+    """
+    post_ids = {post_id for _, post_id in intents}
+    with transaction.atomic():
+        # posts deleted since the intent was recorded
+        alive = set(Post.objects.filter(pk__in=post_ids).order_by().values_list('pk', flat=True))
+        created = _insert_many([
+            (user_id, post_id) for (user_id, post_id), (like, _) in intents.items() if like and post_id in alive
+        ])
+        unlikes = defaultdict(list)
+        for (user_id, post_id), (like, _) in intents.items():
+            if not like:
+                unlikes[post_id].append(user_id)
+        deltas = Counter(post_id for _, post_id in created)
+        deleted = 0
+        for post_id, user_ids in unlikes.items():
+            count = _delete_many(post_id, user_ids)
+            deltas[post_id] -= count
+            deleted += count
+        by_delta = defaultdict(list)
+        for post_id, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(post_id)
+        for delta, pks in by_delta.items():
+            adjust(Post, pks, likes_count=delta)
+        object_cache.invalidate('post', [post_id for post_id, delta in deltas.items() if delta])
+        for user_id, post_id in created:
+            notify_liked(post_id, intents[user_id, post_id][1], user_id)
+    return len(created), deleted
+
+
+class DirectWriter:
+    def like(self, user_id, post_id, author_id):
+        return _insert(user_id, post_id, author_id)
+
+    def unlike(self, user_id, post_id):
+        return _delete(user_id, post_id)
+
+    def pending(self, user_id):
+        return {}
+
+    def flush(self):
+        pass
+
+
+class BufferedWriter:
+    """Coalesces like intents in memory and writes them from a daemon thread."""
+
+    def __init__(self):
+        self.batch_size = likes_setting('BATCH_SIZE')
+        self.interval = likes_setting('FLUSH_INTERVAL')
+        # user_id -> {post_id: (liked, author_id)}, the latest intent wins
+        self._pending = defaultdict(dict)
+        # taken by the flush in progress, still visible to pending()
+        self._flushing = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        atexit.register(self.flush)
+
+    def like(self, user_id, post_id, author_id):
+        was_liked = self._is_liked(user_id, post_id)
+        self._record(user_id, post_id, True, author_id)
+        return not was_liked
+
+    def unlike(self, user_id, post_id):
+        was_liked = self._is_liked(user_id, post_id)
+        self._record(user_id, post_id, False, None)
+        return was_liked
+
+    def _is_liked(self, user_id, post_id):
+        pending = self.pending(user_id)
+        if post_id in pending:
+            return pending[post_id]
+        return Like.objects.filter(user_id=user_id, post_id=post_id).exists()
+
+    def _record(self, user_id, post_id, like, author_id):
+        with self._lock:
+            self._pending[user_id][post_id] = (like, author_id)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='like-write-behind', daemon=True)
+                self._worker.start()
+
+    def pending(self, user_id):
+        with self._lock:
+            intents = {**self._flushing.get(user_id, {}), **self._pending.get(user_id, {})}
+        return {post_id: like for post_id, (like, _) in intents.items()}
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Write everything recorded so far from the calling thread."""
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._pending = self._pending, defaultdict(dict)
+            intents = [
+                ((user_id, post_id), intent)
+                for user_id, posts in self._flushing.items() for post_id, intent in posts.items()
+            ]
+            try:
+                for start in range(0, len(intents), self.batch_size):
+                    self._write(dict(intents[start:start + self.batch_size]))
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+    def _write(self, batch, attempts=3):
+        for attempt in range(1, attempts + 1):
+            close_old_connections()
+            try:
+                write_intents(batch)
+                return
+            except Exception:
+                if attempt == attempts:
+                    logger.exception("Dropped %d like intent(s)", len(batch))
+                else:
+                    time.sleep(self.interval * attempt)
+            finally:
+                close_old_connections()
+
+
+WRITERS = {
+    'direct': DirectWriter,
+    'buffered': BufferedWriter,
+}
+
+
+@lru_cache(maxsize=None)
+def get_writer():
+    return WRITERS[likes_setting('WRITE')]()
+
+
+@receiver(setting_changed)
+def _reset_writer(setting, **kwargs):
+    if setting == 'LIKES':
+        get_writer.cache_clear()
+
+
+def like(user_id, post_id, author_id):
+    """Like ``post_id`` as ``user_id``; ``True`` if it wasn't liked yet."""
+    return get_writer().like(user_id, post_id, author_id)
+
+
+def unlike(user_id, post_id):
+    """Take back ``user_id``'s like of ``post_id``; ``True`` if there was one."""
+    return get_writer().unlike(user_id, post_id)
+
+
+def pending(user_id):
+    """``{post_id: liked}`` for ``user_id``'s likes not written yet."""
+    return get_writer().pending(user_id)
+
+
+def liked_ids(user_id, post_ids):
+    """The subset of ``post_ids`` that ``user_id`` likes, including pending likes."""
+    intents = pending(user_id)
+    post_ids = set(post_ids)
+    stored = post_ids - intents.keys()
+    liked = {post_id for post_id in post_ids & intents.keys() if intents[post_id]}
+    if stored:
+        liked |= set(Like.objects.filter(user_id=user_id, post_id__in=stored).values_list('post_id', flat=True))
+    return liked
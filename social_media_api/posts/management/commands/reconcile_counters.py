@@ -0,0 +1,41 @@
+# posts/management/commands/reconcile_counters.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Q
+
+from posts.counters import COUNTERS
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized like/comment/follower/following/post counters that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows examined per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, counters in COUNTERS.items():
+            label = model._meta.label
+            last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+            fixed = 0
+            for start in range(0, last_pk + 1, batch_size):
+                with transaction.atomic():
+                    fixed += self.reconcile(model, counters, start, start + batch_size, options['dry_run'])
+            verb = "would fix" if options['dry_run'] else "fixed"
+            self.stdout.write(f"{label}: {verb} {fixed} row(s).")
+        self.stdout.write(self.style.SUCCESS("Counters reconciled."))
+
+    def reconcile(self, model, counters, start, stop, dry_run):
+        batch = model.objects.filter(pk__gte=start, pk__lt=stop).annotate(
+            **{f'true_{field}': total() for field, total in counters.items()}
+        )
+        drifted = Q()
+        for field in counters:
+            drifted |= ~Q(**{field: F(f'true_{field}')})
+        drifted_pks = list(batch.filter(drifted).values_list('pk', flat=True))
+        if drifted_pks and not dry_run:
+            model.objects.filter(pk__in=drifted_pks).update(
+                **{field: total() for field, total in counters.items()}
+            )
+        return len(drifted_pks)
@@ -0,0 +1,12 @@
+# posts/management/commands/trim_timelines.py
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = "Trim materialized home timelines that grew past TIMELINE['MAX_ENTRIES']."
+
+    def handle(self, *args, **options):
+        count = timeline.trim_oversized()
+        self.stdout.write(self.style.SUCCESS(f"Trimmed {count} timeline(s)."))
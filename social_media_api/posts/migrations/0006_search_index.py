@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# frozen copy of the index DDL, posts.search may change without breaking fresh migrations
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(content, '')), 'B')"
+)
+
+CREATE = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts "
+        "USING fts5(title, content, tokenize='unicode61 remove_diacritics 2')",
+        "INSERT INTO posts_post_fts (rowid, title, content) SELECT id, title, content FROM posts_post",
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS posts_post_search ("
+        "post_id bigint PRIMARY KEY REFERENCES posts_post (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        "document tsvector NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS posts_post_search_document_gin ON posts_post_search USING GIN (document)",
+        f"INSERT INTO posts_post_search (post_id, document) SELECT id, {POSTGRES_DOCUMENT} FROM posts_post",
+    ],
+}
+
+DROP = {
+    'sqlite': ["DROP TABLE IF EXISTS posts_post_fts"],
+    'postgresql': ["DROP TABLE IF EXISTS posts_post_search"],
+}
+
+
+def create_index(apps, schema_editor):
+    for statement in CREATE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    for statement in DROP.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,18 +1,74 @@
 # posts/models.py
 from django.db import models
+from django.db.models import Exists, Max, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Greatest
 from django.conf import settings
 from django.utils import timezone
 
+
+class PostQuerySet(models.QuerySet):
+    def for_listing(self, viewer=None, author=True, media=True, liked_by_me=True, comments=True):
+        """
+        Everything ``PostSerializer`` renders, in a constant number of queries:
+        the author, ``liked_by_me`` for ``viewer`` and the latest
+        ``POST_COMMENTS_PREVIEW`` comments per post (window-limited prefetch)
+        as ``latest_comments``. Like and comment counts are columns. Parts a
+        sparse fieldset leaves out can be switched off.
+        """
+        queryset = self
+        if author:
+            queryset = queryset.select_related('author__profile_picture_asset')
+        if media:
+            queryset = queryset.select_related('media_asset')
+        if liked_by_me:
+            if viewer is not None and viewer.is_authenticated:
+                queryset = queryset.annotate(liked_by_me=Exists(Like.objects.filter(post=OuterRef('pk'), user=viewer)))
+            else:
+                queryset = queryset.annotate(liked_by_me=Value(False))
+        if comments:
+            preview = Comment.objects.select_related('author__profile_picture_asset').order_by('-created_at', '-id')
+            queryset = queryset.prefetch_related(
+                Prefetch('comments', queryset=preview[:settings.POST_COMMENTS_PREVIEW], to_attr='latest_comments')
+            )
+        return queryset
+
+    def with_previews_modified(self):
+        """
+        Annotate ``previews_modified``: when a comment on the post or the
+        profile of its author last changed, for the list watermarks.
+        """
+        comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post')
+        return self.annotate(previews_modified=Subquery(
+            comments.annotate(modified=Max(Greatest('updated_at', 'author__updated_at'))).values('modified')
+        ))
+
+
 class Post(models.Model):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='posts')
     title = models.CharField(max_length=255, blank=True)
     content = models.TextField()
     media = models.FileField(upload_to='post_media/', blank=True, null=True)
+    # deduplicated original plus thumbnails, see uploads/
+    media_asset = models.ForeignKey(
+        'uploads.MediaAsset', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # denormalized, see posts/counters.py
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # keyset pagination on (created_at, id), see social_media_api.pagination
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+            # an author's posts newest first (profiles, ?author= listings, backfill)
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.author.username}: {self.content[:30]}"
@@ -27,6 +83,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='comment_created_id_idx'),
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.author.username} on {self.post.id}"
@@ -42,3 +102,28 @@ class Like(models.Model):
 
     def __str__(self):
         return f"{self.user.username} liked {self.post.id}"
+
+
+class TimelineEntry(models.Model):
+    """
+    Materialized home timeline row: ``post`` was fanned out to ``owner``.
+    ``author`` and ``created_at`` are copied from the post so evictions and
+    range reads never have to join back to ``posts_post``.
+    """
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at', '-post_id']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_recent_idx'),
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} in {self.owner_id}'s timeline"
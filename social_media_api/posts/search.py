@@ -0,0 +1,177 @@
+# posts/search.py
+"""
+Full-text search over post titles and content.
+
+Instead of ``LIKE '%term%'`` over the whole post table, posts are kept in an
+inverted index that lives next to ``posts_post``:
+
+* SQLite: an FTS5 virtual table ``posts_post_fts`` whose rowid is the post id.
+* PostgreSQL: ``posts_post_search`` holding a weighted ``tsvector`` per post
+  behind a GIN index.
+
+Other databases fall back to ``icontains``. The index is created by
+migration ``0006_search_index`` (which keeps its own copy of the DDL), kept in sync by ``posts.signals`` and can be
+rebuilt with ``manage.py rebuild_search_index``. Every search term is
+matched as a prefix, so ``?search=djan`` finds "Django".
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, Q, When
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+RANKED_LIMIT = 50
+
+
+def terms(query):
+    return TERM_RE.findall(query or '')[:16]
+
+
+class FallbackSearch:
+    """``icontains`` on databases without a supported full-text engine."""
+
+    def index(self, posts):
+        pass
+
+    def remove(self, post_ids):
+        pass
+
+    def rebuild(self, batch_size=1000):
+        return 0
+
+    def filter(self, queryset, query):
+        condition = Q()
+        for term in terms(query):
+            condition &= Q(title__icontains=term) | Q(content__icontains=term)
+        return queryset.filter(condition)
+
+    def ranked_ids(self, query, limit=RANKED_LIMIT):
+        return list(self.filter(Post.objects.order_by('-created_at', '-id'), query).values_list('pk', flat=True)[:limit])
+
+
+class SQLiteSearch(FallbackSearch):
+    table = 'posts_post_fts'
+
+    def index(self, posts):
+        rows = [(post.pk, post.title, post.content) for post in posts]
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(f"INSERT INTO {self.table} (rowid, title, content) VALUES (%s, %s, %s)", rows)
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(pk,) for pk in post_ids])
+
+    def rebuild(self, batch_size=1000):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+        total = 0
+        posts = Post.objects.order_by('pk').only('pk', 'title', 'content')
+        batch = []
+        for post in posts.iterator(chunk_size=batch_size):
+            batch.append(post)
+            if len(batch) == batch_size:
+                total += self._insert(batch)
+                batch = []
+        total += self._insert(batch)
+        return total
+
+    def _insert(self, posts):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, title, content) VALUES (%s, %s, %s)",
+                [(post.pk, post.title, post.content) for post in posts],
+            )
+        return len(posts)
+
+    def match(self, query):
+        # every term quoted (no FTS5 syntax injection) and prefix matched
+        return ' '.join(f'"{term}"*' for term in terms(query))
+
+    def filter(self, queryset, query):
+        if not terms(query):
+            return queryset
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [self.match(query)]
+        ))
+
+    def ranked_ids(self, query, limit=RANKED_LIMIT):
+        if not terms(query):
+            return []
+        with connection.cursor() as cursor:
+            # bm25() is lower-is-better; title matches weigh 10x content matches
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, 10.0, 1.0), rowid DESC LIMIT %s",
+                [self.match(query), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearch(FallbackSearch):
+    table = 'posts_post_search'
+    config = 'english'
+    document = "setweight(to_tsvector(%s::regconfig, coalesce({title}, '')), 'A') || setweight(to_tsvector(%s::regconfig, coalesce({content}, '')), 'B')"
+
+    def index(self, posts):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (post_id, document) VALUES (%s, "
+                + self.document.format(title='%s', content='%s')
+                + ") ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document",
+                [(post.pk, self.config, post.title, self.config, post.content) for post in posts],
+            )
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE post_id = ANY(%s)", [list(post_ids)])
+
+    def rebuild(self, batch_size=1000):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {self.table}")
+            cursor.execute(
+                f"INSERT INTO {self.table} (post_id, document) SELECT id, "
+                + self.document.format(title='title', content='content') + " FROM posts_post",
+                [self.config, self.config],
+            )
+            return cursor.rowcount
+
+    def tsquery(self, query):
+        return ' & '.join(f'{term}:*' for term in terms(query))
+
+    def filter(self, queryset, query):
+        if not terms(query):
+            return queryset
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT post_id FROM {self.table} WHERE document @@ to_tsquery(%s::regconfig, %s)",
+            [self.config, self.tsquery(query)],
+        ))
+
+    def ranked_ids(self, query, limit=RANKED_LIMIT):
+        if not terms(query):
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT post_id FROM {self.table}, to_tsquery(%s::regconfig, %s) query "
+                "WHERE document @@ query ORDER BY ts_rank(document, query) DESC, post_id DESC LIMIT %s",
+                [self.config, self.tsquery(query), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def backend_for(vendor):
+    return {'sqlite': SQLiteSearch, 'postgresql': PostgresSearch}.get(vendor, FallbackSearch)()
+
+
+def get_backend():
+    return backend_for(connection.vendor)
+
+
+def ranked(queryset, query, limit=RANKED_LIMIT):
+    """``queryset`` restricted to the best ``limit`` matches, best first."""
+    ids = get_backend().ranked_ids(query, limit)
+    order = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)])
+    return queryset.filter(pk__in=ids).order_by(order) if ids else queryset.none()
@@ -1,42 +1,111 @@
 # posts/serializers.py
+from django.conf import settings
+from django.db.models import F
 from rest_framework import serializers
 from .models import Post, Comment, Like
+from . import likes
 from django.contrib.auth import get_user_model
+from social_media_api.fieldsets import SparseFieldsetMixin
+from social_media_api.readpath import ReadPlan, top_per_group
+from uploads.serializers import MediaUrlsField, UploadedMediaField
 
 User = get_user_model()
 
 
-class SimpleUserSerializer(serializers.ModelSerializer):
+class SimpleUserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Lightweight serializer to avoid circular imports"""
+    avatar = MediaUrlsField(source='profile_picture_asset')
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'profile_picture']
+        fields = ['id', 'username', 'profile_picture', 'avatar']
+        expandable_fields = ['avatar']
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     author = SimpleUserSerializer(read_only=True)
 
     class Meta:
         model = Comment
         fields = ['id', 'post', 'author', 'content', 'created_at', 'updated_at']
         read_only_fields = ['author', 'created_at', 'updated_at']
+        expandable_fields = ['author']
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Reads the attributes added by ``Post.objects.for_listing()`` and only
+    falls back to querying for instances that did not come through it
+    (e.g. the response to a create).
+    """
     author = SimpleUserSerializer(read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
-    likes_count = serializers.SerializerMethodField()
+    comments = serializers.SerializerMethodField()
+    liked_by_me = serializers.SerializerMethodField()
+    media_asset = UploadedMediaField(required=False, allow_null=True)
+    media_urls = MediaUrlsField(source='media_asset')
 
     class Meta:
         model = Post
         fields = [
-            'id', 'author', 'title', 'content', 'media',
-            'created_at', 'updated_at', 'likes_count', 'comments'
+            'id', 'author', 'title', 'content', 'media', 'media_asset', 'media_urls',
+            'created_at', 'updated_at', 'likes_count', 'comments_count',
+            'liked_by_me', 'comments'
         ]
-        read_only_fields = ['author', 'created_at', 'updated_at']
+        read_only_fields = ['author', 'created_at', 'updated_at', 'likes_count', 'comments_count']
+        expandable_fields = ['author', 'media_urls', 'comments']
+
+    def get_liked_by_me(self, obj):
+        request = self.context.get('request')
+        if self.context.get('shared') or request is None or not request.user.is_authenticated:
+            # a shared representation (object cache) has no viewer, see PostViewSet.get_viewer_fields
+            return getattr(obj, 'liked_by_me', False)
+        if hasattr(obj, 'liked_by_me'):
+            # the viewer's likes still in the write-behind buffer, see posts.likes
+            return likes.pending(request.user.pk).get(obj.pk, obj.liked_by_me)
+        return obj.pk in likes.liked_ids(request.user.pk, [obj.pk])
+
+    def get_comments(self, obj):
+        """Latest ``POST_COMMENTS_PREVIEW`` comments, oldest first."""
+        latest = getattr(obj, 'latest_comments', None)
+        if latest is None:
+            latest = obj.comments.select_related('author').order_by('-created_at', '-id')[:settings.POST_COMMENTS_PREVIEW]
+        return CommentSerializer(
+            list(reversed(latest)), many=True, context=self.context, fieldset=self.nested_fieldset('comments')
+        ).data
+
+    # fast read path, see social_media_api.readpath
+
+    def plan_liked_by_me(self, plan):
+        # annotated by Post.objects.for_listing()
+        column = plan.column('liked_by_me')
+        request = self.context.get('request')
+        pending = likes.pending(request.user.pk) if request is not None and request.user.is_authenticated else {}
+        if not pending:
+            return lambda row: row[column]
+        post_id = plan.column('id')
+        return lambda row: pending.get(row[post_id], row[column])
+
+    def plan_comments(self, plan):
+        comments = ReadPlan(CommentSerializer(context=self.context, fieldset=self.nested_fieldset('comments')))
+        post_id = plan.column('id')
+        previews = {}
+
+        def fetch(rows):
+            previews.clear()
+            if not rows:
+                return
+            latest = top_per_group(
+                Comment.objects.filter(post_id__in=[row[post_id] for row in rows]),
+                'post_id', ['-created_at', '-id'], settings.POST_COMMENTS_PREVIEW,
+            ).values(*comments.columns, preview_of=F('post_id'))
+            latest = list(latest)
+            for comment, data in zip(latest, comments.render_many(latest)):
+                previews.setdefault(comment['preview_of'], []).append(data)
+            for group in previews.values():
+                group.reverse()
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()
+        plan.batch(fetch)
+        return lambda row: previews.get(row[post_id], [])
 
 
 class LikeSerializer(serializers.ModelSerializer):
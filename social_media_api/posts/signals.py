@@ -1,25 +1,143 @@
 # posts/signals.py
-from django.db.models.signals import post_save
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from .models import Like, Comment
-from notifications.utils import create_notification
+from .models import Post, Like, Comment
+from .counters import adjust
+from . import likes, search, timeline
+from notifications.utils import notify
+from social_media_api import object_cache
+
+User = get_user_model()
+
+
+def _post_going_away(instance, origin):
+    """Whether ``instance`` (a like or comment) is cascading from the deletion of its post."""
+    return instance.post_id in getattr(origin, '_deleting_post_ids', ())
+
 
 @receiver(post_save, sender=Like)
 def like_created(sender, instance, created, **kwargs):
-    if created and instance.post.author != instance.user:
-        create_notification(
-            recipient=instance.post.author,
-            actor=instance.user,
-            verb='liked your post',
-            target=instance.post
-        )
+    # the like endpoints bypass the ORM and call the same hooks, see posts/likes.py
+    if created:
+        likes.liked(instance.post_id, instance.post.author_id, instance.user_id)
+
 
 @receiver(post_save, sender=Comment)
 def comment_created(sender, instance, created, **kwargs):
-    if created and instance.post.author != instance.author:
-        create_notification(
-            recipient=instance.post.author,
-            actor=instance.author,
+    if created:
+        adjust(Post, instance.post_id, comments_count=1)
+    if created and instance.post.author_id != instance.author_id:
+        notify(
+            recipient_id=instance.post.author_id,
+            actor_id=instance.author_id,
             verb='commented on your post',
-            target=instance.post
+            post_id=instance.post_id,
+            comment_id=instance.pk
         )
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, **kwargs):
+    if not _post_going_away(instance, kwargs.get('origin')):
+        likes.unliked(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if not _post_going_away(instance, kwargs.get('origin')):
+        adjust(Post, instance.post_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, **kwargs):
+    search.get_backend().index([instance])
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        adjust(User, instance.author_id, posts_count=1)
+        # fan out once the post row is committed so timelines never point at a rolled back post
+        transaction.on_commit(lambda: timeline.fan_out(instance))
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, origin=None, **kwargs):
+    # sent before the cascade deletes anything; the mark lives on the object
+    # (or queryset) being deleted, so it is gone with it
+    if origin is not None:
+        if not hasattr(origin, '_deleting_post_ids'):
+            origin._deleting_post_ids = set()
+        origin._deleting_post_ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    adjust(User, instance.author_id, posts_count=-1)
+    search.get_backend().remove([instance.pk])
+    timeline.discard_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def post_activity_changed(sender, instance, **kwargs):
+    # counts and the comment preview are part of the cached post
+    if not _post_going_away(instance, kwargs.get('origin')):
+        object_cache.invalidate('post', instance.post_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    # the author's cached profile lists their latest posts
+    object_cache.invalidate('post', instance.pk)
+    object_cache.invalidate('user', instance.author_id)
+
+
+@receiver(m2m_changed, sender=User.following.through)
+def following_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Backfill timelines on follow and evict on unfollow."""
+    if action == 'pre_clear':
+        # pk_set is not provided for clear(), so record what is about to go
+        through = User.following.through
+        if reverse:
+            instance._cleared_follow_ids = set(
+                through.objects.filter(to_customuser=instance).values_list('from_customuser_id', flat=True)
+            )
+        else:
+            instance._cleared_follow_ids = set(
+                through.objects.filter(from_customuser=instance).values_list('to_customuser_id', flat=True)
+            )
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_follow_ids', set())
+        update = timeline.evict
+    elif action == 'post_add':
+        update = timeline.backfill
+    elif action == 'post_remove':
+        update = timeline.evict
+    else:
+        return
+    if not pk_set:
+        return
+    if reverse:
+        # instance is the followed user, pk_set are its (former) followers
+        for follower_id in pk_set:
+            update(follower_id, [instance.pk])
+    else:
+        update(instance.pk, pk_set)
+    if update is timeline.evict:
+        # an author falling below the celebrity threshold needs their posts fanned out
+        lost = {instance.pk: len(pk_set)} if reverse else dict.fromkeys(pk_set, 1)
+        transaction.on_commit(lambda: timeline.demoted(lost))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # the follow rows cascade without m2m_changed
+    followed = User.following.through.objects.filter(from_customuser=instance)
+    lost = dict.fromkeys(followed.values_list('to_customuser_id', flat=True), 1)
+    if lost:
+        transaction.on_commit(lambda: timeline.demoted(lost))
@@ -1,3 +1,623 @@
-from django.test import TestCase
+import datetime
+import decimal
+import threading
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from notifications.models import Notification
+from social_media_api.readpath import ReadPlan
+from social_media_api.renderers import FastJSONRenderer
+from social_media_api.testing import QueryBudgetMixin, QueryPlanMixin, ReadPathParityMixin
+from uploads.models import MediaAsset
+from .models import Comment, Like, Post, TimelineEntry
+from .serializers import PostSerializer
+from . import likes, search, timeline
+
+User = get_user_model()
+
+
+class HotPathIndexTests(QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.reader = User.objects.create_user('reader', password='pass')
+        cls.reader.following.add(cls.author)
+        cls.post = Post.objects.create(author=cls.author, title='Hello', content='World')
+
+    def test_feed_reads_the_timeline_index(self):
+        feed = timeline.home_timeline(self.reader).for_listing(self.reader)
+        self.assertUsesIndex(feed[:11], 'timeline_owner_recent_idx')
+
+    def test_profile_posts_read_the_author_index(self):
+        posts = Post.objects.filter(author=self.author).order_by('-created_at', '-id')
+        self.assertUsesIndex(posts[:11], 'post_author_created_idx')
+
+    def test_comment_list_reads_the_post_index(self):
+        comments = Comment.objects.filter(post=self.post).order_by('created_at', 'id')
+        self.assertUsesIndex(comments[:11], 'comment_post_created_id_idx')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class FastReadPathParityTests(ReadPathParityMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        asset = MediaAsset.objects.create(
+            file='uploads/ab/ab.png', sha256='ab' * 32, size=1, kind=MediaAsset.IMAGE, status=MediaAsset.READY,
+            variants={'thumbnail': {'name': 'uploads/variants/ab/ab_thumbnail.webp', 'width': 1, 'height': 1, 'size': 1}},
+        )
+        cls.author = User.objects.create_user('author', password='pass', profile_picture_asset=asset)
+        cls.reader = User.objects.create_user('reader', password='pass', profile_picture='profile_pics/r.png')
+        cls.reader.following.add(cls.author)
+        for i in range(14):
+            post = Post.objects.create(
+                author=cls.author if i % 3 else cls.reader, content='body\n\t',
+                title=f'#{i} "quoted" \\ ünïcode \u2028 {"x" * i}',
+                media='post_media/m.png' if i % 4 == 0 else None, media_asset=asset if i % 5 == 0 else None,
+            )
+            for j in range(i % 5):
+                Comment.objects.create(post=post, author=cls.reader if j % 2 else cls.author, content=f'c{j}')
+            if i % 2:
+                Like.objects.create(post=post, user=cls.reader)
+        timeline.rebuild(cls.reader.pk)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_post_serializer_has_a_read_plan(self):
+        # raises Unsupported if a field would silently send lists down the slow path
+        ReadPlan(PostSerializer())
+
+    def test_post_list(self):
+        for query in ['', '?page_size=4', '?ordering=created_at', '?search=quoted', '?author=1']:
+            with self.subTest(query=query):
+                self.assertSameAsSerializers(self.client, f'/api/posts/{query}')
+
+    def test_post_list_next_page(self):
+        next_page = self.client.get('/api/posts/?page_size=4').data['next']
+        self.assertSameAsSerializers(self.client, next_page)
+
+    def test_post_list_anonymous(self):
+        self.assertSameAsSerializers(APIClient(), '/api/posts/')
+
+    def test_feed(self):
+        self.assertSameAsSerializers(self.client, '/api/posts/feed/?page_size=20')
+
+    def test_sparse_fieldsets(self):
+        for query in [
+            '?fields=id,title', '?expand=', '?omit=comments,author.avatar',
+            '?fields=id,author.username,comments.author.avatar', '?fields=id&expand=comments.content',
+        ]:
+            with self.subTest(query=query):
+                self.assertSameAsSerializers(self.client, f'/api/posts/{query}')
+
+    def test_renderer_matches_drf(self):
+        data = {
+            'text': 'quote " backslash \\ \u2028 \u2029 \x00 \x1f \x7f é 😀', 'int': 2 ** 62, 'bool': True,
+            'none': None, 'when': datetime.datetime(2024, 1, 2, 3, 4, 5, 678, tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2024, 1, 2), 'amount': decimal.Decimal('1.10'), 'nested': [{'a': []}, {}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        huge = {'big': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(huge), JSONRenderer().render(huge))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_feed(self):
+        self.assertWithinBudget('feed')
+
+    def test_post_list(self):
+        self.assertWithinBudget('post-list')
+
+    def test_post_detail(self):
+        self.assertWithinBudget('post-detail')
+
+    def test_like_toggle(self):
+        # both directions: the seeded viewer may or may not like the post already
+        self.assertWithinBudget('like-toggle')
+        self.assertWithinBudget('like-toggle')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class MediaAssetAttachTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass')
+        cls.other = User.objects.create_user('other', password='pass')
+        cls.asset = MediaAsset.objects.create(file='uploads/cd/cd.png', sha256='cd' * 32, size=1, uploaded_by=cls.owner)
+        cls.asset.uploaders.add(cls.owner)
+
+    def create(self, user, asset_id):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post('/api/posts/', {'title': 't', 'content': 'c', 'media_asset': asset_id}, format='json')
+
+    def test_uploader_can_attach(self):
+        response = self.create(self.owner, self.asset.pk)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['media_asset'], self.asset.pk)
+
+    def test_someone_elses_asset_is_rejected(self):
+        response = self.create(self.other, self.asset.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('media_asset', response.data)
+
+    def test_existing_asset_survives_an_update_by_the_author(self):
+        post = Post.objects.create(author=self.other, title='t', content='c', media_asset=self.asset)
+        client = APIClient()
+        client.force_authenticate(self.other)
+        response = client.patch(f'/api/posts/{post.pk}/', {'media_asset': self.asset.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync', 'AGGREGATION_WINDOW': 0},
+    LIKES={'WRITE': 'buffered', 'FLUSH_INTERVAL': 3600, 'BATCH_SIZE': 2},
+)
+class BufferedLikeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.fans = [User.objects.create_user(f'fan{i}', password='pass') for i in range(5)]
+        cls.post = Post.objects.create(author=cls.author, title='Viral', content='c')
+
+    def setUp(self):
+        cache.clear()
+        self.writer = likes.get_writer()
+        # flushed explicitly from the test's thread instead of the write-behind thread
+        self.writer._worker = threading.current_thread()
+        self.addCleanup(self.writer.flush)
+
+    def flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.flush()
+        self.post.refresh_from_db()
+
+    def test_latest_intent_wins(self):
+        fan = self.fans[0]
+        self.assertTrue(likes.like(fan.pk, self.post.pk, self.author.pk))
+        self.assertTrue(likes.unlike(fan.pk, self.post.pk))
+        self.assertTrue(likes.like(fan.pk, self.post.pk, self.author.pk))
+        self.assertFalse(likes.like(fan.pk, self.post.pk, self.author.pk))
+        self.assertEqual(likes.pending(fan.pk), {self.post.pk: True})
+        self.flush()
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(Notification.objects.filter(post=self.post, verb='liked your post').count(), 1)
+        self.assertEqual(likes.pending(fan.pk), {})
+
+    def test_pending_likes_are_laid_over_liked_by_me(self):
+        fan = self.fans[0]
+        likes.like(fan.pk, self.post.pk, self.author.pk)
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(likes.liked_ids(fan.pk, [self.post.pk]), {self.post.pk})
+        client = APIClient()
+        client.force_authenticate(fan)
+        self.assertTrue(client.get(f'/api/posts/{self.post.pk}/').data['liked_by_me'])
+        self.assertTrue(client.get('/api/posts/').data['results'][0]['liked_by_me'])
+        likes.unlike(fan.pk, self.post.pk)
+        self.assertFalse(client.get(f'/api/posts/{self.post.pk}/').data['liked_by_me'])
+
+    def test_pending_likes_stay_out_of_the_shared_representation(self):
+        fan = self.fans[0]
+        likes.like(fan.pk, self.post.pk, self.author.pk)
+        client = APIClient()
+        client.force_authenticate(fan)
+        # the fan's request fills the object cache
+        self.assertTrue(client.get(f'/api/posts/{self.post.pk}/').data['liked_by_me'])
+        self.assertFalse(self.client.get(f'/api/posts/{self.post.pk}/').data['liked_by_me'])
+        client.force_authenticate(self.fans[1])
+        self.assertFalse(client.get(f'/api/posts/{self.post.pk}/').data['liked_by_me'])
+
+    def test_flush_writes_in_batches(self):
+        for fan in self.fans:
+            likes.like(fan.pk, self.post.pk, self.author.pk)
+        with mock.patch.object(likes, 'write_intents', wraps=likes.write_intents) as write:
+            self.flush()
+        self.assertEqual(write.call_count, 3)
+        self.assertEqual(self.post.likes_count, 5)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 5)
+
+    def test_failed_batch_is_retried(self):
+        likes.like(self.fans[0].pk, self.post.pk, self.author.pk)
+        write_intents = likes.write_intents
+        failures = [OperationalError('database is locked')]
+
+        def flaky(batch):
+            if failures:
+                raise failures.pop()
+            return write_intents(batch)
+
+        with mock.patch.object(likes, 'write_intents', side_effect=flaky), mock.patch('posts.likes.time.sleep'):
+            self.flush()
+        self.assertEqual(self.post.likes_count, 1)
+
+    def test_batch_is_dropped_after_the_last_attempt(self):
+        likes.like(self.fans[0].pk, self.post.pk, self.author.pk)
+        with mock.patch.object(likes, 'write_intents', side_effect=OperationalError('gone')), \
+                mock.patch('posts.likes.time.sleep'), self.assertLogs('posts.likes', 'ERROR'):
+            self.flush()
+        self.assertEqual(likes.pending(self.fans[0].pk), {})
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_intents_applied_elsewhere_do_not_move_the_counter_twice(self):
+        fan, other = self.fans[:2]
+        intent = {(fan.pk, self.post.pk): (True, self.author.pk)}
+        # a direct like, or another process's flush, got there first
+        with override_settings(LIKES={'WRITE': 'direct'}):
+            likes.like(fan.pk, self.post.pk, self.author.pk)
+        self.assertEqual(likes.write_intents(intent), (0, 0))
+        self.assertEqual(likes.write_intents({(other.pk, self.post.pk): (True, self.author.pk)}), (1, 0))
+        unlike = {(fan.pk, self.post.pk): (False, None)}
+        self.assertEqual(likes.write_intents(unlike), (0, 1))
+        self.assertEqual(likes.write_intents(unlike), (0, 0))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class EmbeddedAuthorCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.commenter = User.objects.create_user('commenter', password='pass')
+        cls.post = Post.objects.create(author=cls.author, title='t', content='c')
+        Comment.objects.create(post=cls.post, author=cls.commenter, content='hi')
+
+    def setUp(self):
+        cache.clear()
+
+    def rename(self, user, username):
+        user = User.objects.get(pk=user.pk)
+        user.username = username
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            user.save()
+        # the posts embedding the user are not looked up
+        self.assertFalse([query for query in queries if '"posts_post"' in query['sql'] or '"posts_comment"' in query['sql']])
+
+    def detail(self, query=''):
+        return self.client.get(f'/api/posts/{self.post.pk}/{query}')
+
+    def test_author_change_reaches_cached_posts(self):
+        etag = self.detail()['ETag']
+        self.rename(self.author, 'renamed')
+        response = self.detail()
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['author']['username'], 'renamed')
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.pk}/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_commenter_change_reaches_comment_previews(self):
+        for query in ['', '?fields=id,comments.author.username']:
+            with self.subTest(query=query):
+                self.detail(query)
+        self.rename(self.commenter, 'recommenter')
+        for query in ['', '?fields=id,comments.author.username']:
+            with self.subTest(query=query):
+                self.assertEqual(self.detail(query).data['comments'][0]['author']['username'], 'recommenter')
+
+    def test_wildcard_needs_an_existing_object(self):
+        for path, expected in [(f'/api/posts/{self.post.pk}/', 304), ('/api/posts/999/', 404), ('/api/users/nobody/', 404)]:
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH='*').status_code, expected)
+
+    def test_unrelated_change_keeps_the_etag(self):
+        etag = self.detail()['ETag']
+        self.detail()
+        self.rename(User.objects.create_user('bystander', password='pass'), 'bystander2')
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.pk}/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class ListETagTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.commenter = User.objects.create_user('commenter', password='pass')
+        cls.post = Post.objects.create(author=cls.author, title='t', content='c')
+        cls.comment = Comment.objects.create(post=cls.post, author=cls.commenter, content='hi')
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidate(self, change):
+        etag = self.client.get('/api/posts/')['ETag']
+        self.assertEqual(self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        return self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=etag)
+
+    def rename(self, user, username):
+        user.username = username
+        user.save()
+
+    def test_comment_edit_changes_the_etag(self):
+        self.comment.content = 'edited'
+        response = self.revalidate(self.comment.save)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['comments'][0]['content'], 'edited')
+
+    def test_author_and_commenter_changes_change_the_etag(self):
+        for user in [self.author, self.commenter]:
+            with self.subTest(user=user.username):
+                response = self.revalidate(lambda: self.rename(user, f'{user.username}2'))
+                self.assertEqual(response.status_code, 200)
+        post = response.data['results'][0]
+        self.assertEqual(post['author']['username'], 'author2')
+        self.assertEqual(post['comments'][0]['author']['username'], 'commenter2')
+
+    def test_unrelated_change_keeps_the_etag(self):
+        bystander = User.objects.create_user('bystander', password='pass')
+        self.assertEqual(self.revalidate(lambda: self.rename(bystander, 'bystander2')).status_code, 304)
+
+    def test_like_moving_between_posts_changes_the_etag(self):
+        other = Post.objects.create(author=self.author, title='o', content='c')
+        Like.objects.create(post=self.post, user=self.commenter)
+
+        def move():
+            Like.objects.get(post=self.post, user=self.commenter).delete()
+            Like.objects.create(post=other, user=self.author)
+
+        response = self.revalidate(move)
+        self.assertEqual(response.status_code, 200)
+        counts = {post['id']: post['likes_count'] for post in response.data['results']}
+        self.assertEqual(counts, {self.post.pk: 0, other.pk: 1})
+
+    def test_wildcard_is_not_honoured_for_lists(self):
+        self.assertEqual(self.client.get('/api/posts/', HTTP_IF_NONE_MATCH='*').status_code, 200)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class LikeEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.fan = User.objects.create_user('fan', password='pass')
+        cls.post = Post.objects.create(author=cls.author, title='t', content='c')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def like(self, method='put', pk=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(f'/api/posts/{pk or self.post.pk}/like/')
+
+    def likes_count(self):
+        self.post.refresh_from_db(fields=['likes_count'])
+        return self.post.likes_count
+
+    def test_routes_are_not_shadowed(self):
+        self.assertEqual(reverse('post-like', args=[1]), '/api/posts/1/like/')
+        self.assertEqual(reverse('post-like-toggle', args=[1]), '/api/posts/posts/1/like/')
+
+    def test_like_is_idempotent(self):
+        for method in ['put', 'post']:
+            with self.subTest(method=method):
+                Like.objects.filter(post=self.post).delete()
+                self.assertEqual(self.like(method).status_code, 201)
+                response = self.like(method)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.data['liked_by_me'])
+                self.assertEqual(Like.objects.filter(post=self.post, user=self.fan).count(), 1)
+                self.assertEqual(self.likes_count(), 1)
+
+    def test_unlike_is_idempotent(self):
+        self.like()
+        for method, url in [('delete', 'like'), ('delete', 'like'), ('post', 'unlike')]:
+            with self.subTest(method=method, url=url):
+                response = getattr(self.client, method)(f'/api/posts/{self.post.pk}/{url}/')
+                self.assertEqual(response.status_code, 204)
+                self.assertEqual(self.likes_count(), 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_missing_post(self):
+        self.assertEqual(self.like(pk=self.post.pk + 100).status_code, 404)
+        self.assertEqual(self.like('delete', pk=self.post.pk + 100).status_code, 404)
+
+    def test_liking_again_does_not_notify_again(self):
+        self.like()
+        self.like('delete')
+        self.like()
+        self.like()
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual((notification.actor, notification.actor_count), (self.fan, 1))
+
+    def test_own_like_does_not_notify(self):
+        self.client.force_authenticate(self.author)
+        self.like()
+        self.assertFalse(Notification.objects.exists())
+
+    def test_legacy_toggle(self):
+        url = reverse('post-like-toggle', args=[self.post.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url).data['detail'], 'liked')
+            self.assertEqual(self.client.post(url).data['detail'], 'unliked')
+        self.assertEqual(self.likes_count(), 0)
+
+    def test_liked_ids(self):
+        other = Post.objects.create(author=self.author, title='o', content='c')
+        self.like()
+        response = self.client.get('/api/posts/liked/', {'ids': f'{self.post.pk},{other.pk}, {other.pk}'})
+        self.assertEqual(response.data['liked_by_me'], {str(self.post.pk): True, str(other.pk): False})
+        self.assertEqual(self.client.get('/api/posts/liked/').data['liked_by_me'], {})
+        for ids in ['1,x', ','.join(map(str, range(102)))]:
+            with self.subTest(ids=ids[:10]):
+                self.assertEqual(self.client.get('/api/posts/liked/', {'ids': ids}).status_code, 400)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/posts/liked/', {'ids': '1'}).status_code, 401)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class CascadeCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.fans = [User.objects.create_user(f'fan{n}', password='pass') for n in range(3)]
+        cls.post = Post.objects.create(author=cls.author, title='t', content='c')
+        cls.other = Post.objects.create(author=cls.author, title='o', content='c')
+        for fan in cls.fans:
+            for post in [cls.post, cls.other]:
+                Like.objects.create(post=post, user=fan)
+                Comment.objects.create(post=post, author=fan, content='hi')
+
+    def test_deleted_post_skips_its_likes_and_comments(self):
+        for delete in [self.post.delete, Post.objects.filter(pk=self.other.pk).delete]:
+            with self.subTest(delete=delete), CaptureQueriesContext(connection) as queries:
+                delete()
+            self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "posts_post"')])
+
+    def test_counters_of_surviving_posts_still_move(self):
+        self.fans[0].delete()
+        Comment.objects.filter(post=self.post).first().delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (2, 1))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass')
+        cls.titled = Post.objects.create(author=cls.author, title='Django tips', content='Short notes')
+        cls.mentioned = Post.objects.create(author=cls.author, title='Notes', content='Written with Django')
+
+    def found(self, query):
+        return set(search.get_backend().filter(Post.objects.all(), query).values_list('pk', flat=True))
+
+    def test_terms_are_prefix_matched_and_anded(self):
+        self.assertEqual(self.found('djan'), {self.titled.pk, self.mentioned.pk})
+        self.assertEqual(self.found('djan writ'), {self.mentioned.pk})
+        self.assertEqual(self.found('"djan" OR*'), set())
+        response = self.client.get('/api/posts/', {'search': 'tip'})
+        self.assertEqual([post['id'] for post in response.data['results']], [self.titled.pk])
+
+    def test_title_matches_rank_first(self):
+        ranked = search.ranked(Post.objects.all(), 'django')
+        self.assertEqual([post.pk for post in ranked], [self.titled.pk, self.mentioned.pk])
+        self.assertFalse(search.ranked(Post.objects.all(), '').exists())
+
+    def test_index_follows_saves_and_deletes(self):
+        self.titled.title = 'Flask tips'
+        self.titled.save()
+        self.assertEqual(self.found('django'), {self.mentioned.pk})
+        self.assertEqual(self.found('flask'), {self.titled.pk})
+        self.mentioned.delete()
+        self.assertEqual(self.found('notes'), {self.titled.pk})
+
+    def test_rebuild_command(self):
+        # rows written without signals are not indexed until the rebuild
+        Post.objects.bulk_create([Post(author=self.author, title='Bulk django', content='c')])
+        self.assertEqual(len(self.found('bulk')), 0)
+        out = StringIO()
+        call_command('rebuild_search_index', '--batch-size', '2', stdout=out)
+        self.assertIn('Indexed 3 post(s) with SQLiteSearch.', out.getvalue())
+        self.assertEqual(len(self.found('bulk')), 1)
+        self.assertEqual(len(self.found('django')), 3)
+
+    def test_search_action_clamps_the_limit(self):
+        Post.objects.bulk_create([Post(author=self.author, title=f'Django {n}', content='c') for n in range(55)])
+        call_command('rebuild_search_index', stdout=StringIO())
+        for limit, expected in [('0', 1), ('2', 2), ('500', search.RANKED_LIMIT), ('x', 20), (None, 20)]:
+            with self.subTest(limit=limit):
+                params = {'q': 'django'} if limit is None else {'q': 'django', 'limit': limit}
+                self.assertEqual(len(self.client.get('/api/posts/search/', params).data), expected)
+
+
+@override_settings(NOTIFICATIONS={'DELIVERY': 'sync'}, TIMELINE={'CELEBRITY_FOLLOWER_THRESHOLD': 2})
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.star, cls.reader, cls.other = [
+            User.objects.create_user(name, password='pass') for name in ['author', 'star', 'reader', 'other']
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def feed(self, user):
+        return list(timeline.home_timeline(user).values_list('pk', flat=True))
+
+    def post(self, author, title='t'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(author=author, title=title, content='c')
+
+    def change(self, function, *args):
+        with self.captureOnCommitCallbacks(execute=True):
+            function(*args)
+
+    def test_posts_are_fanned_out_to_followers(self):
+        self.change(self.reader.following.add, self.author)
+        post = self.post(self.author)
+        owners = TimelineEntry.objects.filter(post=post).values_list('owner_id', flat=True)
+        self.assertEqual(list(owners), [self.reader.pk])
+        self.assertEqual(self.feed(self.reader), [post.pk])
+        self.assertEqual(self.feed(self.other), [])
+
+    def test_follow_backfills_and_unfollow_evicts(self):
+        older = self.post(self.author, 'older')
+        newer = self.post(self.author, 'newer')
+        self.change(self.reader.following.add, self.author)
+        self.assertEqual(self.feed(self.reader), [newer.pk, older.pk])
+        self.change(self.reader.following.remove, self.author)
+        self.assertEqual(self.feed(self.reader), [])
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.reader).exists())
+
+    def test_celebrity_posts_are_merged_in_at_read_time(self):
+        for fan in [self.reader, self.other]:
+            self.change(fan.following.add, self.star)
+        post = self.post(self.star)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(self.feed(self.reader), [post.pk])
+
+    def test_demoted_celebrity_posts_stay_in_feeds(self):
+        for fan in [self.reader, self.other]:
+            self.change(fan.following.add, self.star)
+        post = self.post(self.star)
+        unfollows = [('unfollow', lambda: self.other.following.remove(self.star)), ('delete', self.other.delete)]
+        for how, unfollow in unfollows:
+            with self.subTest(how=how):
+                TimelineEntry.objects.filter(post=post).delete()
+                self.change(self.other.following.add, self.star)
+                self.change(unfollow)
+                self.assertEqual(self.feed(self.reader), [post.pk])
+
+    def test_rebuild_drops_authors_no_longer_followed(self):
+        stale = self.post(self.author)
+        kept = self.post(self.other)
+        TimelineEntry.objects.create(owner=self.reader, post=stale, author=self.author, created_at=stale.created_at)
+        self.reader.following.add(self.other)
+        timeline.rebuild(self.reader.pk)
+        self.assertEqual(self.feed(self.reader), [kept.pk])
+
+
+@override_settings(NOTIFICATIONS={'DELIVERY': 'sync'}, TIMELINE={'MAX_ENTRIES': 3})
+class TimelineTrimTests(TestCase):
+    def test_oversized_timelines_are_trimmed_to_the_newest_entries(self):
+        author = User.objects.create_user('author', password='pass')
+        busy, quiet = [User.objects.create_user(name, password='pass') for name in ['busy', 'quiet']]
+        busy.following.add(author)
+        with self.captureOnCommitCallbacks(execute=True):
+            posts = [Post.objects.create(author=author, title=f't{n}', content='c') for n in range(5)]
+        TimelineEntry.objects.create(owner=quiet, post=posts[0], author=author, created_at=posts[0].created_at)
+        self.assertEqual(TimelineEntry.objects.filter(owner=busy).count(), 5)
+        out = StringIO()
+        call_command('trim_timelines', stdout=out)
+        self.assertIn('Trimmed 1 timeline(s).', out.getvalue())
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(owner=busy).values_list('post_id', flat=True)),
+            {post.pk for post in posts[2:]},
+        )
+        self.assertEqual(TimelineEntry.objects.filter(owner=quiet).count(), 1)
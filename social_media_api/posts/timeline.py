@@ -0,0 +1,327 @@
+# posts/timeline.py
+"""
+Fan-out-on-write home timelines.
+
+When a post is created it is pushed into the materialized timeline of every
+follower of its author, so a feed page is a range read over the owner's
+timeline instead of an IN-subquery plus sort over every followed author's
+posts. Authors followed by at least ``CELEBRITY_FOLLOWER_THRESHOLD`` users
+are never fanned out; their posts are merged in when the feed is read
+(hybrid fan-out-on-read), which bounds write amplification per post. An
+author who drops back below the threshold has their recent posts fanned out
+then (``demoted()``), or the posts only merged in at read time would vanish
+from their followers' feeds.
+
+Database timelines are not trimmed while fanning out, that would mean
+counting every follower's timeline on each post. ``manage.py
+trim_timelines`` (run it periodically, e.g. hourly from cron) cuts every
+timeline that grew past ``MAX_ENTRIES`` back down.
+
+Settings (all optional) live in ``settings.TIMELINE``::
+
+    TIMELINE = {
+        'BACKEND': 'posts.timeline.DatabaseTimelineBackend',
+        'MAX_ENTRIES': 800,
+        'CELEBRITY_FOLLOWER_THRESHOLD': 10000,
+        'BATCH_SIZE': 1000,
+    }
+"""
+import threading
+from functools import lru_cache
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Post, TimelineEntry
+from notifications import realtime
+from users import graph
+
+User = get_user_model()
+Follow = User.following.through
+
+DEFAULTS = {
+    'BACKEND': 'posts.timeline.DatabaseTimelineBackend',
+    'MAX_ENTRIES': 800,
+    'CELEBRITY_FOLLOWER_THRESHOLD': 10000,
+    'BATCH_SIZE': 1000,
+}
+
+
+def timeline_setting(name):
+    return getattr(settings, 'TIMELINE', {}).get(name, DEFAULTS[name])
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class BaseTimelineBackend:
+    """
+    Storage for materialized timelines. Entries are ``(post_id, author_id,
+    created_at)`` tuples; every timeline is kept newest first and trimmed
+    to about ``MAX_ENTRIES``.
+    """
+
+    def push(self, owner_ids, entries):
+        raise NotImplementedError
+
+    def evict(self, owner_id, author_ids):
+        raise NotImplementedError
+
+    def clear(self, owner_id):
+        raise NotImplementedError
+
+    def discard_post(self, post_id):
+        raise NotImplementedError
+
+    def restrict(self, queryset, owner_id):
+        """
+        Narrow a ``Post`` queryset to the posts in ``owner_id``'s timeline,
+        annotated with the ``feed_at``/``feed_id`` sort key.
+        """
+        raise NotImplementedError
+
+    def restrict_q(self, owner_id):
+        """Same as ``restrict`` but as a ``Q`` object that can be OR-ed."""
+        raise NotImplementedError
+
+
+class DatabaseTimelineBackend(BaseTimelineBackend):
+    """Timelines stored in the ``TimelineEntry`` table."""
+
+    def push(self, owner_ids, entries):
+        rows = [
+            TimelineEntry(owner_id=owner_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for owner_id in owner_ids
+            for post_id, author_id, created_at in entries
+        ]
+        TimelineEntry.objects.bulk_create(
+            rows, ignore_conflicts=True, batch_size=timeline_setting('BATCH_SIZE')
+        )
+
+    def trim(self, owner_ids):
+        """Delete entries past ``MAX_ENTRIES`` for the given owners."""
+        ranked = TimelineEntry.objects.filter(owner_id__in=owner_ids).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=[F('owner_id')],
+                order_by=[F('created_at').desc(), F('post_id').desc()],
+            )
+        )
+        stale = list(ranked.filter(position__gt=timeline_setting('MAX_ENTRIES')).values_list('pk', flat=True))
+        for batch in _batched(stale, timeline_setting('BATCH_SIZE')):
+            TimelineEntry.objects.filter(pk__in=batch).delete()
+
+    def oversized(self):
+        """Owners whose timeline holds more than ``MAX_ENTRIES`` entries."""
+        return (
+            TimelineEntry.objects.values('owner_id')
+            .annotate(entries=Count('pk'))
+            .filter(entries__gt=timeline_setting('MAX_ENTRIES'))
+            .values_list('owner_id', flat=True)
+        )
+
+    def evict(self, owner_id, author_ids):
+        TimelineEntry.objects.filter(owner_id=owner_id, author_id__in=author_ids).delete()
+
+    def clear(self, owner_id):
+        TimelineEntry.objects.filter(owner_id=owner_id).delete()
+
+    def discard_post(self, post_id):
+        # Rows go away with the post through ON DELETE CASCADE.
+        pass
+
+    def restrict(self, queryset, owner_id):
+        # sorting on the entry's own columns lets timeline_owner_recent_idx
+        # serve the ORDER BY as well as the filter
+        return queryset.filter(timeline_entries__owner_id=owner_id).annotate(
+            feed_at=F('timeline_entries__created_at'), feed_id=F('timeline_entries__post_id'),
+        )
+
+    def restrict_q(self, owner_id):
+        return Q(pk__in=TimelineEntry.objects.filter(owner_id=owner_id).values('post_id'))
+
+
+class InMemoryTimelineBackend(BaseTimelineBackend):
+    """
+    Process-local stand-in with Redis sorted-set semantics (ZADD, ZREVRANGE,
+    ZREMRANGEBYRANK). Useful for development and tests; timelines are lost
+    on restart and not shared between workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timelines = {}
+
+    def push(self, owner_ids, entries):
+        depth = timeline_setting('MAX_ENTRIES')
+        scored = [((created_at.timestamp(), post_id), author_id) for post_id, author_id, created_at in entries]
+        with self._lock:
+            for owner_id in owner_ids:
+                timeline = self._timelines.setdefault(owner_id, {})
+                timeline.update(scored)
+                if len(timeline) > depth:
+                    keep = sorted(timeline, reverse=True)[:depth]
+                    self._timelines[owner_id] = {score: timeline[score] for score in keep}
+
+    def evict(self, owner_id, author_ids):
+        author_ids = set(author_ids)
+        with self._lock:
+            timeline = self._timelines.get(owner_id, {})
+            for score in [s for s, author_id in timeline.items() if author_id in author_ids]:
+                del timeline[score]
+
+    def clear(self, owner_id):
+        with self._lock:
+            self._timelines.pop(owner_id, None)
+
+    def discard_post(self, post_id):
+        with self._lock:
+            for timeline in self._timelines.values():
+                for score in [s for s in timeline if s[1] == post_id]:
+                    del timeline[score]
+
+    def post_ids(self, owner_id):
+        with self._lock:
+            return [post_id for _, post_id in sorted(self._timelines.get(owner_id, {}), reverse=True)]
+
+    def restrict(self, queryset, owner_id):
+        return queryset.filter(self.restrict_q(owner_id)).annotate(feed_at=F('created_at'), feed_id=F('id'))
+
+    def restrict_q(self, owner_id):
+        return Q(pk__in=self.post_ids(owner_id))
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(timeline_setting('BACKEND'))()
+
+
+@receiver(setting_changed)
+def _reset_backend(setting, **kwargs):
+    if setting == 'TIMELINE':
+        get_backend.cache_clear()
+
+
+def celebrity_ids(user_ids):
+    """Subset of ``user_ids`` whose posts are merged in at read time."""
+    return set(
+        User.objects.filter(
+            pk__in=user_ids,
+            followers_count__gte=timeline_setting('CELEBRITY_FOLLOWER_THRESHOLD'),
+        ).values_list('pk', flat=True)
+    )
+
+
+def is_celebrity(user_id):
+    return bool(celebrity_ids([user_id]))
+
+
+def fan_out(post):
+    """Push a freshly created post into every follower's timeline."""
+    if is_celebrity(post.author_id):
+        # followers are subscribed to the author channel instead
+        realtime.publish_feed_post(post)
+        return
+    backend = get_backend()
+    entry = (post.pk, post.author_id, post.created_at)
+    follower_ids = Follow.objects.filter(to_customuser_id=post.author_id).values_list('from_customuser_id', flat=True)
+    for owner_ids in _batched(follower_ids.iterator(), timeline_setting('BATCH_SIZE')):
+        backend.push(owner_ids, [entry])
+        realtime.publish_feed_post(post, owner_ids)
+
+
+def _recent_entries(author_ids):
+    return list(
+        Post.objects.filter(author_id__in=author_ids)
+        .order_by('-created_at', '-id')
+        .values_list('pk', 'author_id', 'created_at')[:timeline_setting('MAX_ENTRIES')]
+    )
+
+
+def demoted(lost):
+    """
+    Fan out the recent posts of authors who just fell below
+    ``CELEBRITY_FOLLOWER_THRESHOLD``. ``lost`` maps author ids to how many
+    followers they lost; call it once ``followers_count`` is up to date.
+    """
+    threshold = timeline_setting('CELEBRITY_FOLLOWER_THRESHOLD')
+    counts = User.objects.filter(pk__in=lost).values_list('pk', 'followers_count')
+    backend = get_backend()
+    for author_id, followers in counts:
+        if not followers < threshold <= followers + lost[author_id]:
+            continue
+        entries = _recent_entries([author_id])
+        follower_ids = Follow.objects.filter(to_customuser_id=author_id).values_list('from_customuser_id', flat=True)
+        for owner_ids in _batched(follower_ids.iterator(), timeline_setting('BATCH_SIZE')):
+            backend.push(owner_ids, entries)
+            if isinstance(backend, DatabaseTimelineBackend):
+                backend.trim(owner_ids)
+
+
+def backfill(owner_id, author_ids):
+    """Copy the most recent posts of newly followed authors into a timeline."""
+    author_ids = set(author_ids) - celebrity_ids(author_ids)
+    if not author_ids:
+        return
+    backend = get_backend()
+    entries = _recent_entries(author_ids)
+    if not entries:
+        return
+    backend.push([owner_id], entries)
+    if isinstance(backend, DatabaseTimelineBackend):
+        backend.trim([owner_id])
+
+
+def trim_oversized():
+    """Trim every database timeline that grew past ``MAX_ENTRIES``, returns how many were trimmed."""
+    backend = get_backend()
+    if not isinstance(backend, DatabaseTimelineBackend):
+        # the in-memory backend trims on push
+        return 0
+    owner_ids = list(backend.oversized())
+    for batch in _batched(owner_ids, timeline_setting('BATCH_SIZE')):
+        backend.trim(batch)
+    return len(owner_ids)
+
+
+def evict(owner_id, author_ids):
+    """Remove unfollowed authors' posts from a timeline."""
+    get_backend().evict(owner_id, author_ids)
+
+
+def discard_post(post_id):
+    get_backend().discard_post(post_id)
+
+
+def rebuild(owner_id):
+    """Rebuild one user's timeline from scratch out of their follow list."""
+    author_ids = list(Follow.objects.filter(from_customuser_id=owner_id).values_list('to_customuser_id', flat=True))
+    # entries of authors no longer followed go too
+    get_backend().clear(owner_id)
+    backfill(owner_id, author_ids)
+
+
+def home_timeline(user):
+    """
+    ``Post`` queryset for ``user``'s feed, newest first on ``(feed_at,
+    feed_id)``. Fanned-out posts come from the materialized timeline; posts
+    by followed celebrities are read directly from ``posts_post``.
+    """
+    backend = get_backend()
+    followed_celebrities = celebrity_ids(graph.following_ids(user.pk))
+    if followed_celebrities:
+        queryset = Post.objects.filter(
+            backend.restrict_q(user.pk) | Q(author_id__in=followed_celebrities)
+        ).annotate(feed_at=F('created_at'), feed_id=F('id'))
+    else:
+        queryset = backend.restrict(Post.objects.all(), user.pk)
+    return queryset.order_by('-feed_at', '-feed_id')
@@ -4,11 +4,12 @@ from rest_framework.routers import DefaultRouter
 from .views import PostViewSet, CommentViewSet, FeedView, LikeToggleView
 
 router = DefaultRouter()
-router.register(r'', PostViewSet, basename='post')
+# comments first, otherwise the post detail route swallows 'comments/'
 router.register(r'comments', CommentViewSet, basename='comments')
+router.register(r'', PostViewSet, basename='post')
 
 urlpatterns = [
-    path('', include(router.urls)),
     path('feed/', FeedView.as_view(), name='feed'),
-    path('posts/<int:pk>/like/', LikeToggleView.as_view(), name='post-like'),
+    path('posts/<int:pk>/like/', LikeToggleView.as_view(), name='post-like-toggle'),
+    path('', include(router.urls)),
 ]
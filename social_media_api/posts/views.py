@@ -3,69 +3,205 @@ from rest_framework import viewsets, filters, generics, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
-from .models import Post, Comment, Like
+from .models import Post, Comment
 from .serializers import PostSerializer, CommentSerializer, LikeSerializer
 from .permissions import IsAuthorOrReadOnly
-from notifications.utils import create_notification
+from social_media_api import object_cache
+from social_media_api.conditional import ConditionalListMixin
+from social_media_api.fieldsets import SparseFieldsetViewMixin
+from social_media_api.object_cache import CachedRetrieveMixin
+from social_media_api.readpath import FastListMixin
+from social_media_api.pagination import CommentCursorPagination, FeedCursorPagination, PostCursorPagination
+from . import likes, search, timeline
+from .filters import PostSearchFilter
+from uploads.handlers import StreamingUploadMixin
+from uploads.ingest import ingest
 
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all().select_related('author')
+LIKED_IDS_LIMIT = 100
+
+
+class PostListingMixin(SparseFieldsetViewMixin):
+    def get_listing_options(self):
+        """``Post.objects.for_listing()`` switches for the requested fields."""
+        return {
+            'author': self.renders('author'),
+            'media': self.renders('media_urls'),
+            'liked_by_me': self.renders('liked_by_me'),
+            'comments': self.renders('comments'),
+        }
+
+    def get_watermarks(self):
+        watermarks = super().get_watermarks()
+        # a like still in the write-behind buffer hasn't moved the counters yet
+        pending = likes.pending(self.request.user.pk) if self.request.user.is_authenticated else {}
+        if pending:
+            watermarks['pending_likes'] = sorted(pending.items())
+        return watermarks
+
+
+class PostViewSet(StreamingUploadMixin, PostListingMixin, CachedRetrieveMixin, ConditionalListMixin, FastListMixin,
+                  viewsets.ModelViewSet):
+    queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'content']
+    filter_backends = [PostSearchFilter, filters.OrderingFilter]
     ordering_fields = ['created_at']
+    pagination_class = PostCursorPagination
+    object_cache_label = 'post'
+    # the counters and what the rows embed: comment previews and author profiles
+    watermark_fields = ('likes_count', 'comments_count', 'author__updated_at', 'previews_modified')
+
+    def get_queryset(self):
+        return super().get_queryset().for_listing(self.request.user, **self.get_listing_options())
+
+    def get_watermark_queryset(self):
+        return self.filter_queryset(Post.objects.with_previews_modified())
+
+    def get_cached_representation(self, pk):
+        # shared by every viewer, liked_by_me is laid over it per request
+        post = get_object_or_404(Post.objects.for_listing(**self.get_listing_options()), pk=pk)
+        # the embedded authors, a profile change moves their 'author' version (users.signals)
+        authors = {post.author_id, *(comment.author_id for comment in getattr(post, 'latest_comments', []))}
+        object_cache.depend_on(
+            'post', pk, [('author', author_id) for author_id in authors], self.get_representation_variant()
+        )
+        # serialized without the viewer, liked_by_me is only added by get_viewer_fields
+        return self.get_serializer(post, context={**self.get_serializer_context(), 'shared': True}).data
+
+    def get_viewer_fields(self, pk):
+        if not self.request.user.is_authenticated or not self.renders('liked_by_me'):
+            return {}
+        return {'liked_by_me': pk in likes.liked_ids(self.request.user.pk, [pk])}
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        serializer.save(author=self.request.user, **self.ingest_media(serializer))
+
+    def perform_update(self, serializer):
+        serializer.save(**self.ingest_media(serializer))
+
+    def ingest_media(self, serializer):
+        """Store a ``media`` file uploaded with the post as a deduplicated asset."""
+        upload = serializer.validated_data.get('media')
+        if not upload:
+            return {}
+        asset, _ = ingest(upload, self.request.user)
+        return {'media': asset.file.name, 'media_asset': asset}
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Best matches for ``?q=`` ranked by relevance (at most ``limit``, 50)."""
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), search.RANKED_LIMIT)
+        except ValueError:
+            limit = 20
+        posts = search.ranked(self.get_queryset(), request.query_params.get('q', ''), limit)
+        return Response(self.get_serializer(posts, many=True).data)
 
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all().select_related('author', 'post')
+    @staticmethod
+    def post_id(pk):
+        # the like actions skip get_object(), which would load the whole post
+        try:
+            return int(pk)
+        except ValueError:
+            raise Http404
+
+    @action(detail=True, methods=['put', 'post', 'delete'], permission_classes=[IsAuthenticated])
+    def like(self, request, pk=None):
+        """Idempotent: ``PUT``/``POST`` likes the post, ``DELETE`` takes the like back."""
+        if request.method == 'DELETE':
+            return self.unlike(request, pk)
+        pk = self.post_id(pk)
+        author_id = Post.objects.filter(pk=pk).values_list('author_id', flat=True).first()
+        if author_id is None:
+            raise Http404
+        with transaction.atomic():
+            created = likes.like(request.user.pk, pk, author_id)
+        return Response(
+            {'detail': 'liked', 'liked_by_me': True},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def unlike(self, request, pk=None):
+        pk = self.post_id(pk)
+        if not likes.unlike(request.user.pk, pk) and not Post.objects.filter(pk=pk).exists():
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def liked(self, request):
+        """``liked_by_me`` for ``?ids=1,2,3`` (at most ``LIKED_IDS_LIMIT``), for clients rendering cached posts."""
+        try:
+            ids = {int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()}
+        except ValueError:
+            return Response({'ids': ['A comma separated list of post ids is required.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > LIKED_IDS_LIMIT:
+            return Response({'ids': [f'At most {LIKED_IDS_LIMIT} ids are allowed.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        liked = likes.liked_ids(request.user.pk, ids) if ids else set()
+        return Response({'liked_by_me': {str(pk): pk in liked for pk in sorted(ids)}})
+
+
+class CommentViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
+    queryset = Comment.objects.all().select_related('post')
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
+    pagination_class = CommentCursorPagination
+    filterset_fields = ['post']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.renders('author'):
+            queryset = queryset.select_related('author__profile_picture_asset')
+        return queryset
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        comment = serializer.save(author=self.request.user)
-        # create notification for the post author if they're not the commenter
-        if comment.post.author != self.request.user:
-            create_notification(
-                recipient=comment.post.author,
-                actor=self.request.user,
-                verb='commented on your post',
-                target=comment.post
-            )
-
-
-class FeedView(generics.ListAPIView):
+        # the post author is notified and comments_count bumped by posts.signals
+        serializer.save(author=self.request.user)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
+
+class FeedView(PostListingMixin, ConditionalListMixin, FastListMixin, generics.ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = FeedCursorPagination
+    watermark_fields = PostViewSet.watermark_fields
+
+    def get_timeline(self):
+        # the page and its watermarks read the same timeline, look up followed celebrities once
+        if not hasattr(self, '_timeline'):
+            self._timeline = timeline.home_timeline(self.request.user)
+        return self._timeline
 
     def get_queryset(self):
-        user = self.request.user
-        following_users = user.following.all()
-        return Post.objects.filter(author__in=following_users).order_by('-created_at')
+        # materialized timeline read, see posts.timeline
+        return self.get_timeline().for_listing(self.request.user, **self.get_listing_options())
+
+    def get_watermark_queryset(self):
+        return self.filter_queryset(self.get_timeline().with_previews_modified())
 
 
 class LikeToggleView(generics.GenericAPIView):
     serializer_class = LikeSerializer
     permission_classes = [IsAuthenticated]
 
+    @transaction.atomic
     def post(self, request, pk):
-        post = get_object_or_404(Post, pk=pk)
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
-        if created:
-            # create notification
-            if post.author != request.user:
-                create_notification(
-                    recipient=post.author,
-                    actor=request.user,
-                    verb='liked your post',
-                    target=post
-                )
-            return Response({'detail': 'liked'}, status=status.HTTP_201_CREATED)
-        else:
-            like.delete()
+        # kept for older clients; prefer the idempotent PUT/DELETE /api/posts/<pk>/like/
+        if likes.unlike(request.user.pk, pk):
             return Response({'detail': 'unliked'}, status=status.HTTP_200_OK)
+        author_id = Post.objects.filter(pk=pk).values_list('author_id', flat=True).first()
+        if author_id is None:
+            raise Http404
+        likes.like(request.user.pk, pk, author_id)
+        return Response({'detail': 'liked'}, status=status.HTTP_201_CREATED)
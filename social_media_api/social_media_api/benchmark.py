@@ -0,0 +1,84 @@
+# social_media_api/benchmark.py
+"""
+The hot endpoints and how many queries each may cost.
+
+``ENDPOINTS`` builds one request per endpoint for a set of ``Subjects``.
+``manage.py benchmark_endpoints`` times these requests against a seeded
+database (``manage.py seed_social_graph``). The apps' query-budget tests
+(``social_media_api.testing.QueryBudgetMixin``) replay them on a small seeded
+graph and fail if a request takes more than ``QUERY_BUDGETS`` queries with
+a cold cache. Raise a budget only together with the change that needs it.
+"""
+import time
+from dataclasses import dataclass
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from posts.models import Post
+
+User = get_user_model()
+
+ENDPOINTS = {
+    'feed': lambda subjects: ('get', reverse('feed')),
+    'post-list': lambda subjects: ('get', reverse('post-list')),
+    'post-detail': lambda subjects: ('get', reverse('post-detail', args=[subjects.post.pk])),
+    'user-detail': lambda subjects: ('get', reverse('user-detail', args=[subjects.profile.username])),
+    'like-toggle': lambda subjects: ('post', reverse('post-like-toggle', args=[subjects.post.pk])),
+    'notifications': lambda subjects: ('get', reverse('notifications-list')),
+}
+
+# queries per request with a cold cache, including authentication
+QUERY_BUDGETS = {
+    # user, timeline watermarks, page, comment previews, follow graph, followed celebrities
+    'feed': 6,
+    # user, watermarks, page, comment previews
+    'post-list': 4,
+    # user, liked_by_me, post, comment previews
+    'post-detail': 4,
+    # user, username lookup, follow graph, user, recent posts
+    'user-detail': 5,
+    # user, unlike, author lookup and like with its counter update, savepoint and release
+    'like-toggle': 7,
+    # user, watermarks, page, recent actors
+    'notifications': 4,
+}
+
+
+@dataclass
+class Subjects:
+    viewer: User
+    post: Post
+    profile: User
+
+    @classmethod
+    def pick(cls):
+        """The heaviest cases: the user following the most accounts, the most liked post, the most followed user."""
+        users = User.objects.filter(is_active=True)
+        return cls(
+            viewer=users.order_by('-following_count', 'pk').first(),
+            post=Post.objects.order_by('-likes_count', 'pk').first(),
+            profile=users.order_by('-followers_count', 'pk').first(),
+        )
+
+
+def client_for(user):
+    """An API client sending ``user``'s access token, so authentication is part of what is measured."""
+    from users.views import CustomTokenObtainPairSerializer
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {CustomTokenObtainPairSerializer.get_token(user).access_token}')
+    return client
+
+
+def measure(client, name, subjects):
+    """``(response, seconds, queries)`` for one request to ``name``."""
+    method, path = ENDPOINTS[name](subjects)
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = getattr(client, method)(path, secure=True)
+        elapsed = time.perf_counter() - started
+    return response, elapsed, queries
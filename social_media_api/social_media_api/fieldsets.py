@@ -0,0 +1,127 @@
+# social_media_api/fieldsets.py
+"""
+Sparse fieldsets for read endpoints: ``?fields=``, ``?omit=`` and ``?expand=``.
+
+``fields=id,title,author.username`` keeps only the listed fields; dotted
+names reach into nested serializers. ``omit=comments,author.avatar`` drops
+fields. A serializer's ``Meta.expandable_fields`` are its embedded
+relations (authors, comment previews, recent posts, ...): they are rendered
+by default, but as soon as ``fields`` or ``expand`` is given only the ones
+named there are, so ``?expand=`` alone strips every embedding and
+``?fields=id,title&expand=author`` adds one back.
+
+Fields are pruned before anything is serialized, so method fields that are
+left out never run their queries, and views ask ``renders()`` before adding
+joins and prefetches to their querysets. The selection only applies to
+``GET``; writes always accept and return the full shape.
+"""
+import hashlib
+import json
+
+from rest_framework import serializers
+
+
+def _tree(value):
+    """``'a,b.c'`` -> ``{'a': {}, 'b': {'c': {}}}``."""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class Fieldset:
+    """A parsed selection; ``fields`` and ``expand`` are ``None`` when not given."""
+
+    def __init__(self, fields=None, omit=None, expand=None):
+        self.fields = fields
+        self.omit = omit or {}
+        self.expand = expand
+
+    @classmethod
+    def from_query_params(cls, params):
+        if not any(name in params for name in ('fields', 'omit', 'expand')):
+            return None
+        fieldset = cls(
+            _tree(params['fields']) if 'fields' in params else None,
+            _tree(params.get('omit', '')),
+            _tree(params['expand']) if 'expand' in params else None,
+        )
+        return fieldset or None
+
+    def __bool__(self):
+        return self.fields is not None or bool(self.omit) or self.expand is not None
+
+    def allows(self, name, expandable=False):
+        if self.omit.get(name) == {}:
+            return False
+        if expandable and (self.fields is not None or self.expand is not None):
+            return name in (self.fields or {}) or name in (self.expand or {})
+        return self.fields is None or name in self.fields
+
+    def child(self, name):
+        """The selection inside the nested field ``name``, ``None`` for all of it."""
+        fields = self.fields.get(name) if self.fields is not None else None
+        expand = self.expand.get(name) if self.expand is not None else None
+        # a bare 'author' in fields/expand means the whole author
+        return Fieldset(fields or None, self.omit.get(name), expand or None) or None
+
+    def key(self):
+        state = json.dumps([self.fields, self.omit, self.expand], sort_keys=True)
+        return hashlib.md5(state.encode(), usedforsecurity=False).hexdigest()
+
+
+class SparseFieldsetMixin:
+    """Serializer side: prunes ``fields`` to the ``fieldset`` it was given."""
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        self.fieldset = fieldset
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.fieldset is None:
+            return fields
+        expandable = getattr(self.Meta, 'expandable_fields', ())
+        for name in list(fields):
+            if not self.fieldset.allows(name, name in expandable):
+                del fields[name]
+                continue
+            nested = fields[name]
+            if isinstance(nested, serializers.ListSerializer):
+                nested = nested.child
+            if isinstance(nested, SparseFieldsetMixin):
+                nested.fieldset = self.fieldset.child(name)
+        return fields
+
+    def nested_fieldset(self, name):
+        """For serializers built inside method fields."""
+        return self.fieldset.child(name) if self.fieldset is not None else None
+
+
+class SparseFieldsetViewMixin:
+    """View side: reads the selection from the query string on ``GET``."""
+
+    def get_fieldset(self):
+        if self.request is None or self.request.method not in ('GET', 'HEAD'):
+            return None
+        return Fieldset.from_query_params(self.request.query_params)
+
+    def renders(self, name):
+        """Whether the top-level field ``name`` is part of the response."""
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return True
+        expandable = getattr(self.get_serializer_class().Meta, 'expandable_fields', ())
+        return fieldset.allows(name, name in expandable)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fieldset', self.get_fieldset())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_representation_variant(self):
+        # one cached representation per shape, see social_media_api.object_cache
+        fieldset = self.get_fieldset()
+        return f':{fieldset.key()}' if fieldset is not None else ''
@@ -0,0 +1,268 @@
+# social_media_api/instrumentation.py
+"""
+Per-request timing and SQL instrumentation.
+
+``InstrumentationMiddleware`` wraps every database connection with
+``connection.execute_wrapper()`` for the duration of a request and splits
+the request's time into
+
+``db``
+    time spent in SQL (``N queries`` in the description),
+``view``
+    the view's own code without SQL, for API views mostly serialization,
+``render``
+    turning the response data into bytes,
+``total``
+    everything, including the other middleware.
+
+They are sent as a ``Server-Timing`` header, so browser dev tools and
+load-balancer logs show where a slow ``/api/posts/feed/`` spent its time.
+Queries whose SQL (with ``IN`` lists collapsed) repeats
+``DUPLICATE_QUERY_THRESHOLD`` times in one request are reported as likely
+N+1 patterns. Requests slower than ``SLOW_REQUEST_MS`` and N+1 patterns are
+logged to the ``social_media_api.instrumentation`` logger (see ``LOGGING``).
+
+Every request also feeds per-endpoint histograms (``PostViewSet.list``,
+``FeedView``, ...) that staff users can scrape in the Prometheus text format
+from ``/api/metrics/``. The numbers are per process.
+
+Settings (all optional) live in ``settings.INSTRUMENTATION``::
+
+    INSTRUMENTATION = {
+        'SERVER_TIMING': True,
+        'SLOW_REQUEST_MS': 500,
+        'DUPLICATE_QUERY_THRESHOLD': 3,
+    }
+"""
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SERVER_TIMING': True,
+    'SLOW_REQUEST_MS': 500,
+    'DUPLICATE_QUERY_THRESHOLD': 3,
+}
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def instrumentation_setting(name):
+    return getattr(settings, 'INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+def endpoint_name(request):
+    """``FeedView``, ``PostViewSet.list``, ... for the view that handled ``request``."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view = match.func
+    cls = getattr(view, 'cls', None) or getattr(view, 'view_class', None)
+    if cls is None:
+        return getattr(view, '__name__', match.view_name)
+    actions = getattr(view, 'actions', None)
+    if actions and request.method.lower() in actions:
+        return f'{cls.__name__}.{actions[request.method.lower()]}'
+    return cls.__name__
+
+
+def fingerprint(sql):
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class RequestStats:
+    """What one request did, filled in by the middleware and the execute wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = self.view_finished = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.view_db_time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if self.view_started is not None and self.view_finished is None:
+                self.view_db_time += elapsed
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        threshold = instrumentation_setting('DUPLICATE_QUERY_THRESHOLD')
+        return {sql: count for sql, count in self.fingerprints.items() if count >= threshold}
+
+    def timings(self, finished):
+        """``{phase: seconds}`` of the finished request."""
+        timings = {'db': self.db_time}
+        if self.view_started is not None:
+            view_finished = self.view_finished or finished
+            timings['view'] = max(view_finished - self.view_started - self.view_db_time, 0.0)
+            if self.view_finished is not None:
+                timings['render'] = finished - self.view_finished
+        timings['total'] = finished - self.started
+        return timings
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Per-endpoint histograms and counters, rendered in the Prometheus text format."""
+
+    HISTOGRAMS = {
+        'api_request_duration_seconds': ("Time to answer a request.", SECONDS_BUCKETS),
+        'api_request_db_seconds': ("Time spent in SQL per request.", SECONDS_BUCKETS),
+        'api_request_view_seconds': ("Time spent in view code (serialization) without SQL per request.", SECONDS_BUCKETS),
+        'api_request_render_seconds': ("Time spent rendering the response per request.", SECONDS_BUCKETS),
+        'api_request_queries': ("SQL queries per request.", QUERY_BUCKETS),
+    }
+    COUNTERS = {
+        'api_requests_total': "Requests answered.",
+        'api_request_duplicate_queries_total': "Requests that repeated a query at least DUPLICATE_QUERY_THRESHOLD times.",
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {name: {} for name in self.HISTOGRAMS}
+        self.counters = {name: Counter() for name in self.COUNTERS}
+
+    def record(self, endpoint, method, status, timings, queries, duplicates):
+        labels = (('endpoint', endpoint), ('method', method))
+        observed = {
+            'api_request_duration_seconds': timings['total'],
+            'api_request_db_seconds': timings['db'],
+            'api_request_view_seconds': timings.get('view'),
+            'api_request_render_seconds': timings.get('render'),
+            'api_request_queries': queries,
+        }
+        with self._lock:
+            for name, value in observed.items():
+                if value is None:
+                    continue
+                histogram = self.histograms[name].get(labels)
+                if histogram is None:
+                    histogram = self.histograms[name][labels] = Histogram(self.HISTOGRAMS[name][1])
+                histogram.observe(value)
+            self.counters['api_requests_total'][(*labels, ('status', str(status)))] += 1
+            if duplicates:
+                self.counters['api_request_duplicate_queries_total'][labels] += 1
+
+    def reset(self):
+        with self._lock:
+            self.__init__()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, _) in self.HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+            for name, help_text in self.COUNTERS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for labels, count in sorted(self.counters[name].items()):
+                    lines.append(f'{name}{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+REGISTRY = Registry()
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = request._instrumentation = RequestStats()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(stats))
+            response = self.get_response(request)
+        finished = time.perf_counter()
+        timings = stats.timings(finished)
+        duplicates = stats.duplicates()
+        endpoint = endpoint_name(request)
+        REGISTRY.record(endpoint, request.method, response.status_code, timings, stats.queries, duplicates)
+        if instrumentation_setting('SERVER_TIMING'):
+            response['Server-Timing'] = server_timing(timings, stats.queries)
+        self.log(request, endpoint, response, timings, stats.queries, duplicates)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._instrumentation.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF's Response is rendered after this hook, everything until here was the view
+        request._instrumentation.view_finished = time.perf_counter()
+        return response
+
+    def log(self, request, endpoint, response, timings, queries, duplicates):
+        total_ms = timings['total'] * 1000
+        if total_ms >= instrumentation_setting('SLOW_REQUEST_MS'):
+            logger.warning(
+                "Slow request %s %s (%s) %d: %.0f ms, %d queries in %.0f ms, view %.0f ms, render %.0f ms",
+                request.method, request.path, endpoint, response.status_code, total_ms, queries,
+                timings['db'] * 1000, timings.get('view', 0) * 1000, timings.get('render', 0) * 1000,
+            )
+        for sql, count in duplicates.items():
+            logger.warning("Possible N+1 in %s %s (%s): %d x %s", request.method, request.path, endpoint, count, sql[:300])
+
+
+def server_timing(timings, queries):
+    descriptions = {'db': f'{queries} queries', 'view': 'view without SQL', 'render': 'render', 'total': 'total'}
+    return ', '.join(
+        f'{phase};dur={seconds * 1000:.1f};desc="{descriptions[phase]}"' for phase, seconds in timings.items()
+    )
+
+
+class MetricsView(APIView):
+    """This process's per-endpoint metrics in the Prometheus text format, for staff only."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
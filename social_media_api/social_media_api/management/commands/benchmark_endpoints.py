@@ -0,0 +1,68 @@
+# social_media_api/management/commands/benchmark_endpoints.py
+import statistics
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from social_media_api.benchmark import ENDPOINTS, QUERY_BUDGETS, Subjects, client_for, measure
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Latency percentiles and query counts of the hot endpoints (feed, post list/detail, user detail, "
+        "like toggle, notifications), best run against a database filled by seed_social_graph."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*', help=f"Any of {', '.join(ENDPOINTS)} (default: all).")
+        parser.add_argument('--requests', type=int, default=100, help="Requests per endpoint.")
+        parser.add_argument('--cold', action='store_true', help="Clear the cache before every request.")
+
+    def handle(self, *args, **options):
+        unknown = set(options['endpoints']) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}.")
+        subjects = Subjects.pick()
+        if None in (subjects.viewer, subjects.post, subjects.profile):
+            raise CommandError("Nothing to benchmark, run seed_social_graph first.")
+        self.stdout.write(
+            f"viewer {subjects.viewer.username} (follows {subjects.viewer.following_count}), "
+            f"post {subjects.post.pk} ({subjects.post.likes_count} likes), "
+            f"profile {subjects.profile.username} ({subjects.profile.followers_count} followers)"
+        )
+        self.stdout.write(f"{'endpoint':<14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>9} {'budget':>7}")
+        over = []
+        # the test client's host, requests are sent as https so SECURE_SSL_REDIRECT doesn't apply
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            client = client_for(subjects.viewer)
+            for name in options['endpoints'] or ENDPOINTS:
+                timings, counts = [], []
+                cache.clear()
+                for _ in range(options['requests']):
+                    if options['cold']:
+                        cache.clear()
+                    response, elapsed, queries = measure(client, name, subjects)
+                    if response.status_code >= 400:
+                        raise CommandError(f"{name} answered {response.status_code}.")
+                    timings.append(elapsed * 1000)
+                    counts.append(len(queries))
+                # the first request runs with a cold cache, the budgets are for that case
+                if counts[0] > QUERY_BUDGETS[name]:
+                    over.append(name)
+                self.stdout.write(
+                    f"{name:<14} {statistics.median(timings):>8.1f} {percentile(timings, 0.95):>8.1f} "
+                    f"{percentile(timings, 0.99):>8.1f} {counts[0]:>4}/{statistics.median(counts):<4g} "
+                    f"{QUERY_BUDGETS[name]:>7}"
+                )
+        self.stdout.write("queries: first request (cold cache) / median")
+        if over:
+            self.stdout.write(self.style.WARNING(f"Over budget: {', '.join(over)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("All endpoints within their query budgets."))
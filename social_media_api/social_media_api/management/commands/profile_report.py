@@ -0,0 +1,82 @@
+# social_media_api/management/commands/profile_report.py
+import io
+import pstats
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from social_media_api.profiling import profile_dir, profiles
+
+# index of a function's own and cumulative time in pstats' stats tuples
+COLUMNS = {'tottime': 2, 'cumulative': 3}
+
+
+def load(endpoint):
+    """``(stats, profiles)`` aggregated over all stored profiles of ``endpoint``."""
+    paths = [str(path) for _, path in profiles(endpoint)]
+    if not paths:
+        raise CommandError(f"No profiles of {endpoint}.")
+    return pstats.Stats(*paths), len(paths)
+
+
+def per_request_ms(stats, count, column):
+    """``{function: ms per request}`` for ``column`` ('tottime' or 'cumulative')."""
+    index = COLUMNS[column]
+    return {pstats.func_std_string(func): row[index] * 1000 / count for func, row in stats.stats.items()}
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarize the stored request profiles: without arguments the profiled endpoints, with one endpoint "
+        "its hottest functions over all its profiles, with two and --diff the functions whose time per "
+        "request differs most between them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*', help="Endpoint names such as FeedView or PostViewSet.list.")
+        parser.add_argument('--diff', action='store_true', help="Compare two endpoints.")
+        parser.add_argument('--sort', choices=sorted(COLUMNS), default='cumulative', help="Time to rank functions by.")
+        parser.add_argument('--limit', type=int, default=25, help="Functions to show.")
+
+    def handle(self, *args, **options):
+        endpoints = options['endpoints']
+        if options['diff']:
+            if len(endpoints) != 2:
+                raise CommandError("--diff needs exactly two endpoints.")
+            self.diff(*endpoints, options['sort'], options['limit'])
+        elif endpoints:
+            for endpoint in endpoints:
+                self.show(endpoint, options['sort'], options['limit'])
+        else:
+            self.summary()
+
+    def summary(self):
+        counts = Counter(endpoint for endpoint, _ in profiles())
+        if not counts:
+            self.stdout.write(f"No profiles in {profile_dir()}.")
+            return
+        self.stdout.write(f"{'endpoint':<40} {'profiles':>8} {'ms/request':>11}")
+        for endpoint in sorted(counts):
+            stats, count = load(endpoint)
+            self.stdout.write(f"{endpoint:<40} {count:>8} {stats.total_tt * 1000 / count:>11.1f}")
+
+    def show(self, endpoint, sort, limit):
+        stats, count = load(endpoint)
+        self.stdout.write(f"{endpoint}: {count} profiles, {stats.total_tt * 1000 / count:.1f} ms per request")
+        # pstats prints piece by piece, OutputWrapper would end every piece with a newline
+        stats.stream = io.StringIO()
+        stats.sort_stats(sort).print_stats(limit)
+        self.stdout.write(stats.stream.getvalue())
+
+    def diff(self, first, second, sort, limit):
+        (a, a_count), (b, b_count) = load(first), load(second)
+        a_ms, b_ms = per_request_ms(a, a_count, sort), per_request_ms(b, b_count, sort)
+        self.stdout.write(
+            f"{sort} ms per request, {first} ({a_count} profiles, {a.total_tt * 1000 / a_count:.1f} ms) "
+            f"vs {second} ({b_count} profiles, {b.total_tt * 1000 / b_count:.1f} ms)"
+        )
+        self.stdout.write(f"{first[:12]:>12} {second[:12]:>12} {'delta':>9}  function")
+        functions = sorted(a_ms.keys() | b_ms.keys(), key=lambda f: abs(b_ms.get(f, 0) - a_ms.get(f, 0)), reverse=True)
+        for function in functions[:limit]:
+            before, after = a_ms.get(function, 0), b_ms.get(function, 0)
+            self.stdout.write(f"{before:>12.2f} {after:>12.2f} {after - before:>+9.2f}  {function}")
@@ -0,0 +1,12 @@
+# social_media_api/management/commands/profile_token.py
+from django.core.management.base import BaseCommand
+
+from social_media_api.profiling import make_token, profiling_setting
+
+
+class Command(BaseCommand):
+    help = "Print an X-Profile header value that makes the API profile a request (see social_media_api/profiling.py)."
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
+        self.stderr.write(f"Valid for {profiling_setting('TOKEN_MAX_AGE')} seconds.")
@@ -0,0 +1,210 @@
+# social_media_api/object_cache.py
+"""
+Versioned cache of serialized objects for the hot public detail endpoints.
+
+Every cached object has a version number in the cache under
+``objcache:<label>:<pk>:version``; its representation is stored under a key
+that includes the version, and the version doubles as the ETag. Invalidating
+an object just moves its version forward (on transaction commit, so a reader
+can never cache pre-commit data under the new version); the old
+representation is never read again and expires after ``TIMEOUT``.
+
+A version that was evicted is re-seeded from the clock rather than
+restarting at 1, so an ETag handed out earlier can never match different
+content. On a miss only one request per object recomputes the
+representation (``cache.add`` lock); the others wait up to
+``LOCK_TIMEOUT`` seconds for its result instead of stampeding the database.
+
+Signals in ``posts.signals`` and ``users.signals`` call ``invalidate()``.
+
+A representation that embeds other objects (a post embeds its author and
+the authors of its comment previews) records them with ``depend_on()``.
+Their versions are folded into the object's version
+(``object_version()``), so bumping one ``author`` version invalidates
+every post that embeds that author without listing the posts.
+
+Settings (all optional) live in ``settings.OBJECT_CACHE``::
+
+    OBJECT_CACHE = {
+        'TIMEOUT': 300,
+        'VERSION_TIMEOUT': 86400,
+        'LOCK_TIMEOUT': 5,
+        'POLL_INTERVAL': 0.05,
+    }
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+DEFAULTS = {
+    'TIMEOUT': 300,
+    'VERSION_TIMEOUT': 24 * 60 * 60,
+    'LOCK_TIMEOUT': 5,
+    'POLL_INTERVAL': 0.05,
+}
+
+
+def cache_setting(name):
+    return getattr(settings, 'OBJECT_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def _key(label, pk, suffix):
+    return f'objcache:{label}:{pk}:{suffix}'
+
+
+def version(label, pk):
+    key = _key(label, pk, 'version')
+    current = cache.get(key)
+    if current is None:
+        cache.add(key, time.time_ns(), cache_setting('VERSION_TIMEOUT'))
+        current = cache.get(key)
+    return current
+
+
+def depend_on(label, pk, dependencies, variant=''):
+    """Record the ``(label, pk)`` objects embedded in the representation of ``pk``."""
+    cache.set(_key(label, pk, f'deps{variant}'), sorted(set(dependencies)), cache_setting('VERSION_TIMEOUT'))
+
+
+def object_version(label, pk, variant=''):
+    """
+    ``version()`` combined with the versions of the objects that
+    ``depend_on()`` recorded for this representation ``variant``.
+    """
+    own_key, deps_key = _key(label, pk, 'version'), _key(label, pk, f'deps{variant}')
+    found = cache.get_many([own_key, deps_key])
+    own = found.get(own_key) or version(label, pk)
+    dependencies = found.get(deps_key)
+    if not dependencies:
+        return own
+    keys = [_key(dep_label, dep_pk, 'version') for dep_label, dep_pk in dependencies]
+    found = cache.get_many(keys)
+    versions = [found.get(key) or version(*dependency) for key, dependency in zip(keys, dependencies)]
+    return f"{own}.{hashlib.md5(' '.join(map(str, versions)).encode()).hexdigest()[:12]}"
+
+
+def invalidate(label, pks):
+    """Move the given objects to a new version once the transaction commits."""
+    if isinstance(pks, int):
+        pks = [pks]
+    keys = [_key(label, pk, 'version') for pk in set(pks)]
+    if keys:
+        transaction.on_commit(
+            lambda: cache.set_many({key: time.time_ns() for key in keys}, cache_setting('VERSION_TIMEOUT'))
+        )
+
+
+def lookup(label, field, value, queryset):
+    """Primary key of the object whose ``field`` is ``value``, cached."""
+    key = _key(label, f'{field}={value}', 'pk')
+    pk = cache.get(key)
+    if pk is None:
+        pk = queryset.filter(**{field: value}).values_list('pk', flat=True).first()
+        if pk is None:
+            raise Http404
+        cache.set(key, pk, cache_setting('TIMEOUT'))
+    return pk
+
+
+def forget_lookup(label, field, value):
+    cache.delete(_key(label, f'{field}={value}', 'pk'))
+
+
+def get_or_compute(label, pk, object_version, compute):
+    """The cached representation for ``object_version``, computing it at most once."""
+    key = _key(label, pk, object_version)
+    data = cache.get(key)
+    if data is not None:
+        return data
+    lock = key + ':lock'
+    lock_timeout = cache_setting('LOCK_TIMEOUT')
+    if cache.add(lock, 1, lock_timeout):
+        try:
+            data = compute()
+            cache.set(key, data, cache_setting('TIMEOUT'))
+            return data
+        finally:
+            cache.delete(lock)
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(cache_setting('POLL_INTERVAL'))
+        data = cache.get(key)
+        if data is not None:
+            return data
+        if cache.get(lock) is None:
+            # the holder failed (e.g. 404), don't wait for a result that won't come
+            break
+    return compute()
+
+
+class CachedRetrieveMixin:
+    """
+    ``retrieve()`` from the object cache, with ``ETag`` and
+    ``If-None-Match`` support. The cached representation is shared by all
+    viewers; ``get_viewer_fields()`` lays per-viewer values over it.
+    """
+    object_cache_label = None
+
+    def get_cached_pk(self):
+        try:
+            return int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+
+    def get_cached_representation(self, pk):
+        instance = get_object_or_404(self.get_queryset(), pk=pk)
+        self.check_object_permissions(self.request, instance)
+        return self.get_serializer(instance).data
+
+    def get_viewer_fields(self, pk):
+        return {}
+
+    def get_representation_variant(self):
+        """Suffix for requests that render a different shape of the object."""
+        return ''
+
+    def get_etag(self, pk, current, viewer_fields):
+        return quote_etag('-'.join(str(part) for part in [self.object_cache_label, pk, current, *viewer_fields.values()]))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.get_cached_pk()
+        label = self.object_cache_label
+        variant = self.get_representation_variant()
+        current = f'{object_version(label, pk, variant)}{variant}'
+        viewer_fields = self.get_viewer_fields(pk)
+        matches = parse_etags(request.headers.get('If-None-Match', ''))
+        etag = self.get_etag(pk, current, viewer_fields)
+        if etag in matches:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            computed = []
+
+            def compute():
+                computed.append(True)
+                return self.get_cached_representation(pk)
+
+            # resolved first, a missing object is a 404 even for If-None-Match: *
+            data = get_or_compute(label, pk, current, compute)
+            if computed:
+                # dependencies recorded while computing can change the version, keep it under the final one
+                final = f'{object_version(label, pk, variant)}{variant}'
+                if final != current:
+                    cache.set(_key(label, pk, final), data, cache_setting('TIMEOUT'))
+                    etag = self.get_etag(pk, final, viewer_fields)
+            if '*' in matches:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                # viewer fields the requested shape leaves out stay out
+                response = Response({**data, **{name: value for name, value in viewer_fields.items() if name in data}})
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Authorization'])
+        return response
@@ -0,0 +1,187 @@
+# social_media_api/pagination.py
+"""
+Keyset (cursor) pagination.
+
+Pages are located by seeking past the last row of the previous page on a
+``(key, id)`` pair instead of ``OFFSET N``, and no ``COUNT(*)`` is issued,
+so every page costs O(page size) no matter how far the client scrolled and
+pages do not shift when new rows arrive.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over ``ordering = (key, tie_breaker)``. Both fields
+    must be ordered in the same direction and the pair must be unique; a
+    composite index on it makes each page a single index range scan.
+    Ordering on annotations needs their field types in ``key_fields`` so
+    cursors can be decoded.
+    """
+    ordering = ('-created_at', '-id')
+    key_fields = {}
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        # one extra row tells us whether there is another page, no COUNT(*)
+        rows = list(self.get_window(queryset, request, view))
+        position, reverse = self.decode_cursor(request)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = rows
+        return rows
+
+    def get_window(self, queryset, request, view=None):
+        """
+        The unevaluated slice of ``queryset`` (page size + 1 rows) that the
+        request's page is read from.
+        """
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        ordering = self.get_ordering(request, view)
+        position, reverse = self.decode_cursor(request)
+        if reverse:
+            ordering = tuple(self._flip(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._seek(ordering, position))
+        return queryset[:self.page_size + 1]
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+                if size > 0:
+                    return min(size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, request, view):
+        """
+        The paginator's own ordering, flipped when an ``OrderingFilter`` on
+        the view asked for the key field in the opposite direction.
+        """
+        ordering = self.ordering
+        key = ordering[0].lstrip('-')
+        if view is not None and OrderingFilter in getattr(view, 'filter_backends', ()):
+            param = request.query_params.get(api_settings.ORDERING_PARAM, '').strip()
+            if param.lstrip('-') == key and param != ordering[0]:
+                ordering = tuple(self._flip(field) for field in ordering)
+        return ordering
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def _seek(ordering, position):
+        """``(key, id) < (k, i)`` for descending order, ``>`` for ascending."""
+        (key, tie), (key_value, tie_value) = ordering, position
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        key, tie = key.lstrip('-'), tie.lstrip('-')
+        return Q(**{f'{key}__{lookup}': key_value}) | Q(**{key: key_value, f'{tie}__{lookup}': tie_value})
+
+    def _position(self, row):
+        # model instances, or dicts from the fast read path
+        if isinstance(row, dict):
+            return [row[field.lstrip('-')] for field in self.ordering]
+        return [getattr(row, field.lstrip('-')) for field in self.ordering]
+
+    def _key_field(self, name):
+        if name in self.key_fields:
+            return self.key_fields[name]
+        return self.model._meta.get_field(name)
+
+    def encode_cursor(self, position, reverse):
+        payload = {'p': [str(value) for value in position]}
+        if reverse:
+            payload['r'] = 1
+        token = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode()))
+            fields = [self._key_field(field.lstrip('-')) for field in self.ordering]
+            position = tuple(field.to_python(value) for field, value in zip(fields, payload['p'], strict=True))
+            if any(value is None for value in position):
+                raise ValueError
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError) as exc:
+            raise NotFound(self.invalid_cursor_message) from exc
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # ran off the end of the data, the first page is the way back
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class PostCursorPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class FeedCursorPagination(KeysetPagination):
+    # sort key annotated by posts.timeline.home_timeline
+    ordering = ('-feed_at', '-feed_id')
+    key_fields = {'feed_at': models.DateTimeField(), 'feed_id': models.BigIntegerField()}
+
+
+class CommentCursorPagination(KeysetPagination):
+    ordering = ('created_at', 'id')
+
+
+class NotificationCursorPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
@@ -0,0 +1,177 @@
+# social_media_api/profiling.py
+"""
+On-demand profiling of live requests.
+
+``ProfilingMiddleware`` runs the view and the rendering of a request under
+``cProfile`` when
+
+* the request carries a valid signed ``X-Profile`` header
+  (``python manage.py profile_token`` prints one), or
+* the view is listed in ``SAMPLE_RATES`` and the request is drawn, e.g.
+  ``{'FeedView': 0.01}`` profiles one feed request in a hundred. ``'*'``
+  applies to every other view. The rates can also be given as a string
+  like ``'FeedView=0.01,*=0.001'``; entries that aren't a view and a rate
+  between 0 and 1 are logged and ignored.
+
+Views are named as in the request metrics: ``FeedView``,
+``PostViewSet.list``, ... Profiles are written to ``DIR``, which keeps the
+newest ``MAX_PROFILES`` of them. ``python manage.py profile_report``
+aggregates them per endpoint and diffs two endpoints.
+
+Settings (all optional) live in ``settings.PROFILING``::
+
+    PROFILING = {
+        'DIR': BASE_DIR / 'profiles',
+        'MAX_PROFILES': 200,
+        'SAMPLE_RATES': {},
+        'TOKEN_MAX_AGE': 3600,
+    }
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .instrumentation import endpoint_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'DIR': Path(settings.BASE_DIR) / 'profiles',
+    'MAX_PROFILES': 200,
+    'SAMPLE_RATES': {},
+    'TOKEN_MAX_AGE': 3600,
+}
+
+HEADER = 'HTTP_X_PROFILE'
+SALT = 'social_media_api.profiling'
+SUFFIX = '.prof'
+UNSAFE = re.compile(r'[^\w.]')
+
+
+def profiling_setting(name):
+    return getattr(settings, 'PROFILING', {}).get(name, DEFAULTS[name])
+
+
+def make_token():
+    """A value for the ``X-Profile`` header, valid for ``TOKEN_MAX_AGE`` seconds."""
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def valid_token(value):
+    try:
+        return signing.TimestampSigner(salt=SALT).unsign(value, max_age=profiling_setting('TOKEN_MAX_AGE')) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+def parse_rates(value):
+    """``{view: rate}`` from ``'FeedView=0.01,*=0.001'``, skipping malformed entries."""
+    rates = {}
+    for pair in value.split(','):
+        view, _, rate = (part.strip() for part in pair.partition('='))
+        if not view:
+            continue
+        try:
+            rates[view] = float(rate)
+        except ValueError:
+            logger.warning("Ignoring profiling sample rate %r, expected <view>=<rate>", pair.strip())
+            continue
+        if not 0 <= rates[view] <= 1:
+            logger.warning("Ignoring profiling sample rate %r, the rate must be between 0 and 1", pair.strip())
+            del rates[view]
+    return rates
+
+
+@lru_cache(maxsize=None)
+def sample_rates():
+    rates = profiling_setting('SAMPLE_RATES')
+    return parse_rates(rates) if isinstance(rates, str) else rates
+
+
+@receiver(setting_changed)
+def _reset_sample_rates(setting, **kwargs):
+    if setting == 'PROFILING':
+        sample_rates.cache_clear()
+
+
+def sampled(endpoint):
+    rates = sample_rates()
+    rate = rates.get(endpoint, rates.get('*', 0))
+    return rate > 0 and random.random() < rate
+
+
+def profile_dir():
+    return Path(profiling_setting('DIR'))
+
+
+def profiles(endpoint=None):
+    """``[(endpoint, path)]`` of the stored profiles, oldest first."""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    found = []
+    for path in sorted(directory.glob(f'*{SUFFIX}')):
+        # <time_ns>-<pid>-<endpoint>.prof
+        name = path.name[:-len(SUFFIX)].split('-', 2)[-1]
+        if endpoint is None or name == endpoint:
+            found.append((name, path))
+    return found
+
+
+def save(profiler, endpoint):
+    """Write ``profiler``'s stats to the ring buffer and drop the oldest profiles beyond ``MAX_PROFILES``."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{time.time_ns():020d}-{os.getpid()}-{UNSAFE.sub('_', endpoint)}"
+    partial = directory / f'{name}.tmp'
+    profiler.dump_stats(partial)
+    os.replace(partial, directory / f'{name}{SUFFIX}')
+    stored = profiles()
+    for _, path in stored[:max(len(stored) - profiling_setting('MAX_PROFILES'), 0)]:
+        path.unlink(missing_ok=True)
+    return name
+
+
+class ProfilingMiddleware:
+    """Profiles the view and rendering of selected requests; keep it last in ``MIDDLEWARE``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        profiler = getattr(request, '_profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        try:
+            name = save(profiler, endpoint_name(request))
+        except OSError:
+            logger.exception("Could not store the profile of %s %s", request.method, request.path)
+        else:
+            if request._profile_requested:
+                response['X-Profile-Id'] = name
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        requested = HEADER in request.META and valid_token(request.META[HEADER])
+        if not (requested or sampled(endpoint_name(request))):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is already active on this thread
+            return None
+        request._profiler, request._profile_requested = profiler, requested
+        return None
@@ -0,0 +1,168 @@
+# social_media_api/readpath.py
+"""
+Fast read path for list endpoints.
+
+DRF renders a page by walking every field of every nested serializer for
+every row. ``ReadPlan`` does that walk once per request instead: it compiles
+a serializer (already pruned by ``?fields=``, see
+``social_media_api.fieldsets``) into the ``.values()`` columns it needs and
+one small function per output field. ``FastListMixin.list()`` then fetches
+plain dicts and builds each item with those functions. Nested serializers
+become joined columns (``author__username``), and page-level data such as
+comment previews is fetched once per page in a batch.
+
+The output must be identical to the serializer's. Field types the compiler
+knows are rendered the way DRF would. A field can also provide
+``read_plan(plan)``, and a serializer can provide ``plan_<field name>(plan)``
+for method fields. Both return a function of the row. Anything else raises
+``Unsupported`` and the view falls back to the serializer. Set
+``FAST_READ_PATH = False`` to always use the serializers; the parity tests
+compare both paths.
+"""
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework import relations, serializers
+from rest_framework.response import Response
+
+# to_representation() of these is the identity for what the database returns
+PASSTHROUGH = (serializers.CharField, serializers.IntegerField, serializers.BooleanField)
+
+
+class Unsupported(Exception):
+    """The serializer has a field ``ReadPlan`` cannot render."""
+
+
+def _model_field(model, attrs):
+    for attr in attrs[:-1]:
+        model = model._meta.get_field(attr).related_model
+    return model._meta.get_field(attrs[-1])
+
+
+def top_per_group(queryset, group, ordering, limit):
+    """The first ``limit`` rows of ``queryset`` per ``group`` value, in ``ordering`` (one query)."""
+    order_by = [F(name[1:]).desc() if name.startswith('-') else F(name).asc() for name in ordering]
+    # ranked by primary key in a subquery: Django's QUALIFY emulation trips over
+    # repeated columns (e.g. ``author`` and ``author__id``) in the outer values()
+    ranked = queryset.annotate(
+        group_rank=Window(RowNumber(), partition_by=F(group), order_by=order_by)
+    ).filter(group_rank__lte=limit).values('pk')
+    return queryset.model._default_manager.filter(pk__in=ranked).order_by(group, *ordering)
+
+
+class ReadPlan:
+    """
+    The compiled shape of ``serializer`` over rows whose columns start with
+    ``prefix``. ``columns`` go to ``.values()``, ``render_many(rows)`` builds
+    the representations.
+    """
+
+    def __init__(self, serializer, prefix=''):
+        self.serializer = serializer
+        self.context = serializer.context
+        self.prefix = prefix
+        self.columns = []
+        self.batches = []
+        self.steps = [(name, self.compile(name, field)) for name, field in serializer.fields.items()]
+
+    def column(self, path):
+        """Select ``path`` (relative to this plan) and return its key in the row."""
+        column = self.prefix + path
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def batch(self, prepare):
+        """Call ``prepare(rows)`` once per page, before any row is rendered."""
+        self.batches.append(prepare)
+
+    def compile(self, name, field):
+        hook = getattr(self.serializer, f'plan_{name}', None)
+        if hook is not None:
+            return hook(self)
+        if hasattr(field, 'read_plan'):
+            return field.read_plan(self)
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            raise Unsupported(f'{type(self.serializer).__name__}.{name}')
+        path = '__'.join(field.source_attrs)
+        if isinstance(field, serializers.ListSerializer):
+            raise Unsupported(f'{type(self.serializer).__name__}.{name}')
+        if isinstance(field, serializers.BaseSerializer):
+            return self.nested(field, path)
+        column = self.column(path)
+        if isinstance(field, relations.PrimaryKeyRelatedField):
+            # values() returns the foreign key itself
+            return lambda row: row[column]
+        if isinstance(field, serializers.FileField):
+            return self.file_url(field, column)
+        if isinstance(field, relations.RelatedField):
+            raise Unsupported(f'{type(self.serializer).__name__}.{name}')
+        if type(field) in PASSTHROUGH:
+            return lambda row: row[column]
+        to_representation = field.to_representation
+        return lambda row: None if row[column] is None else to_representation(row[column])
+
+    def nested(self, serializer, path):
+        plan = ReadPlan(serializer, f'{self.prefix}{path}__')
+        self.columns.extend(column for column in plan.columns if column not in self.columns)
+        self.batches.extend(plan.batches)
+        # the foreign key tells a missing relation apart without a join
+        key = self.column(path)
+        render = plan.render
+        return lambda row: None if row[key] is None else render(row)
+
+    def file_url(self, field, column):
+        storage = _model_field(self.serializer.Meta.model, field.source_attrs).storage
+        request = self.context.get('request')
+        if not getattr(field, 'use_url', True):
+            return lambda row: row[column] or None
+
+        def render(row):
+            name = row[column]
+            if not name:
+                return None
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        return render
+
+    def render(self, row):
+        return {name: step(row) for name, step in self.steps}
+
+    def render_many(self, rows):
+        rows = list(rows)
+        for prepare in self.batches:
+            prepare(rows)
+        return [self.render(row) for row in rows]
+
+
+def compile_plan(serializer):
+    """A ``ReadPlan`` for ``serializer``, or ``None`` if it has to take the slow path."""
+    if not getattr(settings, 'FAST_READ_PATH', True):
+        return None
+    try:
+        return ReadPlan(serializer)
+    except Unsupported:
+        return None
+
+
+class FastListMixin:
+    """``list()`` from ``.values()`` rows through the serializer's ``ReadPlan``."""
+
+    def get_values_queryset(self):
+        # prefetches don't apply to dicts; select_related is ignored by values()
+        return self.filter_queryset(self.get_queryset()).prefetch_related(None)
+
+    def list(self, request, *args, **kwargs):
+        plan = compile_plan(self.get_serializer())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        columns = list(plan.columns)
+        # keyset pagination reads its cursor position from the rows
+        for name in getattr(self.paginator, 'ordering', ()):
+            if name.lstrip('-') not in columns:
+                columns.append(name.lstrip('-'))
+        queryset = self.get_values_queryset().values(*columns)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.render_many(page))
+        return Response(plan.render_many(queryset))
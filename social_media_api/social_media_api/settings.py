@@ -34,6 +34,9 @@ INSTALLED_APPS = [
     "users",
     "posts",
     "notifications",
+    "uploads",
+    # project-wide management commands (profiling, endpoint benchmarks)
+    "social_media_api",
 
     # django
     "django.contrib.admin",
@@ -51,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its total covers the other middleware too
+    "social_media_api.instrumentation.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  
     "corsheaders.middleware.CorsMiddleware",
@@ -60,6 +65,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    # last, so it profiles the view and rendering only
+    "social_media_api.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "social_media_api.urls"
@@ -80,6 +87,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "social_media_api.wsgi.application"
+ASGI_APPLICATION = "social_media_api.asgi.application"
 
 # Database
 DATABASE_URL = os.environ.get("DATABASE_URL")
@@ -93,9 +101,27 @@ else:
         }
     }
 
+# Cache: Redis when REDIS_URL is set (needs the "redis" package), otherwise per-process memory
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "social-media-api"}}
+
 # Custom user model
 AUTH_USER_MODEL = "users.CustomUser"
 
+# Django's default hashers, PBKDF2 runs on the hashing pool (see users/hashers.py). The plain
+# PBKDF2PasswordHasher must not be listed too: it shares the pbkdf2_sha256 algorithm name and
+# would take over verifying the existing hashes.
+PASSWORD_HASHERS = [
+    "users.hashers.PooledPBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -124,7 +150,8 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST Framework & JWT (Simple JWT)
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # resolves the token's user from the cache, see users/authentication.py
+        "users.authentication.CachedJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
@@ -137,8 +164,102 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": int(os.environ.get("PAGE_SIZE", 10)),
+    # orjson when installed, same bytes as DRF's JSONRenderer
+    "DEFAULT_RENDERER_CLASSES": (
+        "social_media_api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+}
+
+# List endpoints render .values() rows through precompiled field plans (see social_media_api/readpath.py)
+FAST_READ_PATH = os.environ.get("FAST_READ_PATH", "True").lower() in ("true", "1", "yes")
+
+# Number of most recent comments embedded in each serialized post
+POST_COMMENTS_PREVIEW = int(os.environ.get("POST_COMMENTS_PREVIEW", 3))
+
+# Notification delivery (see notifications/dispatch.py): "sync", "thread" or "durable"
+NOTIFICATIONS = {
+    "DELIVERY": os.environ.get("NOTIFICATION_DELIVERY", "thread"),
+    "BATCH_SIZE": int(os.environ.get("NOTIFICATION_BATCH_SIZE", 500)),
+    "FLUSH_INTERVAL": float(os.environ.get("NOTIFICATION_FLUSH_INTERVAL", 0.5)),
+    "SPOOL_PATH": os.environ.get("NOTIFICATION_SPOOL_PATH", BASE_DIR / "notification_spool.sqlite3"),
+    # seconds during which likes/comments/follows coalesce into one row, 0 disables
+    "AGGREGATION_WINDOW": int(os.environ.get("NOTIFICATION_AGGREGATION_WINDOW", 24 * 60 * 60)),
+    "UNREAD_COUNT_TTL": int(os.environ.get("NOTIFICATION_UNREAD_COUNT_TTL", 300)),
+}
+
+# Like writes (see posts/likes.py): "direct", or "buffered" to batch them from a background thread
+LIKES = {
+    "WRITE": os.environ.get("LIKES_WRITE", "direct"),
+    "FLUSH_INTERVAL": float(os.environ.get("LIKES_FLUSH_INTERVAL", 0.5)),
+    "BATCH_SIZE": int(os.environ.get("LIKES_BATCH_SIZE", 1000)),
+}
+
+# Real-time push (see notifications/realtime.py); use RedisBroker with several processes
+REALTIME = {
+    "BROKER": os.environ.get("REALTIME_BROKER", "notifications.realtime.LocalBroker"),
+    "QUEUE_SIZE": int(os.environ.get("REALTIME_QUEUE_SIZE", 100)),
+    "HEARTBEAT": int(os.environ.get("REALTIME_HEARTBEAT", 15)),
+}
+
+# Home timelines (see posts/timeline.py)
+TIMELINE = {
+    "BACKEND": os.environ.get("TIMELINE_BACKEND", "posts.timeline.DatabaseTimelineBackend"),
+    "MAX_ENTRIES": int(os.environ.get("TIMELINE_MAX_ENTRIES", 800)),
+    "CELEBRITY_FOLLOWER_THRESHOLD": int(os.environ.get("TIMELINE_CELEBRITY_THRESHOLD", 10000)),
 }
 
+# Cached post/profile representations (see social_media_api/object_cache.py)
+OBJECT_CACHE = {
+    "TIMEOUT": int(os.environ.get("OBJECT_CACHE_TIMEOUT", 300)),
+    "LOCK_TIMEOUT": float(os.environ.get("OBJECT_CACHE_LOCK_TIMEOUT", 5)),
+}
+
+# Follow-graph cache and suggestions (see users/graph.py)
+FOLLOW_GRAPH = {
+    "MAX_USERS": int(os.environ.get("FOLLOW_GRAPH_MAX_USERS", 10000)),
+    "SUGGESTIONS": int(os.environ.get("FOLLOW_SUGGESTIONS", 20)),
+}
+
+# Media uploads (see uploads/processing.py)
+MEDIA_UPLOADS = {
+    "MAX_SIZE": int(os.environ.get("MEDIA_MAX_UPLOAD_BYTES", 50 * 1024 * 1024)),
+    "WORKER": os.environ.get("MEDIA_WORKER", "thread"),
+    # resumable upload sessions, MAX_SIZE when unset
+    "SESSION_MAX_SIZE": int(os.environ.get("MEDIA_SESSION_MAX_UPLOAD_BYTES", 0)) or None,
+}
+
+# Login response (see users/login.py): "full" profile or "compact" summary, optionally warming the feed
+LOGIN = {
+    "USER": os.environ.get("LOGIN_USER", "full"),
+    "WARM_FEED": os.environ.get("LOGIN_WARM_FEED", "False").lower() in ("true", "1", "yes"),
+}
+
+# Password hashing on a bounded thread pool (see users/hashers.py), 0 hashes on the request thread
+PASSWORD_HASHING = {
+    "WORKERS": int(os.environ.get("PASSWORD_HASHING_WORKERS", 4)),
+}
+
+# Server-Timing headers, slow request and N+1 logging (see social_media_api/instrumentation.py)
+INSTRUMENTATION = {
+    "SERVER_TIMING": os.environ.get("INSTRUMENTATION_SERVER_TIMING", "True").lower() in ("true", "1", "yes"),
+    "SLOW_REQUEST_MS": int(os.environ.get("INSTRUMENTATION_SLOW_REQUEST_MS", 500)),
+    "DUPLICATE_QUERY_THRESHOLD": int(os.environ.get("INSTRUMENTATION_DUPLICATE_QUERY_THRESHOLD", 3)),
+}
+
+# Request profiling on a signed X-Profile header or for a sampled share of a view's requests
+# (see social_media_api/profiling.py), e.g. PROFILING_SAMPLE_RATES=FeedView=0.01,PostViewSet.list=0.01
+PROFILING = {
+    "DIR": os.environ.get("PROFILING_DIR", BASE_DIR / "profiles"),
+    "MAX_PROFILES": int(os.environ.get("PROFILING_MAX_PROFILES", 200)),
+    # parsed by profiling.sample_rates(), malformed pairs are logged and skipped
+    "SAMPLE_RATES": os.environ.get("PROFILING_SAMPLE_RATES", ""),
+    "TOKEN_MAX_AGE": int(os.environ.get("PROFILING_TOKEN_MAX_AGE", 3600)),
+}
+
+# Seconds an authenticated user is served from the cache, 0 loads it on every request
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get("AUTH_USER_CACHE_TIMEOUT", 60))
+
 # Simple JWT settings
 from rest_framework_simplejwt.settings import api_settings as jwt_api_settings
 
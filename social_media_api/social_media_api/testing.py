@@ -0,0 +1,65 @@
+# social_media_api/testing.py
+"""Helpers shared by the apps' test suites."""
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+
+from .benchmark import QUERY_BUDGETS, Subjects, client_for, measure
+
+
+class QueryPlanMixin:
+    """Assertions on the database's query plan for a queryset."""
+
+    def query_plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # test tables are tiny, make the planner show what it would do at scale
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index, sorted_by_index=True):
+        """
+        ``queryset`` reads through ``index``; with ``sorted_by_index`` its
+        ORDER BY must also come from the index rather than a separate sort.
+        """
+        plan = self.query_plan(queryset)
+        self.assertIn(index, plan, f'{index} not used:\n{plan}')
+        if sorted_by_index and connection.vendor == 'sqlite':
+            self.assertNotIn('TEMP B-TREE', plan, f'sorted outside {index}:\n{plan}')
+
+
+class ReadPathParityMixin:
+    """The fast read path (social_media_api/readpath.py) must render what the serializers do."""
+
+    def assertSameAsSerializers(self, client, url):
+        responses = []
+        for fast in (False, True):
+            with self.settings(FAST_READ_PATH=fast):
+                responses.append(client.get(url))
+        slow, fast = responses
+        self.assertEqual(slow.status_code, 200, slow.content)
+        self.assertEqual(fast.status_code, slow.status_code)
+        self.assertEqual(fast.content, slow.content)
+
+
+class QueryBudgetMixin:
+    """
+    Requests to the hot endpoints stay within ``QUERY_BUDGETS`` (see
+    social_media_api/benchmark.py) on a small graph from ``seed_social_graph``.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_social_graph', users=40, avg_following=6, seed=1, stdout=StringIO())
+        cls.subjects = Subjects.pick()
+
+    def assertWithinBudget(self, name):
+        cache.clear()
+        response, _, queries = measure(client_for(self.subjects.viewer), name, self.subjects)
+        self.assertLess(response.status_code, 400, response.content)
+        self.assertLessEqual(
+            len(queries), QUERY_BUDGETS[name],
+            f"{name} took {len(queries)} queries:\n" + '\n'.join(query['sql'] for query in queries),
+        )
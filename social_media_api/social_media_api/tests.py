@@ -0,0 +1,179 @@
+import cProfile
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import profiling
+from .instrumentation import Registry, RequestStats, server_timing
+
+User = get_user_model()
+
+
+def execute(sql, params, many, context):
+    return None
+
+
+class RegistryTests(SimpleTestCase):
+    def test_histograms_are_cumulative(self):
+        registry = Registry()
+        for total in [0.003, 0.02, 0.02, 20]:
+            registry.record('FeedView', 'GET', 200, {'total': total, 'db': 0.001}, 4, {})
+        text = registry.render()
+        labels = 'endpoint="FeedView",method="GET"'
+        for line in [
+            '# TYPE api_request_duration_seconds histogram',
+            f'api_request_duration_seconds_bucket{{{labels},le="0.005"}} 1',
+            f'api_request_duration_seconds_bucket{{{labels},le="0.01"}} 1',
+            f'api_request_duration_seconds_bucket{{{labels},le="0.025"}} 3',
+            f'api_request_duration_seconds_bucket{{{labels},le="10"}} 3',
+            f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} 4',
+            f'api_request_duration_seconds_sum{{{labels}}} 20.043',
+            f'api_request_duration_seconds_count{{{labels}}} 4',
+            f'api_request_queries_bucket{{{labels},le="5"}} 4',
+            f'api_requests_total{{{labels},status="200"}} 4',
+        ]:
+            with self.subTest(line=line):
+                self.assertIn(line, text.splitlines())
+        # phases the request never reached are not observed
+        self.assertNotIn('api_request_view_seconds_count{', text)
+        self.assertNotIn('api_request_duplicate_queries_total{', text)
+
+    def test_label_values_are_escaped(self):
+        registry = Registry()
+        registry.record('a"b\\c\nd', 'GET', 200, {'total': 0.1, 'db': 0}, 0, {'SELECT 1': 3})
+        self.assertIn(
+            'api_request_duplicate_queries_total{endpoint="a\\"b\\\\c\\nd",method="GET"} 1',
+            registry.render().splitlines(),
+        )
+
+
+class RequestStatsTests(SimpleTestCase):
+    def test_repeated_queries_are_reported_from_the_threshold(self):
+        stats = RequestStats()
+        for pk in range(3):
+            stats(execute, 'SELECT * FROM t WHERE id = %s', [pk], False, {})
+        stats(execute, 'SELECT * FROM u WHERE id IN (%s, %s)', [1, 2], False, {})
+        stats(execute, 'SELECT * FROM u WHERE id IN (%s)', [1], False, {})
+        self.assertEqual(stats.queries, 5)
+        for threshold, expected in [(3, {'SELECT * FROM t WHERE id = %s': 3}), (4, {})]:
+            with self.subTest(threshold=threshold), override_settings(
+                INSTRUMENTATION={'DUPLICATE_QUERY_THRESHOLD': threshold}
+            ):
+                self.assertEqual(stats.duplicates(), expected)
+        with override_settings(INSTRUMENTATION={'DUPLICATE_QUERY_THRESHOLD': 2}):
+            # IN lists of any length share a fingerprint
+            self.assertEqual(stats.duplicates()['SELECT * FROM u WHERE id IN (...)'], 2)
+
+    def test_view_time_excludes_its_sql(self):
+        stats = RequestStats()
+        stats.started, stats.view_started, stats.view_finished = 10.0, 10.5, 12.0
+        stats.db_time, stats.view_db_time = 1.0, 0.75
+        self.assertEqual(stats.timings(13.0), {'db': 1.0, 'view': 0.75, 'render': 1.0, 'total': 3.0})
+        # a view that raised never finished, and nothing was rendered
+        stats.view_finished = None
+        self.assertEqual(stats.timings(13.0), {'db': 1.0, 'view': 1.75, 'total': 3.0})
+        self.assertEqual(
+            server_timing({'db': 0.0123, 'total': 0.5}, 4),
+            'db;dur=12.3;desc="4 queries", total;dur=500.0;desc="total"',
+        )
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class MetricsViewTests(TestCase):
+    def test_metrics_are_for_staff_only(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/metrics/').status_code, 401)
+        client.force_authenticate(User.objects.create_user('member', password='pass'))
+        self.assertEqual(client.get('/api/metrics/').status_code, 403)
+        client.force_authenticate(User.objects.create_user('admin', password='pass', is_staff=True))
+        client.get('/api/posts/')
+        response = client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('endpoint="PostViewSet.list",method="GET"', response.content.decode())
+
+    def test_responses_carry_server_timing(self):
+        phases = [part.split(';')[0] for part in self.client.get('/api/posts/')['Server-Timing'].split(', ')]
+        self.assertEqual(phases, ['db', 'view', 'render', 'total'])
+        with override_settings(INSTRUMENTATION={'SERVER_TIMING': False}):
+            self.assertFalse(self.client.get('/api/posts/').has_header('Server-Timing'))
+
+
+def busy(n):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+def idle():
+    return None
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.enterContext(override_settings(SECURE_SSL_REDIRECT=False, PROFILING={'DIR': directory}))
+
+    def profile(self, endpoint, function, *args):
+        profiler = cProfile.Profile()
+        profiler.runcall(function, *args)
+        return profiling.save(profiler, endpoint)
+
+    def test_tokens(self):
+        token = profiling.make_token()
+        self.assertTrue(profiling.valid_token(token))
+        for value in [token + 'x', 'profile', '']:
+            with self.subTest(value=value):
+                self.assertFalse(profiling.valid_token(value))
+        with override_settings(PROFILING={'TOKEN_MAX_AGE': -1}):
+            self.assertFalse(profiling.valid_token(token))
+
+    def test_sample_rates(self):
+        with self.assertLogs('social_media_api.profiling', 'WARNING') as logs:
+            rates = profiling.parse_rates('FeedView=0.5, PostViewSet.list, *=2,UserDetailView=x,,* = 0.25')
+        self.assertEqual(rates, {'FeedView': 0.5, '*': 0.25})
+        self.assertEqual(len(logs.output), 3)
+        with override_settings(PROFILING={'SAMPLE_RATES': 'FeedView=1,PostViewSet.list=0'}):
+            self.assertTrue(profiling.sampled('FeedView'))
+            self.assertFalse(profiling.sampled('PostViewSet.list'))
+            self.assertFalse(profiling.sampled('UserDetailView'))
+        with override_settings(PROFILING={'SAMPLE_RATES': {'*': 0.5}}):
+            for draw, expected in [(0.4, True), (0.6, False)]:
+                with self.subTest(draw=draw), mock.patch.object(profiling.random, 'random', return_value=draw):
+                    self.assertEqual(profiling.sampled('UserDetailView'), expected)
+
+    def test_save_keeps_the_newest_profiles(self):
+        with override_settings(PROFILING={'DIR': profiling.profile_dir(), 'MAX_PROFILES': 3}):
+            names = [self.profile('FeedView' if n % 2 else 'PostViewSet.list', idle) for n in range(5)]
+            stored = profiling.profiles()
+        self.assertEqual([path.name for _, path in stored], [f'{name}.prof' for name in names[2:]])
+        self.assertEqual([endpoint for endpoint, _ in profiling.profiles('FeedView')], ['FeedView'])
+        self.assertFalse(list(profiling.profile_dir().glob('*.tmp')))
+
+    def test_requested_profile(self):
+        self.assertFalse(self.client.get('/api/posts/').has_header('X-Profile-Id'))
+        response = self.client.get('/api/posts/', HTTP_X_PROFILE=profiling.make_token())
+        self.assertTrue(response['X-Profile-Id'].endswith('-PostViewSet.list'))
+        self.assertEqual([endpoint for endpoint, _ in profiling.profiles()], ['PostViewSet.list'])
+
+    def test_report_diff(self):
+        self.profile('Slow', busy, 20000)
+        self.profile('Fast', idle)
+        out = StringIO()
+        call_command('profile_report', 'Fast', 'Slow', '--diff', '--sort', 'tottime', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('tottime ms per request, Fast (1 profiles'))
+        # the function only the slow profile ran comes first, with a positive delta
+        self.assertIn('busy', lines[2])
+        self.assertIn('+', lines[2])
+        for args in [('Fast', '--diff'), ('Fast', 'Missing', '--diff')]:
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                call_command('profile_report', *args, stdout=StringIO())
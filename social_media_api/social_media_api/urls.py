@@ -4,11 +4,15 @@ from django.http import JsonResponse
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .instrumentation import MetricsView
+
 def api_root(request):
     return JsonResponse({
         "users": "/api/users/",
         "posts": "/api/posts/",
-        "notifications": "/api/notifications/"
+        "notifications": "/api/notifications/",
+        "uploads": "/api/uploads/",
+        "metrics": "/api/metrics/"
     })
 
 urlpatterns = [
@@ -25,6 +29,12 @@ urlpatterns = [
 
     # Notifications endpoints
     path("api/notifications/", include("notifications.urls")),
+
+    # Media uploads
+    path("api/uploads/", include("uploads.urls")),
+
+    # Per-endpoint request metrics for Prometheus (staff only)
+    path("api/metrics/", MetricsView.as_view(), name="metrics"),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import MediaAsset, UploadSession
+
+@admin.register(MediaAsset)
+class MediaAssetAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'content_type', 'size', 'status', 'uploaded_by', 'created_at')
+    list_filter = ('kind', 'status')
+    search_fields = ('sha256',)
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'filename', 'size', 'received', 'asset', 'updated_at')
+    search_fields = ('filename', 'sha256')
@@ -0,0 +1,60 @@
+# uploads/handlers.py
+"""
+Upload handler for media endpoints.
+
+Django's default handlers keep small files in memory and hand the rest to a
+temporary file, and nothing bounds the size. ``HashingUploadHandler`` always
+streams straight to a temporary file, computes the SHA-256 on the fly so
+deduplication never re-reads the file, and rejects uploads over
+``MEDIA_UPLOADS['MAX_SIZE']`` with 413 as soon as the limit is crossed.
+"""
+import hashlib
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .processing import media_setting
+
+
+class FileTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'The uploaded file is too large.'
+    default_code = 'file_too_large'
+
+
+class HashingUploadHandler(FileUploadHandler):
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.max_size = media_setting('MAX_SIZE')
+        # the body also carries the multipart envelope and other fields
+        if content_length and content_length > self.max_size + 64 * 1024:
+            raise FileTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.hasher = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.file.close()
+            raise FileTooLarge()
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        return self.file
+
+
+class StreamingUploadMixin:
+    """Parse multipart bodies of a view with ``HashingUploadHandler``."""
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [HashingUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
@@ -0,0 +1,62 @@
+# uploads/ingest.py
+import hashlib
+import mimetypes
+import os
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+
+from .models import MediaAsset
+from . import processing
+
+
+def _sha256(uploaded_file):
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+    uploaded_file.seek(0)
+    return hasher.hexdigest()
+
+
+def _kind(content_type):
+    major = content_type.split('/', 1)[0]
+    return {'image': MediaAsset.IMAGE, 'video': MediaAsset.VIDEO}.get(major, MediaAsset.OTHER)
+
+
+def ingest(uploaded_file, user=None):
+    """
+    The ``MediaAsset`` for ``uploaded_file``, stored once per content hash.
+    Returns ``(asset, created)``; new image assets get their variants
+    generated in the background after commit. ``user`` becomes one of the
+    asset's ``uploaders`` either way.
+    """
+    if user is not None and not user.is_authenticated:
+        user = None
+    asset, created = _store(uploaded_file, user)
+    if user is not None:
+        asset.uploaders.add(user)
+    return asset, created
+
+
+def _store(uploaded_file, user):
+    # HashingUploadHandler hashed it while streaming, anything else is hashed here
+    sha256 = getattr(uploaded_file, 'sha256', None) or _sha256(uploaded_file)
+    asset = MediaAsset.objects.filter(sha256=sha256).first()
+    if asset is not None:
+        return asset, False
+    extension = os.path.splitext(uploaded_file.name or '')[1].lower()[:10]
+    content_type = uploaded_file.content_type or mimetypes.guess_type(uploaded_file.name or '')[0] or ''
+    name = default_storage.save(f'uploads/{sha256[:2]}/{sha256}{extension}', uploaded_file)
+    try:
+        with transaction.atomic():
+            asset = MediaAsset.objects.create(
+                uploaded_by=user,
+                file=name, sha256=sha256, size=uploaded_file.size,
+                content_type=content_type[:100], kind=_kind(content_type),
+            )
+    except IntegrityError:
+        # a concurrent upload of the same content won
+        default_storage.delete(name)
+        return MediaAsset.objects.get(sha256=sha256), False
+    processing.enqueue(asset.pk)
+    return asset, True
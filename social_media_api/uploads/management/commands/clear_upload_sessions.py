@@ -0,0 +1,15 @@
+# uploads/management/commands/clear_upload_sessions.py
+from django.core.management.base import BaseCommand
+
+from uploads.sessions import discard, expired
+
+
+class Command(BaseCommand):
+    help = "Delete resumable upload sessions idle for longer than MEDIA_UPLOADS['SESSION_TIMEOUT'] and their chunks."
+
+    def handle(self, *args, **options):
+        count = 0
+        for session in expired().iterator():
+            discard(session)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Removed {count} upload session(s)."))
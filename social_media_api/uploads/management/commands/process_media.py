@@ -0,0 +1,22 @@
+# uploads/management/commands/process_media.py
+from django.core.management.base import BaseCommand
+
+from uploads.models import MediaAsset
+from uploads.processing import process
+
+
+class Command(BaseCommand):
+    help = "Generate variants for media assets still pending (e.g. after a crash), or again for all with --all."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate variants of every image asset.")
+
+    def handle(self, *args, **options):
+        assets = MediaAsset.objects.all()
+        if options['all']:
+            assets.filter(kind=MediaAsset.IMAGE).update(status=MediaAsset.PENDING)
+        count = 0
+        for asset_id in assets.filter(status=MediaAsset.PENDING).values_list('pk', flat=True).iterator():
+            process(asset_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Processed {count} asset(s)."))
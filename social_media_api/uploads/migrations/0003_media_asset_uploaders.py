@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_uploaders(apps, schema_editor):
+    """Everyone who uploaded or already uses an asset may keep attaching it."""
+    MediaAsset = apps.get_model('uploads', 'MediaAsset')
+    UploadSession = apps.get_model('uploads', 'UploadSession')
+    Post = apps.get_model('posts', 'Post')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Uploader = MediaAsset.uploaders.through
+    pairs = set(MediaAsset.objects.exclude(uploaded_by=None).values_list('pk', 'uploaded_by_id'))
+    pairs.update(UploadSession.objects.exclude(asset=None).values_list('asset_id', 'user_id'))
+    pairs.update(Post.objects.exclude(media_asset=None).values_list('media_asset_id', 'author_id'))
+    pairs.update(User.objects.exclude(profile_picture_asset=None).values_list('profile_picture_asset_id', 'pk'))
+    Uploader.objects.bulk_create(
+        [Uploader(mediaasset_id=asset_id, customuser_id=user_id) for asset_id, user_id in pairs],
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0002_upload_sessions'),
+        ('posts', '0008_media_assets'),
+        ('users', '0005_media_assets'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaasset',
+            name='uploaders',
+            field=models.ManyToManyField(blank=True, related_name='uploaded_media_assets', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_uploaders, migrations.RunPython.noop),
+    ]
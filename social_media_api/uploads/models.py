@@ -0,0 +1,74 @@
+# uploads/models.py
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models
+
+
+class MediaAsset(models.Model):
+    """
+    One stored file, shared by every upload with the same content. Resized
+    copies are generated in the background (see uploads/processing.py) and
+    recorded in ``variants`` as ``{name: {"name": <storage path>, "width",
+    "height", "size"}}``.
+    """
+    PENDING, READY, FAILED = 'pending', 'ready', 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (READY, 'Ready'), (FAILED, 'Failed')]
+    IMAGE, VIDEO, OTHER = 'image', 'video', 'other'
+    KIND_CHOICES = [(IMAGE, 'Image'), (VIDEO, 'Video'), (OTHER, 'Other')]
+
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='media_assets'
+    )
+    # everyone who uploaded this content, i.e. may attach it to their posts
+    uploaders = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name='uploaded_media_assets')
+    # stored under uploads/<sha256[:2]>/<sha256><ext>, see uploads/ingest.py
+    file = models.FileField(max_length=255)
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=OTHER)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.sha256[:12]}"
+
+    def urls(self, request=None):
+        """``{"original": url, <variant>: url, ...}``, absolute when ``request`` is given."""
+        return self.build_urls(self.file.name, self.variants, request)
+
+    @staticmethod
+    def build_urls(name, variants, request=None):
+        urls = {'original': default_storage.url(name)}
+        urls.update((variant_name, default_storage.url(variant['name'])) for variant_name, variant in variants.items())
+        if request is not None:
+            urls = {variant_name: request.build_absolute_uri(url) for variant_name, url in urls.items()}
+        return urls
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload in progress. Chunks are written at their offsets into
+    a temporary file (see uploads/sessions.py); ``received`` is the length of
+    the contiguous prefix written so far, i.e. where the client resumes.
+    ``asset`` is set once the session has been finalized.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    # expected SHA-256 of the whole file, may also be given on finalize
+    sha256 = models.CharField(max_length=64, blank=True)
+    received = models.PositiveBigIntegerField(default=0)
+    asset = models.ForeignKey(MediaAsset, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
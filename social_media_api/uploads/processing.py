@@ -0,0 +1,174 @@
+# uploads/processing.py
+"""
+Background generation of image variants.
+
+New image assets are queued on transaction commit. A worker opens the
+original, applies its EXIF orientation and writes one downscaled copy per
+entry in ``MEDIA_UPLOADS['VARIANTS']`` (longest edge in pixels), so feeds
+link to a few-KB thumbnail instead of the original. Videos and other files
+are marked ready as they are. Posts and profiles that use the asset are
+invalidated once its variants exist.
+
+``MEDIA_UPLOADS['WORKER']`` is ``thread`` (a small in-process pool, the
+default) or ``sync`` (inline, used by tests). Assets a crashed process left
+pending are picked up by ``manage.py process_media``.
+
+Settings (all optional) live in ``settings.MEDIA_UPLOADS``::
+
+    MEDIA_UPLOADS = {
+        'MAX_SIZE': 50 * 1024 * 1024,
+        'MAX_PIXELS': 40_000_000,
+        'VARIANTS': {'thumbnail': 320, 'preview': 1080},
+        'FORMAT': 'WEBP',
+        'QUALITY': 80,
+        'WORKER': 'thread',
+        'WORKERS': 2,
+        'SESSION_MAX_SIZE': None,
+        'CHUNK_SIZE': 8 * 1024 * 1024,
+        'SESSION_TIMEOUT': 86400,
+        'SESSION_DIR': None,
+    }
+
+The ``SESSION_*`` and ``CHUNK_SIZE`` settings apply to resumable uploads,
+see uploads/sessions.py. Sessions are held to ``MAX_SIZE`` as well unless
+``SESSION_MAX_SIZE`` is set.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import MediaAsset
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_SIZE': 50 * 1024 * 1024,
+    'MAX_PIXELS': 40_000_000,
+    'VARIANTS': {'thumbnail': 320, 'preview': 1080},
+    'FORMAT': 'WEBP',
+    'QUALITY': 80,
+    'WORKER': 'thread',
+    'WORKERS': 2,
+    'SESSION_MAX_SIZE': None,
+    'CHUNK_SIZE': 8 * 1024 * 1024,
+    'SESSION_TIMEOUT': 24 * 60 * 60,
+    'SESSION_DIR': None,
+}
+
+
+def media_setting(name):
+    return getattr(settings, 'MEDIA_UPLOADS', {}).get(name, DEFAULTS[name])
+
+
+def session_max_size():
+    return media_setting('SESSION_MAX_SIZE') or media_setting('MAX_SIZE')
+
+
+def _render(image, edge):
+    copy = image.copy()
+    copy.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+    if copy.mode not in ('RGB', 'RGBA'):
+        copy = copy.convert('RGBA' if 'A' in copy.getbands() else 'RGB')
+    buffer = BytesIO()
+    image_format = media_setting('FORMAT')
+    if image_format == 'JPEG' and copy.mode == 'RGBA':
+        copy = copy.convert('RGB')
+    copy.save(buffer, image_format, quality=media_setting('QUALITY'))
+    return copy.size, buffer.getvalue()
+
+
+def generate_variants(asset):
+    """Write the configured variants of an image asset, returns them."""
+    extension = media_setting('FORMAT').lower()
+    variants = {}
+    with default_storage.open(asset.file.name) as original, Image.open(original) as image:
+        width, height = image.size
+        if width * height > media_setting('MAX_PIXELS'):
+            raise ValueError(f"{width}x{height} exceeds MAX_PIXELS")
+        image = ImageOps.exif_transpose(image)
+        asset.width, asset.height = image.size
+        for name, edge in media_setting('VARIANTS').items():
+            (variant_width, variant_height), data = _render(image, edge)
+            path = f'uploads/variants/{asset.sha256[:2]}/{asset.sha256}_{name}.{extension}'
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[name] = {
+                'name': default_storage.save(path, ContentFile(data)),
+                'width': variant_width, 'height': variant_height, 'size': len(data),
+            }
+    return variants
+
+
+def _invalidate_users_of(asset):
+    from posts.models import Post
+    from social_media_api import object_cache
+    from users.models import CustomUser
+
+    post_ids = set(Post.objects.filter(media_asset=asset).values_list('pk', flat=True))
+    # bump updated_at so list ETags (social_media_api/conditional.py) change too
+    Post.objects.filter(pk__in=post_ids).update(updated_at=timezone.now())
+    object_cache.invalidate('post', post_ids)
+    user_ids = set(CustomUser.objects.filter(profile_picture_asset=asset).values_list('pk', flat=True))
+    if user_ids:
+        # avatars are embedded in the user's posts and comment previews, see users.signals
+        CustomUser.objects.filter(pk__in=user_ids).update(updated_at=timezone.now())
+        object_cache.invalidate('user', user_ids)
+        object_cache.invalidate('author', user_ids)
+
+
+def process(asset_id):
+    asset = MediaAsset.objects.filter(pk=asset_id).first()
+    if asset is None or asset.status != MediaAsset.PENDING:
+        return
+    if asset.kind == MediaAsset.IMAGE:
+        try:
+            asset.variants = generate_variants(asset)
+            asset.status = MediaAsset.READY
+        except (OSError, ValueError, UnidentifiedImageError, Image.DecompressionBombError):
+            logger.exception("Could not process media asset %s", asset_id)
+            asset.status = MediaAsset.FAILED
+    else:
+        asset.status = MediaAsset.READY
+    with transaction.atomic():
+        asset.save(update_fields=['variants', 'status', 'width', 'height'])
+        if asset.variants:
+            _invalidate_users_of(asset)
+
+
+def _run(asset_id):
+    close_old_connections()
+    try:
+        process(asset_id)
+    except Exception:
+        logger.exception("Media processing failed for asset %s", asset_id)
+    finally:
+        close_old_connections()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=media_setting('WORKERS'), thread_name_prefix='media')
+
+
+@receiver(setting_changed)
+def _reset_executor(setting, **kwargs):
+    if setting == 'MEDIA_UPLOADS':
+        get_executor.cache_clear()
+
+
+def enqueue(asset_id):
+    """Process ``asset_id`` once the current transaction commits."""
+    if media_setting('WORKER') == 'sync':
+        transaction.on_commit(lambda: process(asset_id))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run, asset_id))
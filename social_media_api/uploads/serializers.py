@@ -0,0 +1,83 @@
+# uploads/serializers.py
+from django.db.models import Q
+from rest_framework import serializers
+
+from posts.models import Post
+from .handlers import FileTooLarge
+from .models import MediaAsset, UploadSession
+from .processing import session_max_size
+
+
+class MediaAssetSerializer(serializers.ModelSerializer):
+    urls = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MediaAsset
+        fields = ['id', 'sha256', 'size', 'content_type', 'kind', 'width', 'height', 'status', 'urls', 'created_at']
+        read_only_fields = fields
+
+    def get_urls(self, obj):
+        return obj.urls(self.context.get('request'))
+
+
+class MediaUrlsField(serializers.Field):
+    """Read-only ``MediaAsset.urls()`` of a related asset, ``None`` without one."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, asset):
+        return asset.urls(self.context.get('request'))
+
+    def read_plan(self, plan):
+        """See social_media_api.readpath."""
+        path = '__'.join(self.source_attrs)
+        key, name, variants = plan.column(path), plan.column(f'{path}__file'), plan.column(f'{path}__variants')
+        request = self.context.get('request')
+        return lambda row: None if row[key] is None else MediaAsset.build_urls(row[name], row[variants], request)
+
+
+class UploadedMediaField(serializers.PrimaryKeyRelatedField):
+    """
+    A writable asset id limited to assets the requesting user uploaded, and
+    the one already set on the instance being updated.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', MediaAsset.objects.all())
+        super().__init__(**kwargs)
+
+    def get_queryset(self):
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return MediaAsset.objects.none()
+        allowed = Q(uploaders=request.user)
+        current = getattr(getattr(self.parent, 'instance', None), f'{self.source}_id', None)
+        if current is not None:
+            allowed |= Q(pk=current)
+        return MediaAsset.objects.filter(allowed).distinct()
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received', read_only=True)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
+    asset = MediaAssetSerializer(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'content_type', 'size', 'sha256', 'offset', 'asset', 'created_at']
+        read_only_fields = ['id', 'offset', 'asset', 'created_at']
+
+    def validate_size(self, value):
+        if value > session_max_size():
+            raise FileTooLarge(f"Files may be at most {session_max_size()} bytes.")
+        return value
+
+    def validate_sha256(self, value):
+        return value.lower()
+
+
+class FinalizeUploadSerializer(serializers.Serializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False)
+    post = serializers.PrimaryKeyRelatedField(queryset=Post.objects.all(), required=False)
@@ -0,0 +1,133 @@
+# uploads/sessions.py
+"""
+Resumable uploads.
+
+A client creates an ``UploadSession`` with the file's size (and ideally its
+SHA-256), then sends the bytes in any number of ``PUT`` requests carrying a
+``Content-Range``. Each chunk is streamed from the request into a sparse
+temporary file with ``os.pwrite`` at its offset, so nothing is held in
+memory and a chunk that is re-sent after a dropped connection simply
+overwrites the same bytes. Only the contiguous prefix counts as received;
+after an interruption the client asks for the session and continues from
+``offset``.
+
+Finalizing hashes the temporary file, checks it against the expected
+checksum and hands it to ``ingest()`` like any other upload (the file is
+moved into storage, not copied).
+
+The temporary files live in ``MEDIA_UPLOADS['SESSION_DIR']`` (by default an
+``upload-sessions`` directory under ``FILE_UPLOAD_TEMP_DIR`` or the system
+temp dir). ``manage.py clear_upload_sessions`` removes sessions idle for
+longer than ``SESSION_TIMEOUT`` seconds.
+"""
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .ingest import ingest
+from .models import UploadSession
+from .processing import media_setting
+
+READ_SIZE = 64 * 1024
+
+
+def session_dir():
+    path = media_setting('SESSION_DIR') or os.path.join(
+        settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(), 'upload-sessions'
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def session_path(session):
+    return os.path.join(session_dir(), f'{session.pk.hex}.part')
+
+
+class SessionFile(File):
+    """The assembled upload, moved rather than copied by ``FileSystemStorage``."""
+
+    def __init__(self, file, name, content_type, sha256):
+        super().__init__(file, name)
+        self.content_type = content_type
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def write_chunk(session, start, stream, length):
+    """
+    Copy ``length`` bytes of ``stream`` to ``start`` in the session's file
+    and advance ``received`` if the chunk extends the contiguous prefix.
+    Returns the number of bytes written, less than ``length`` if the client
+    went away.
+    """
+    fd = os.open(session_path(session), os.O_WRONLY | os.O_CREAT, 0o600)
+    written = 0
+    try:
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            os.pwrite(fd, data, start + written)
+            written += len(data)
+    finally:
+        os.close(fd)
+    # chunks of one session may arrive in parallel, only ever move forward
+    UploadSession.objects.filter(pk=session.pk, received__gte=start).update(
+        received=Greatest('received', start + written), updated_at=timezone.now()
+    )
+    session.refresh_from_db(fields=['received', 'updated_at'])
+    return written
+
+
+def checksum(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def finalize(session, sha256=''):
+    """
+    Turn a fully received session into a ``MediaAsset``. Returns
+    ``(asset, created)``, or raises ``ValueError`` if the content does not
+    match the expected checksum; the session then starts over.
+    """
+    path = session_path(session)
+    actual = checksum(path)
+    expected = (sha256 or session.sha256).lower()
+    if actual != expected:
+        discard(session, delete=False)
+        raise ValueError("The uploaded content does not match the checksum.")
+    with open(path, 'rb') as file:
+        asset, created = ingest(SessionFile(file, session.filename, session.content_type, actual), session.user)
+    session.asset = asset
+    session.save(update_fields=['asset', 'updated_at'])
+    discard(session, delete=False)
+    return asset, created
+
+
+def discard(session, delete=True):
+    """Remove the session's temporary file, and the session unless ``delete`` is false."""
+    try:
+        os.remove(session_path(session))
+    except FileNotFoundError:
+        pass
+    if delete:
+        session.delete()
+    elif session.asset_id is None:
+        UploadSession.objects.filter(pk=session.pk).update(received=0, updated_at=timezone.now())
+        session.received = 0
+
+
+def expired(now=None):
+    cutoff = (now or timezone.now()) - timedelta(seconds=media_setting('SESSION_TIMEOUT'))
+    return UploadSession.objects.filter(updated_at__lt=cutoff)
@@ -0,0 +1,199 @@
+import hashlib
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from posts.models import Post
+from .models import MediaAsset
+
+User = get_user_model()
+
+
+def png(width=800, height=400, color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class MediaRootMixin:
+    """Store files in a temporary ``MEDIA_ROOT`` and process uploads inline."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.user = User.objects.create_user('uploader', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content, name='photo.png', client=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return (client or self.client).post(
+                '/api/uploads/', {'file': SimpleUploadedFile(name, content, 'image/png')}, format='multipart'
+            )
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, MEDIA_UPLOADS={'WORKER': 'sync', 'VARIANTS': {'thumbnail': 320}})
+class MediaUploadTests(MediaRootMixin, TestCase):
+    def test_upload_is_hashed_while_streaming(self):
+        content = png()
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sha256'], hashlib.sha256(content).hexdigest())
+        self.assertEqual(response.data['size'], len(content))
+        asset = MediaAsset.objects.get(pk=response.data['id'])
+        with default_storage.open(asset.file.name) as stored:
+            self.assertEqual(stored.read(), content)
+
+    def test_same_content_is_stored_once(self):
+        content = png()
+        first = self.upload(content)
+        other = User.objects.create_user('other', password='pass')
+        client = APIClient()
+        client.force_authenticate(other)
+        second = self.upload(content, name='copy.png', client=client)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(MediaAsset.objects.count(), 1)
+        self.assertEqual(set(MediaAsset.objects.get().uploaders.all()), {self.user, other})
+
+    @override_settings(MEDIA_UPLOADS={'WORKER': 'sync', 'MAX_SIZE': 1024})
+    def test_too_large_upload_is_rejected(self):
+        response = self.upload(png(600, 600, 'blue') + b'\0' * 2048)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(MediaAsset.objects.exists())
+
+    def test_image_variants_are_generated(self):
+        response = self.upload(png(800, 400))
+        asset = MediaAsset.objects.get(pk=response.data['id'])
+        self.assertEqual(asset.status, MediaAsset.READY)
+        self.assertEqual((asset.width, asset.height), (800, 400))
+        thumbnail = asset.variants['thumbnail']
+        self.assertEqual((thumbnail['width'], thumbnail['height']), (320, 160))
+        self.assertTrue(default_storage.exists(thumbnail['name']))
+
+    def test_broken_image_is_marked_failed(self):
+        with self.assertLogs('uploads.processing', 'ERROR'):
+            response = self.upload(b'not an image')
+        self.assertEqual(MediaAsset.objects.get(pk=response.data['id']).status, MediaAsset.FAILED)
+
+    def test_posts_expose_media_urls(self):
+        asset_id = self.upload(png()).data['id']
+        with_media = Post.objects.create(author=self.user, title='a', content='c', media_asset_id=asset_id)
+        without = Post.objects.create(author=self.user, title='b', content='c')
+        asset = MediaAsset.objects.get(pk=asset_id)
+        for post, expected in [(with_media, asset.urls()), (without, None)]:
+            with self.subTest(post=post.title):
+                urls = self.client.get(f'/api/posts/{post.pk}/').data['media_urls']
+                if expected is None:
+                    self.assertIsNone(urls)
+                else:
+                    self.assertEqual(set(urls), {'original', 'thumbnail'})
+                    self.assertTrue(urls['thumbnail'].startswith('http://testserver/'))
+                    self.assertTrue(urls['thumbnail'].endswith(expected['thumbnail']))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class UploadSessionTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        session_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, session_dir, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_UPLOADS={
+            'WORKER': 'sync', 'VARIANTS': {}, 'CHUNK_SIZE': 1024, 'SESSION_DIR': session_dir,
+        }))
+        self.content = bytes(range(256)) * 10
+
+    def start(self, content=None, **data):
+        content = self.content if content is None else content
+        data = {'filename': 'clip.bin', 'size': len(content), 'sha256': hashlib.sha256(content).hexdigest(), **data}
+        return self.client.post('/api/uploads/sessions/', data, format='json')
+
+    def put(self, session_id, first, last=None, content_range=None):
+        last = len(self.content) - 1 if last is None else last
+        headers = {}
+        if content_range is not False:
+            headers['HTTP_CONTENT_RANGE'] = content_range or f'bytes {first}-{last}/{len(self.content)}'
+        return self.client.generic(
+            'PUT', f'/api/uploads/sessions/{session_id}/', self.content[first:last + 1],
+            content_type='application/octet-stream', **headers
+        )
+
+    def finalize(self, session_id, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/uploads/sessions/{session_id}/finalize/', data, format='json')
+
+    def test_sessions_are_held_to_max_size_by_default(self):
+        for limits, expected in [({'MAX_SIZE': 1000}, 413), ({'MAX_SIZE': 1000, 'SESSION_MAX_SIZE': 4096}, 201)]:
+            with self.subTest(limits=limits), override_settings(MEDIA_UPLOADS={'WORKER': 'sync', **limits}):
+                self.assertEqual(self.start().status_code, expected)
+
+    def test_content_range_is_validated(self):
+        session_id = self.start().data['id']
+        for content_range, expected in [
+            ('bytes 0-99', 400),
+            ('items 0-99/2560', 400),
+            ('bytes 0-99/9999', 416),
+            ('bytes 2500-2599/2560', 416),
+            ('bytes 99-0/2560', 416),
+            ('bytes 0-199/2560', 400),
+        ]:
+            with self.subTest(content_range=content_range):
+                self.assertEqual(self.put(session_id, 0, 99, content_range).status_code, expected)
+        self.assertEqual(self.client.get(f'/api/uploads/sessions/{session_id}/').data['offset'], 0)
+
+    def test_chunks_past_the_received_prefix_are_refused(self):
+        session_id = self.start().data['id']
+        response = self.put(session_id, 1024, 2047)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 0)
+
+    def test_overlapping_chunks_only_move_the_offset_forward(self):
+        session_id = self.start().data['id']
+        self.assertEqual(self.put(session_id, 0, 1023).data['offset'], 1024)
+        # a resent chunk overlapping what arrived already
+        self.assertEqual(self.put(session_id, 512, 1535).data['offset'], 1536)
+        self.assertEqual(self.put(session_id, 0, 511).data['offset'], 1536)
+        self.assertEqual(self.put(session_id, 1536)['Upload-Offset'], str(len(self.content)))
+        response = self.finalize(session_id)
+        self.assertEqual(response.status_code, 201)
+        asset = MediaAsset.objects.get(pk=response.data['id'])
+        with default_storage.open(asset.file.name) as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_upload_resumes_from_the_offset(self):
+        session_id = self.start().data['id']
+        self.put(session_id, 0, 999)
+        offset = self.client.get(f'/api/uploads/sessions/{session_id}/').data['offset']
+        self.assertEqual(offset, 1000)
+        # without Content-Range the body is appended at the offset
+        self.assertEqual(self.put(session_id, offset, 1999, content_range=False).data['offset'], 2000)
+        self.assertEqual(self.put(session_id, 2000, content_range=False).data['offset'], len(self.content))
+        self.assertEqual(self.finalize(session_id).status_code, 201)
+
+    def test_finalize_checks_completeness_and_checksum(self):
+        session_id = self.start(sha256='').data['id']
+        self.put(session_id, 0, 1023)
+        self.assertEqual(self.finalize(session_id).status_code, 409)
+        self.put(session_id, 1024, 2047)
+        self.put(session_id, 2048)
+        self.assertEqual(self.finalize(session_id).status_code, 400)
+        response = self.finalize(session_id, sha256=hashlib.sha256(b'other').hexdigest())
+        self.assertEqual(response.status_code, 400)
+        # a mismatch starts the session over
+        self.assertEqual(response.data['offset'], 0)
+        self.assertEqual(self.client.get(f'/api/uploads/sessions/{session_id}/').data['offset'], 0)
+        self.assertFalse(MediaAsset.objects.exists())
+        for first, last in [(0, 1023), (1024, 2047), (2048, None)]:
+            self.put(session_id, first, last)
+        response = self.finalize(session_id, sha256=hashlib.sha256(self.content).hexdigest().upper())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sha256'], hashlib.sha256(self.content).hexdigest())
@@ -0,0 +1,13 @@
+# uploads/urls.py
+from django.urls import path
+from .views import (
+    MediaAssetDetailView, MediaUploadView, UploadSessionCreateView, UploadSessionFinalizeView, UploadSessionView,
+)
+
+urlpatterns = [
+    path('', MediaUploadView.as_view(), name='media-upload'),
+    path('<int:pk>/', MediaAssetDetailView.as_view(), name='media-asset-detail'),
+    path('sessions/', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('sessions/<uuid:pk>/', UploadSessionView.as_view(), name='upload-session-detail'),
+    path('sessions/<uuid:pk>/finalize/', UploadSessionFinalizeView.as_view(), name='upload-session-finalize'),
+]
@@ -0,0 +1,168 @@
+# uploads/views.py
+import mimetypes
+import re
+
+from django.db import transaction
+from rest_framework import generics, status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from . import sessions
+from .handlers import FileTooLarge, StreamingUploadMixin
+from .ingest import ingest
+from .models import MediaAsset, UploadSession
+from .processing import media_setting
+from .serializers import FinalizeUploadSerializer, MediaAssetSerializer, UploadSessionSerializer
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class MediaUploadView(StreamingUploadMixin, generics.CreateAPIView):
+    """
+    Upload a file (multipart field ``file``) and get back its asset, to be
+    attached with ``media_asset`` on a post. Identical content is stored
+    once; thumbnails follow shortly, poll the asset until ``status`` is
+    ``ready``.
+    """
+    serializer_class = MediaAssetSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def create(self, request, *args, **kwargs):
+        uploaded = request.FILES.get('file')
+        if uploaded is None:
+            return Response({'file': 'No file was submitted.'}, status=status.HTTP_400_BAD_REQUEST)
+        asset, created = ingest(uploaded, request.user)
+        return Response(
+            self.get_serializer(asset).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
+class MediaAssetDetailView(generics.RetrieveAPIView):
+    queryset = MediaAsset.objects.all()
+    serializer_class = MediaAssetSerializer
+    permission_classes = [IsAuthenticated]
+
+
+class UploadSessionCreateView(generics.CreateAPIView):
+    """
+    Start a resumable upload: ``{"filename", "size", "sha256"}``. Send the
+    bytes with ``PUT`` to the session, then ``POST`` to its ``finalize/``.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def perform_create(self, serializer):
+        filename = serializer.validated_data['filename']
+        content_type = serializer.validated_data.get('content_type') or mimetypes.guess_type(filename)[0] or ''
+        serializer.save(user=self.request.user, content_type=content_type)
+
+
+class UploadSessionView(generics.RetrieveDestroyAPIView):
+    """
+    ``GET`` the session to learn where to resume (``offset``), ``PUT`` a
+    chunk with ``Content-Range: bytes <first>-<last>/<size>`` (without it
+    the body is appended at ``offset``), ``DELETE`` to abandon it.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user).select_related('asset')
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if isinstance(response.data, dict) and 'offset' in response.data:
+            response['Upload-Offset'] = response.data['offset']
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def put(self, request, *args, **kwargs):
+        session = self.get_object()
+        if session.asset_id is not None:
+            return Response({'detail': 'The upload has already been finalized.'}, status=status.HTTP_409_CONFLICT)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length <= 0:
+            return Response({'detail': 'Content-Length is required.'}, status=status.HTTP_411_LENGTH_REQUIRED)
+        if length > media_setting('CHUNK_SIZE'):
+            raise FileTooLarge(f"Chunks may be at most {media_setting('CHUNK_SIZE')} bytes.")
+        content_range = request.headers.get('Content-Range')
+        if content_range:
+            match = CONTENT_RANGE.match(content_range)
+            if not match:
+                return Response({'detail': 'Malformed Content-Range.'}, status=status.HTTP_400_BAD_REQUEST)
+            start, end, total = map(int, match.groups())
+            if total != session.size or end < start or end >= session.size:
+                return Response(
+                    {'detail': 'Content-Range is outside the file.'},
+                    status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                )
+            if end - start + 1 != length:
+                return Response(
+                    {'detail': 'Content-Range does not match Content-Length.'}, status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            start = session.received
+            if start + length > session.size:
+                return Response(
+                    {'detail': 'The chunk runs past the end of the file.'},
+                    status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                )
+        if start > session.received:
+            # a gap would never become part of the received prefix
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+        written = sessions.write_chunk(session, start, request.stream, length)
+        data = self.get_serializer(session).data
+        if written < length:
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+    def perform_destroy(self, instance):
+        sessions.discard(instance)
+
+
+class UploadSessionFinalizeView(generics.GenericAPIView):
+    """
+    Check the assembled file against its SHA-256 and store it as an asset;
+    with ``post`` (one of your posts) it also becomes that post's media.
+    """
+    serializer_class = FinalizeUploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user).select_related('asset')
+
+    def post(self, request, *args, **kwargs):
+        session = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        post = serializer.validated_data.get('post')
+        if post is not None and post.author_id != request.user.pk:
+            raise PermissionDenied('You can only attach media to your own posts.')
+        created = False
+        with transaction.atomic():
+            if session.asset is None:
+                if session.received < session.size:
+                    return Response(
+                        UploadSessionSerializer(session, context=self.get_serializer_context()).data,
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                sha256 = serializer.validated_data.get('sha256', '')
+                if not (sha256 or session.sha256):
+                    return Response({'sha256': 'A checksum is required.'}, status=status.HTTP_400_BAD_REQUEST)
+                try:
+                    session.asset, created = sessions.finalize(session, sha256)
+                except ValueError as error:
+                    return Response({'sha256': str(error), 'offset': 0}, status=status.HTTP_400_BAD_REQUEST)
+            if post is not None:
+                post.media = session.asset.file.name
+                post.media_asset = session.asset
+                post.save(update_fields=['media', 'media_asset', 'updated_at'])
+        return Response(
+            MediaAssetSerializer(session.asset, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
@@ -0,0 +1,66 @@
+# users/authentication.py
+"""
+JWT authentication without a user query on every request.
+
+``CachedJWTAuthentication`` keeps the token's user in the cache for
+``AUTH_USER_CACHE_TIMEOUT`` seconds instead of loading the row each time.
+Tokens carry a ``uv`` ("user version") claim, the user's session auth
+hash (an HMAC of the password hash keyed with ``SECRET_KEY``, see
+``user_version()``). If it doesn't match the user, the token is
+rejected, so changing the password retires the tokens issued before.
+Tokens without the claim are accepted as before.
+
+``users.signals`` forgets a user whenever the row is saved (profile edits,
+password changes, deactivation) or deleted. Run several processes against
+a shared cache (``REDIS_URL``); with the local memory cache another process
+can serve a stale user for up to the timeout.
+
+Views that write to the user must load it themselves rather than save
+``request.user``, whose counters may be out of date.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+USER_VERSION_CLAIM = 'uv'
+
+
+def user_version(user):
+    # the same value Django keeps in sessions to log them out on a password change
+    return user.get_session_auth_hash()
+
+
+def _key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget(user_ids):
+    """Drop the cached users once the transaction commits."""
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    keys = [_key(user_id) for user_id in set(user_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        timeout = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+        user = cache.get(_key(user_id)) if timeout else None
+        if user is None:
+            # checks that the user exists and is active
+            user = super().get_user(validated_token)
+            if timeout:
+                cache.set(_key(user_id), user, timeout)
+        version = validated_token.get(USER_VERSION_CLAIM)
+        if version is not None and version != user_version(user):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
@@ -0,0 +1,201 @@
+# users/graph.py
+"""
+Follow-graph reads and "who to follow" suggestions.
+
+Each user's following and follower ids are cached in two tiers: a
+process-local LRU of frozensets (``FOLLOW_GRAPH['MAX_USERS']`` users per
+direction) in front of the shared Django cache, which holds the ids as a
+packed int64 array. Both are keyed by a per-user graph version (see
+``social_media_api.object_cache``) that ``users.signals`` moves forward when
+a follow changes, so every process drops its copy. A lookup costs one cache
+read to check the version plus a set probe; the database is only hit on a
+cold miss.
+
+Suggestions are friends of friends ranked by how many of the people a user
+follows already follow them, topped up with the most followed accounts. They
+are precomputed into ``FollowSuggestion`` by ``manage.py
+compute_follow_suggestions`` and filtered against the live graph when read.
+A user with no suggestions at all is remembered in the cache for
+``TIMEOUT`` seconds so their requests don't recompute them every time.
+
+Settings (all optional) live in ``settings.FOLLOW_GRAPH``::
+
+    FOLLOW_GRAPH = {
+        'MAX_USERS': 10000,
+        'TIMEOUT': 3600,
+        'SUGGESTIONS': 20,
+    }
+"""
+import threading
+from array import array
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Count
+from django.dispatch import receiver
+
+from social_media_api import object_cache
+from .models import CustomUser, FollowSuggestion
+
+Follow = CustomUser.following.through
+
+DEFAULTS = {
+    'MAX_USERS': 10000,
+    'TIMEOUT': 3600,
+    'SUGGESTIONS': 20,
+}
+
+FOLLOWING, FOLLOWERS = 'following', 'followers'
+
+
+def graph_setting(name):
+    return getattr(settings, 'FOLLOW_GRAPH', {}).get(name, DEFAULTS[name])
+
+
+class LRUCache:
+    """Thread-safe mapping that forgets the least recently used keys."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LRUCache(graph_setting('MAX_USERS') * 2)
+
+
+@receiver(setting_changed)
+def _reset_local(setting, **kwargs):
+    if setting in ('FOLLOW_GRAPH', 'CACHES'):
+        _local.max_size = graph_setting('MAX_USERS') * 2
+        _local.clear()
+
+
+def _query(user_id, direction):
+    if direction == FOLLOWING:
+        return Follow.objects.filter(from_customuser_id=user_id).values_list('to_customuser_id', flat=True)
+    return Follow.objects.filter(to_customuser_id=user_id).values_list('from_customuser_id', flat=True)
+
+
+def _ids(user_id, direction):
+    version = object_cache.version('follows', user_id)
+    entry = _local.get((user_id, direction))
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    key = f'graph:{direction}:{user_id}:{version}'
+    packed = cache.get(key)
+    if packed is None:
+        packed = array('q', sorted(_query(user_id, direction))).tobytes()
+        cache.set(key, packed, graph_setting('TIMEOUT'))
+    ids = array('q')
+    ids.frombytes(packed)
+    ids = frozenset(ids)
+    _local.set((user_id, direction), (version, ids))
+    return ids
+
+
+def following_ids(user_id):
+    return _ids(user_id, FOLLOWING)
+
+
+def follower_ids(user_id):
+    return _ids(user_id, FOLLOWERS)
+
+
+def is_following(user_id, target_ids):
+    """``{target id: bool}`` for every id in ``target_ids``, one set lookup each."""
+    following = following_ids(user_id)
+    return {target_id: target_id in following for target_id in target_ids}
+
+
+def follows(user_id, target_id):
+    return target_id in following_ids(user_id)
+
+
+def invalidate(user_ids):
+    """Both directions of the given users, once the transaction commits."""
+    object_cache.invalidate('follows', user_ids)
+
+
+def suggest(user_id, limit=None):
+    """``[(user id, mutual count)]``, best first, straight from the database."""
+    limit = limit or graph_setting('SUGGESTIONS')
+    following = Follow.objects.filter(from_customuser_id=user_id).values('to_customuser_id')
+    candidates = (
+        Follow.objects.filter(from_customuser_id__in=following, to_customuser__is_active=True)
+        .exclude(to_customuser_id=user_id)
+        .exclude(to_customuser_id__in=following)
+        .values('to_customuser_id')
+        .annotate(mutual=Count('pk'))
+        .order_by('-mutual', 'to_customuser_id')
+    )
+    suggestions = [(row['to_customuser_id'], row['mutual']) for row in candidates[:limit]]
+    if len(suggestions) < limit:
+        # cold start: nobody to go through yet, offer the most followed accounts
+        popular = (
+            CustomUser.objects.filter(is_active=True)
+            .exclude(pk=user_id)
+            .exclude(pk__in=following)
+            .exclude(pk__in=[pk for pk, _ in suggestions])
+            .order_by('-followers_count', 'pk')
+            .values_list('pk', flat=True)
+        )
+        suggestions += [(pk, 0) for pk in popular[:limit - len(suggestions)]]
+    return suggestions
+
+
+def _no_suggestions_key(user_id):
+    return f'graph:suggestions:{user_id}:none'
+
+
+def refresh_suggestions(user_ids, limit=None):
+    """Recompute and store the suggestions of ``user_ids``."""
+    rows, empty = [], []
+    for user_id in user_ids:
+        suggested = suggest(user_id, limit)
+        rows += [
+            FollowSuggestion(user_id=user_id, suggested_id=suggested_id, mutual_count=mutual)
+            for suggested_id, mutual in suggested
+        ]
+        if not suggested:
+            empty.append(user_id)
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__in=user_ids).delete()
+        FollowSuggestion.objects.bulk_create(rows)
+    cache.set_many({_no_suggestions_key(user_id): True for user_id in empty}, graph_setting('TIMEOUT'))
+    return len(rows)
+
+
+def suggestions(user_id, limit=None):
+    """Stored suggestions still worth showing, computed on first use (at most ``SUGGESTIONS``)."""
+    limit = min(limit or graph_setting('SUGGESTIONS'), graph_setting('SUGGESTIONS'))
+    stored = FollowSuggestion.objects.filter(user_id=user_id)
+    if not stored.exists():
+        if cache.get(_no_suggestions_key(user_id)):
+            return []
+        refresh_suggestions([user_id])
+    following = following_ids(user_id)
+    rows = stored.filter(suggested__is_active=True).select_related('suggested').order_by('-mutual_count', 'suggested_id')
+    # people followed since the last precompute drop out here
+    return [row for row in rows if row.suggested_id not in following][:limit]
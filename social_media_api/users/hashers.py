@@ -0,0 +1,60 @@
+# users/hashers.py
+"""
+Password hashing on a bounded thread pool.
+
+A PBKDF2 hash costs hundreds of milliseconds of CPU at Django's iteration
+count. Computed on request threads, a burst of logins or registrations
+occupies every core, and under ASGI every thread of the pool that runs sync
+views, so unrelated requests queue behind it.
+
+``PooledPBKDF2PasswordHasher`` runs ``encode()``/``verify()`` on at most
+``PASSWORD_HASHING['WORKERS']`` threads (hashlib releases the GIL, so they
+hash in parallel) while the request thread waits for the result. The
+algorithm and its hashes are Django's ``pbkdf2_sha256``, so existing
+passwords verify unchanged. Django picks the hasher for a stored hash by
+algorithm name, the last listed hasher winning, so ``PASSWORD_HASHERS`` must
+not list the plain ``PBKDF2PasswordHasher`` as well. ``WORKERS = 0`` hashes
+on the calling thread.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULTS = {
+    'WORKERS': 4,
+}
+
+
+def hashing_setting(name):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, DEFAULTS[name])
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    workers = hashing_setting('WORKERS')
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing') if workers else None
+
+
+@receiver(setting_changed)
+def _reset_executor(setting, **kwargs):
+    if setting == 'PASSWORD_HASHING':
+        get_executor.cache_clear()
+
+
+def _run(function, *args):
+    executor = get_executor()
+    if executor is None:
+        return function(*args)
+    return executor.submit(function, *args).result()
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    def encode(self, password, salt, iterations=None):
+        return _run(super().encode, password, salt, iterations)
+
+    def verify(self, password, encoded):
+        return _run(super().verify, password, encoded)
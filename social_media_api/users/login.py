@@ -0,0 +1,70 @@
+# users/login.py
+"""
+What the login endpoint does besides issuing tokens.
+
+``LOGIN['USER']`` picks the user embedded in the response: ``full`` is the
+whole profile (``UserSerializer``, including the 20 latest posts), and
+``compact`` is ``UserSummarySerializer``, read from the row that was just
+authenticated, so it needs no further queries.
+
+With ``LOGIN['WARM_FEED']`` a background thread loads the user's follow
+graph, which ``posts.timeline.home_timeline()`` reads on every feed request,
+into the cache. The first feed request after logging in then doesn't pay
+for it.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from . import graph
+from .serializers import UserSerializer, UserSummarySerializer
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'USER': 'full',
+    'WARM_FEED': False,
+}
+
+SERIALIZERS = {
+    'full': UserSerializer,
+    'compact': UserSummarySerializer,
+}
+
+
+def login_setting(name):
+    return getattr(settings, 'LOGIN', {}).get(name, DEFAULTS[name])
+
+
+def user_data(user):
+    return SERIALIZERS[login_setting('USER')](user).data
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='login-warm')
+
+
+@receiver(setting_changed)
+def _reset_executor(setting, **kwargs):
+    if setting == 'LOGIN':
+        get_executor.cache_clear()
+
+
+def _warm(user_id):
+    close_old_connections()
+    try:
+        graph.following_ids(user_id)
+    except Exception:
+        logger.exception("Could not warm the feed of user %s", user_id)
+    finally:
+        close_old_connections()
+
+
+def warm_feed(user_id):
+    get_executor().submit(_warm, user_id)
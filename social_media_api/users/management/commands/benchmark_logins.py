@@ -0,0 +1,67 @@
+# users/management/commands/benchmark_logins.py
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from users.views import CustomTokenObtainPairView
+
+User = get_user_model()
+
+# (label, LOGIN['USER'], PASSWORD_HASHING['WORKERS'] or None for the configured value)
+SCENARIOS = [
+    ("full profile, hashing on request threads", 'full', 0),
+    ("compact user, hashing on request threads", 'compact', 0),
+    ("compact user, hashing pool", 'compact', None),
+]
+
+
+class Command(BaseCommand):
+    help = "Measure logins per second through the login view for each login mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=40, help="Logins per scenario.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Client threads.")
+        parser.add_argument('--posts', type=int, default=20, help="Posts given to the benchmark user.")
+
+    def handle(self, *args, **options):
+        from posts.models import Post
+
+        password = uuid.uuid4().hex
+        user = User.objects.create_user(username=f'benchmark-{uuid.uuid4().hex[:12]}', password=password)
+        Post.objects.bulk_create(
+            [Post(author=user, title=f'Post {n}', content='Benchmark') for n in range(options['posts'])]
+        )
+        try:
+            for label, mode, workers in SCENARIOS:
+                hashing = {} if workers is None else {'PASSWORD_HASHING': {'WORKERS': workers}}
+                with override_settings(LOGIN={'USER': mode, 'WARM_FEED': False}, **hashing):
+                    rate = self.run(user.username, password, options['requests'], options['concurrency'])
+                self.stdout.write(f"{label}: {rate:.1f} logins/s")
+        finally:
+            # posts cascade, their search rows and counters go through the usual signals
+            user.delete()
+
+    def run(self, username, password, requests, concurrency):
+        view = CustomTokenObtainPairView.as_view()
+        factory = APIRequestFactory()
+
+        def login(_):
+            try:
+                request = factory.post('/api/users/login/', {'username': username, 'password': password}, format='json')
+                response = view(request)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Login failed with {response.status_code}: {response.data}")
+            finally:
+                connections.close_all()
+
+        login(None)  # warm up
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(login, range(requests)))
+        return requests / (time.perf_counter() - started)
@@ -0,0 +1,29 @@
+# users/management/commands/compute_follow_suggestions.py
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from users import graph
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Precompute friends-of-friends follow suggestions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Only these users.")
+        parser.add_argument('--limit', type=int, help="Suggestions kept per user (default: FOLLOW_GRAPH['SUGGESTIONS']).")
+        parser.add_argument('--batch-size', type=int, default=500, help="Users stored per transaction.")
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        user_ids = users.order_by('pk').values_list('pk', flat=True).iterator()
+        processed = stored = 0
+        while batch := list(islice(user_ids, options['batch_size'])):
+            stored += graph.refresh_suggestions(batch, options['limit'])
+            processed += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Stored {stored} suggestion(s) for {processed} user(s)."))
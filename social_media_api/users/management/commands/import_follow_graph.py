@@ -0,0 +1,85 @@
+# users/management/commands/import_follow_graph.py
+import csv
+import json
+import sys
+from collections import defaultdict
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Import follow edges from a CSV file with a follower,followed header or from JSON lines "
+        'like {"follower": ..., "followed": ...}. Users are matched by username or id.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file, '-' for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: guessed from the file extension.")
+        parser.add_argument('--key', choices=['username', 'id'], default='username', help="How users are identified.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Edges imported per transaction.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        followed = skipped = 0
+        try:
+            edges = self.read_csv(stream) if fmt == 'csv' else self.read_jsonl(stream)
+            while chunk := list(islice(edges, options['batch_size'])):
+                with transaction.atomic():
+                    added, missing = self.import_chunk(chunk, options['key'])
+                followed += added
+                skipped += missing
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write(self.style.SUCCESS(f"Imported {followed} follow(s), skipped {skipped}."))
+
+    def read_csv(self, stream):
+        reader = csv.DictReader(stream)
+        if not {'follower', 'followed'} <= set(reader.fieldnames or ()):
+            raise CommandError("CSV input needs a follower,followed header.")
+        for row in reader:
+            yield row['follower'], row['followed']
+
+    def read_jsonl(self, stream):
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    edge = json.loads(line)
+                    yield edge['follower'], edge['followed']
+                except (ValueError, KeyError, TypeError) as exc:
+                    raise CommandError(f"Line {number}: {exc}") from exc
+
+    def resolve(self, values, key):
+        """``{value: user id}`` for the active users among ``values``, in one query."""
+        users = User.objects.filter(is_active=True)
+        if key == 'username':
+            return dict(users.filter(username__in={str(value) for value in values}).values_list('username', 'pk'))
+        ids = set()
+        for value in values:
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                pass
+        return {str(pk): pk for pk in users.filter(pk__in=ids).values_list('pk', flat=True)}
+
+    def import_chunk(self, chunk, key):
+        users = self.resolve({value for edge in chunk for value in edge}, key)
+        targets = defaultdict(set)
+        for follower, followed in chunk:
+            follower_id, followed_id = users.get(str(follower)), users.get(str(followed))
+            if follower_id and followed_id:
+                targets[follower_id].add(followed_id)
+        added = 0
+        for follower_id, followed_ids in targets.items():
+            # one bulk insert and one batch of counters/notifications per follower, new follows only
+            added += len(User(pk=follower_id).follow_many(followed_ids))
+        # unknown users, self-follows, existing follows and duplicate lines
+        return added, len(chunk) - added
@@ -0,0 +1,223 @@
+# users/management/commands/seed_social_graph.py
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from notifications.models import Notification, NotificationActor
+from posts.models import Comment, Like, Post
+
+User = get_user_model()
+Follow = User.following.through
+
+WORDS = (
+    'django python coffee travel music photo sunset weekend launch release team design garden city night '
+    'morning project idea book movie game recipe running mountain ocean friends code bug deploy cache'
+).split()
+
+# recent_actors kept on aggregated notifications, see notifications/aggregation.py
+ACTOR_SAMPLE = 3
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a reproducible synthetic social graph: users with power-law follower counts, posts, "
+        "comments, likes and aggregated notifications. Written with bulk inserts; counters, timelines and "
+        "the search index are rebuilt afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help="Users to create.")
+        parser.add_argument('--avg-following', type=float, default=30, help="Mean accounts followed per user.")
+        parser.add_argument('--alpha', type=float, default=1.1, help="Zipf exponent of account popularity.")
+        parser.add_argument('--posts-per-user', type=float, default=5, help="Mean posts per user.")
+        parser.add_argument('--comments-per-post', type=float, default=2, help="Mean comments per post.")
+        parser.add_argument('--likes-per-post', type=float, default=5, help="Mean likes per post.")
+        parser.add_argument('--days', type=int, default=30, help="Posts and comments are spread over this many days.")
+        parser.add_argument('--prefix', default='seed', help="Usernames are <prefix><n>.")
+        parser.add_argument('--password', default='password', help="Password of every generated user.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same graph.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk insert.")
+        parser.add_argument('--skip-timelines', action='store_true', help="Don't rebuild home timelines.")
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError("--users must be at least 2.")
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users named {options['prefix']}* exist already, pick another --prefix.")
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        user_ids = self.create_users()
+        # popularity is a Zipf law over a shuffled ranking, so it doesn't follow the ids
+        ranking = list(user_ids)
+        self.rng.shuffle(ranking)
+        self.popular = ranking
+        self.cum_weights = list(accumulate(1 / (rank + 1) ** options['alpha'] for rank in range(len(ranking))))
+        self.user_ids = user_ids
+
+        follows = self.create_follows()
+        posts, comments, likes = self.create_posts()
+        self.stdout.write(
+            f"Created {len(user_ids)} users, {follows} follows, {posts} posts, {comments} comments, {likes} likes."
+        )
+
+        for command, kwargs in [('reconcile_counters', {}), ('rebuild_search_index', {})]:
+            call_command(command, stdout=self.stdout, **kwargs)
+        if not options['skip_timelines']:
+            call_command('rebuild_timelines', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS("Seeded."))
+
+    def batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def popular_users(self, k):
+        """``k`` users drawn by popularity, without duplicates."""
+        return set(self.rng.choices(self.popular, cum_weights=self.cum_weights, k=k))
+
+    def heavy_tailed(self, mean, cap):
+        # Pareto with shape 1.5 has mean 3
+        return min(cap, int(self.rng.paretovariate(1.5) * mean / 3))
+
+    def sentence(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    def created_at(self, after=None):
+        start = after or self.now - timedelta(days=self.options['days'])
+        return start + (self.now - start) * self.rng.random()
+
+    def create_users(self):
+        prefix, password = self.options['prefix'], make_password(self.options['password'])
+        users = (
+            User(username=f'{prefix}{n}', email=f'{prefix}{n}@example.com', password=password, bio=self.sentence(6))
+            for n in range(self.options['users'])
+        )
+        ids = []
+        for batch in self.batches(users):
+            with transaction.atomic():
+                ids.extend(user.pk for user in User.objects.bulk_create(batch))
+        return ids
+
+    def create_follows(self):
+        """
+        Insert the follow edges in streamed batches; follower counts are
+        derived afterwards by ``reconcile_counters``.
+        """
+        count = 0
+
+        def edges():
+            for user_id in self.user_ids:
+                k = self.heavy_tailed(self.options['avg_following'], len(self.user_ids) - 1)
+                for target_id in self.popular_users(k) - {user_id}:
+                    yield Follow(from_customuser_id=user_id, to_customuser_id=target_id)
+
+        for batch in self.batches(edges()):
+            with transaction.atomic():
+                Follow.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+        for recipient_ids in self.batches(self.user_ids):
+            with transaction.atomic():
+                self.create_follow_notifications(recipient_ids)
+        return count
+
+    def create_follow_notifications(self, recipient_ids):
+        """One aggregated 'followed you' per followed user in ``recipient_ids``, read back from the follow table."""
+        # newest (highest id) follower first, only the first ACTOR_SAMPLE of each group are kept
+        edges = (
+            Follow.objects.filter(to_customuser_id__in=recipient_ids)
+            .order_by('to_customuser_id', '-from_customuser_id')
+            .values_list('to_customuser_id', 'from_customuser_id')
+        )
+        notifications = {}
+        for recipient_id, actor_id in edges.iterator(chunk_size=self.batch_size):
+            notification = notifications.get(recipient_id)
+            if notification is None:
+                notifications[recipient_id] = Notification(
+                    recipient_id=recipient_id, actor_id=actor_id, verb='followed you', actor_count=0,
+                    recent_actors=[], is_read=self.rng.random() < 0.5,
+                )
+                notification = notifications[recipient_id]
+            notification.actor_count += 1
+            if len(notification.recent_actors) < ACTOR_SAMPLE:
+                notification.recent_actors.append(actor_id)
+        Notification.objects.bulk_create(notifications.values(), batch_size=self.batch_size)
+        actors = (
+            NotificationActor(notification_id=notifications[recipient_id].pk, actor_id=actor_id)
+            for recipient_id, actor_id in edges.iterator(chunk_size=self.batch_size)
+        )
+        for batch in self.batches(actors):
+            NotificationActor.objects.bulk_create(batch)
+
+    def create_notifications(self, notifications):
+        """Bulk create ``[(notification, actor ids)]`` with the distinct actors aggregation tracks."""
+        Notification.objects.bulk_create([notification for notification, _ in notifications], batch_size=self.batch_size)
+        NotificationActor.objects.bulk_create(
+            (NotificationActor(notification_id=notification.pk, actor_id=actor_id)
+             for notification, actors in notifications for actor_id in set(actors)),
+            batch_size=self.batch_size,
+        )
+
+    def create_posts(self):
+        posts = comments = likes = 0
+        authored = (
+            Post(author_id=user_id, title=self.sentence(4), content=self.sentence(20), created_at=self.created_at())
+            for user_id in self.user_ids
+            for _ in range(int(self.rng.expovariate(1 / self.options['posts_per_user'])))
+        )
+        for batch in self.batches(authored):
+            with transaction.atomic():
+                batch = Post.objects.bulk_create(batch)
+                comments += self.create_activity(batch, Comment)
+                likes += self.create_activity(batch, Like)
+            posts += len(batch)
+        return posts, comments, likes
+
+    def create_activity(self, posts, model):
+        """Comments or likes on ``posts`` by popularity-weighted users, plus their aggregated notifications."""
+        if model is Comment:
+            mean, verb = self.options['comments_per_post'], 'commented on your post'
+        else:
+            mean, verb = self.options['likes_per_post'], 'liked your post'
+        rows, notifications, latest = [], [], []
+        for post in posts:
+            actors = list(self.popular_users(self.heavy_tailed(mean, len(self.user_ids))))
+            if model is Comment:
+                written = {
+                    actor_id: Comment(post_id=post.pk, author_id=actor_id, content=self.sentence(8),
+                                      created_at=self.created_at(after=post.created_at))
+                    for actor_id in actors
+                }
+                rows.extend(written.values())
+            else:
+                rows.extend(Like(post_id=post.pk, user_id=actor_id) for actor_id in actors)
+            others = [actor_id for actor_id in actors if actor_id != post.author_id]
+            if others:
+                notifications.append((Notification(
+                    recipient_id=post.author_id, actor_id=others[-1], verb=verb, post_id=post.pk,
+                    actor_count=len(others), recent_actors=others[:-ACTOR_SAMPLE - 1:-1],
+                    is_read=self.rng.random() < 0.5,
+                ), others))
+                if model is Comment:
+                    # the comment of the notification's actor, not whoever commented last
+                    latest.append(written[others[-1]])
+        model.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=model is Like)
+        if model is Comment:
+            for (notification, _), comment in zip(notifications, latest):
+                notification.comment_id = comment.pk
+        self.create_notifications(notifications)
+        return len(rows)
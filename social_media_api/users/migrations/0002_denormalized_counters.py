@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _total(queryset, group_by):
+    return Coalesce(Subquery(queryset.order_by().values(group_by).annotate(n=Count('pk')).values('n')), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Post = apps.get_model('posts', 'Post')
+    Follow = CustomUser.following.through
+    CustomUser.objects.update(
+        followers_count=_total(Follow.objects.filter(to_customuser=OuterRef('pk')), 'to_customuser'),
+        following_count=_total(Follow.objects.filter(from_customuser=OuterRef('pk')), 'from_customuser'),
+        posts_count=_total(Post.objects.filter(author=OuterRef('pk')), 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('posts', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
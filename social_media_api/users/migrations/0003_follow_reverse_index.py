@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:42
+
+from django.db import migrations
+
+# The auto-created follow table only has UNIQUE (from_customuser_id,
+# to_customuser_id) plus single-column FK indexes, so "who follows X"
+# (follower lists, fan-out, counters) reads the FK index and then every
+# matching row. A (to, from) composite answers it from the index alone.
+INDEX = 'users_follow_to_from_idx'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f'CREATE INDEX {INDEX} ON users_customuser_following (to_customuser_id, from_customuser_id)',
+            f'DROP INDEX {INDEX}',
+        ),
+    ]
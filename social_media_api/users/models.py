@@ -5,6 +5,9 @@ from django.db import models
 class CustomUser(AbstractUser):
     bio = models.TextField(blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    profile_picture_asset = models.ForeignKey(
+        'uploads.MediaAsset', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
 
     # Following as M2M to self (asymmetric)
     following = models.ManyToManyField(
@@ -14,9 +17,24 @@ class CustomUser(AbstractUser):
         blank=True
     )
 
+    # denormalized, see posts/counters.py
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # profile changes that posts embed, watermarked by list ETags (social_media_api/conditional.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the username it had when loaded, its cached lookup is dropped on a rename (users.signals)
+        instance._loaded_username = instance.__dict__.get('username')
+        return instance
+
     def follow(self, user):
         if user != self:
             self.following.add(user)
@@ -25,5 +43,49 @@ class CustomUser(AbstractUser):
         if user != self:
             self.following.remove(user)
 
+    def follow_many(self, user_ids):
+        """
+        Follow every active user in ``user_ids`` at once and return the ids
+        of the new follows; unknown, inactive and already followed ids are
+        skipped. The targets are validated in one query and the through rows
+        go in as one bulk insert, so ``m2m_changed`` fires once: counters,
+        timelines and notifications are updated in a single batch (see
+        users.signals, posts.signals).
+        """
+        targets = set(
+            type(self).objects.filter(pk__in=set(user_ids), is_active=True)
+            .exclude(pk=self.pk).exclude(followers=self.pk).values_list('pk', flat=True)
+        )
+        if targets:
+            self.following.add(*targets)
+        return targets
+
+    def unfollow_many(self, user_ids):
+        user_ids = set(user_ids) - {self.pk}
+        if user_ids:
+            self.following.remove(*user_ids)
+
     def is_following(self, user):
-        return self.following.filter(pk=user.pk).exists()
+        from .graph import follows
+
+        return follows(self.pk, user.pk)
+
+
+class FollowSuggestion(models.Model):
+    """Precomputed "who to follow" entry, see users/graph.py."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='follow_suggestions')
+    suggested = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    # how many of the people ``user`` follows already follow ``suggested``
+    mutual_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'suggested'], name='unique_follow_suggestion'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-mutual_count', 'suggested'], name='suggestion_user_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.suggested} for {self.user}"
@@ -1,7 +1,13 @@
 # users/serializers.py
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db.models import F
 from posts.models import Post
+from social_media_api.fieldsets import SparseFieldsetMixin
+from social_media_api.readpath import ReadPlan, top_per_group
+from .models import FollowSuggestion
+from uploads.serializers import MediaUrlsField
+from . import graph
 
 User = get_user_model()
 
@@ -18,31 +24,98 @@ class RegisterSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         password = validated_data.pop('password')
-        user = User.objects.create(**validated_data)
+        user = User(**validated_data)
+        # hashed before the row is written, so registering is a single INSERT
         user.set_password(password)
         user.save()
         return user
 
 
-class MinimalPostSerializer(serializers.ModelSerializer):
+class MinimalPostSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Lightweight post serializer to avoid circular import"""
     class Meta:
         model = Post
         fields = ['id', 'title', 'created_at']
 
 
-class UserSerializer(serializers.ModelSerializer):
-    followers_count = serializers.IntegerField(source='followers.count', read_only=True)
-    following_count = serializers.IntegerField(source='following.count', read_only=True)
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     posts = serializers.SerializerMethodField()
+    followed_by_me = serializers.SerializerMethodField()
+    avatar = MediaUrlsField(source='profile_picture_asset')
 
     class Meta:
         model = User
         fields = [
-            'id', 'username', 'email', 'bio', 'profile_picture',
-            'followers_count', 'following_count', 'posts'
+            'id', 'username', 'email', 'bio', 'profile_picture', 'avatar',
+            'followers_count', 'following_count', 'posts_count', 'followed_by_me', 'posts'
         ]
+        read_only_fields = ['followers_count', 'following_count', 'posts_count']
+        expandable_fields = ['avatar', 'posts']
+
+    RECENT_POSTS = 20
 
     def get_posts(self, obj):
-        qs = Post.objects.filter(author=obj).order_by('-created_at')[:20]
-        return MinimalPostSerializer(qs, many=True).data
+        qs = Post.objects.filter(author=obj).order_by('-created_at', '-id')[:self.RECENT_POSTS]
+        return MinimalPostSerializer(qs, many=True, fieldset=self.nested_fieldset('posts')).data
+
+    def get_followed_by_me(self, obj):
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return False
+        # one graph lookup shared by every user in a list
+        if '_following_ids' not in self.context:
+            self.context['_following_ids'] = graph.following_ids(request.user.pk)
+        return obj.pk in self.context['_following_ids']
+
+    # fast read path, see social_media_api.readpath
+
+    def plan_posts(self, plan):
+        posts = ReadPlan(MinimalPostSerializer(fieldset=self.nested_fieldset('posts')))
+        user_id = plan.column('id')
+        recent = {}
+
+        def fetch(rows):
+            recent.clear()
+            if not rows:
+                return
+            latest = list(top_per_group(
+                Post.objects.filter(author_id__in=[row[user_id] for row in rows]),
+                'author_id', ['-created_at', '-id'], self.RECENT_POSTS,
+            ).values(*posts.columns, posted_by=F('author_id')))
+            for post, data in zip(latest, posts.render_many(latest)):
+                recent.setdefault(post['posted_by'], []).append(data)
+
+        plan.batch(fetch)
+        return lambda row: recent.get(row[user_id], [])
+
+    def plan_followed_by_me(self, plan):
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return lambda row: False
+        user_id = plan.column('id')
+        following = graph.following_ids(request.user.pk)
+        return lambda row: row[user_id] in following
+
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    """The user's own columns only, for the compact login response."""
+    avatar = MediaUrlsField(source='profile_picture_asset')
+
+    class Meta:
+        model = User
+        fields = [
+            'id', 'username', 'email', 'bio', 'profile_picture', 'avatar',
+            'followers_count', 'following_count', 'posts_count'
+        ]
+        read_only_fields = fields
+
+
+class FollowSuggestionSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='suggested_id')
+    username = serializers.CharField(source='suggested.username')
+    profile_picture = serializers.ImageField(source='suggested.profile_picture')
+    followers_count = serializers.IntegerField(source='suggested.followers_count')
+
+    class Meta:
+        model = FollowSuggestion
+        fields = ['id', 'username', 'profile_picture', 'followers_count', 'mutual_count']
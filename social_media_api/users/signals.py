@@ -1,24 +1,104 @@
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.conf import settings
-from notifications.utils import create_notification
+from notifications.utils import NotificationEvent, notify_many
+from posts.counters import adjust
+from social_media_api import object_cache
+from . import authentication, graph
 
 User = settings.AUTH_USER_MODEL
 
 # Because CustomUser.following is a M2M to self, listen for m2m_changed
 from django.apps import apps
 CustomUser = apps.get_model('users', 'CustomUser')
+Follow = CustomUser.following.through
 
-@receiver(m2m_changed, sender=CustomUser.following.through)
+@receiver(m2m_changed, sender=Follow)
 def following_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
     # action can be 'post_add' when following occurs
     if action == 'post_add' and pk_set:
-        for pk in pk_set:
-            followed_user = CustomUser.objects.get(pk=pk)
-            # create a follow notification
-            create_notification(
-                recipient=followed_user,
-                actor=instance,
-                verb='followed you',
-                target=None
-            )
+        # one queued follow notification per new edge, written in a single batch
+        if reverse:
+            # instance gained the users in pk_set as followers
+            edges = [(instance.pk, pk) for pk in pk_set]
+        else:
+            edges = [(pk, instance.pk) for pk in pk_set]
+        notify_many(
+            NotificationEvent(recipient_id=recipient_id, actor_id=actor_id, verb='followed you')
+            for recipient_id, actor_id in edges
+        )
+
+
+@receiver(m2m_changed, sender=Follow)
+def follow_counters(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Keep followers_count/following_count in step with the follow table.
+
+    post_add only reports rows that were actually inserted, but remove() and
+    clear() report what was asked for, so the rows that really exist are
+    recorded in the pre_* step.
+    """
+    if action in ('pre_remove', 'pre_clear'):
+        if reverse:
+            existing = Follow.objects.filter(to_customuser=instance)
+            if pk_set is not None:
+                existing = existing.filter(from_customuser__in=pk_set)
+            instance._unfollowed_ids = set(existing.values_list('from_customuser_id', flat=True))
+        else:
+            existing = Follow.objects.filter(from_customuser=instance)
+            if pk_set is not None:
+                existing = existing.filter(to_customuser__in=pk_set)
+            instance._unfollowed_ids = set(existing.values_list('to_customuser_id', flat=True))
+        return
+    if action == 'post_add':
+        changed, delta = pk_set or set(), 1
+    elif action in ('post_remove', 'post_clear'):
+        changed, delta = instance.__dict__.pop('_unfollowed_ids', set()), -1
+    else:
+        return
+    if not changed:
+        return
+    if reverse:
+        # instance gained/lost followers
+        adjust(CustomUser, instance.pk, followers_count=delta * len(changed))
+        adjust(CustomUser, changed, following_count=delta)
+    else:
+        adjust(CustomUser, instance.pk, following_count=delta * len(changed))
+        adjust(CustomUser, changed, followers_count=delta)
+    object_cache.invalidate('user', {instance.pk, *changed})
+    graph.invalidate({instance.pk, *changed})
+
+
+@receiver(pre_delete, sender=CustomUser)
+def user_deleted(sender, instance, **kwargs):
+    # follow rows are removed by cascade without m2m_changed, settle the other side here
+    followers = set(Follow.objects.filter(to_customuser=instance).values_list('from_customuser_id', flat=True))
+    following = set(Follow.objects.filter(from_customuser=instance).values_list('to_customuser_id', flat=True))
+    adjust(CustomUser, followers, following_count=-1)
+    adjust(CustomUser, following, followers_count=-1)
+    object_cache.invalidate('user', {instance.pk, *followers, *following})
+    graph.invalidate({instance.pk, *followers, *following})
+    authentication.forget(instance.pk)
+    forget_username_lookups({instance.username})
+
+
+def forget_username_lookups(usernames):
+    """Drop the cached username -> id lookups (``UserDetailView``) once the transaction commits."""
+    usernames = {username for username in usernames if username}
+    transaction.on_commit(lambda: [object_cache.forget_lookup('user', 'username', name) for name in usernames])
+
+
+@receiver(post_save, sender=CustomUser)
+def user_changed(sender, instance, created, update_fields, **kwargs):
+    # a new or renamed user may take a username whose lookup still points at its previous owner
+    if update_fields is None or 'username' in update_fields:
+        forget_username_lookups({instance.username, getattr(instance, '_loaded_username', None)})
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        # logins don't change anything that is rendered
+        return
+    # profile and password changes, see users/authentication.py
+    authentication.forget(instance.pk)
+    object_cache.invalidate('user', instance.pk)
+    # cached posts embedding the user as author or commenter depend on this version (posts.views)
+    object_cache.invalidate('author', instance.pk)
@@ -1,3 +1,302 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, identify_hasher, make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from notifications.models import Notification
+from posts.models import Post
+from social_media_api.readpath import ReadPlan
+from social_media_api.testing import QueryBudgetMixin, QueryPlanMixin, ReadPathParityMixin
+from .authentication import USER_VERSION_CLAIM, CachedJWTAuthentication, user_version
+from .hashers import PooledPBKDF2PasswordHasher
+from .serializers import UserSerializer, UserSummarySerializer
+from .views import CustomTokenObtainPairSerializer
+
+User = get_user_model()
+
+
+class HotPathIndexTests(QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user', password='pass')
+
+    def test_followers_read_the_reverse_follow_index(self):
+        self.assertUsesIndex(self.user.followers.values('pk'), 'users_follow_to_from_idx')
+
+    def test_following_reads_the_unique_follow_index(self):
+        table = User.following.through._meta.db_table
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        unique = next(
+            name for name, info in constraints.items()
+            if info['unique'] and info['columns'] == ['from_customuser_id', 'to_customuser_id']
+        )
+        self.assertUsesIndex(self.user.following.values('pk'), unique)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class FastReadPathParityTests(ReadPathParityMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(f'user{i}', password='pass', bio=f'bio ü {i}', profile_picture='p.png' if i % 2 else '')
+            for i in range(12)
+        ]
+        cls.users[0].following.add(*cls.users[1:6])
+        for i, user in enumerate(cls.users):
+            for j in range(i % 4):
+                Post.objects.create(author=user, title=f'{user.username} {j}', content='x')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def test_user_serializer_has_a_read_plan(self):
+        ReadPlan(UserSerializer())
+
+    def test_user_list(self):
+        for query in ['', '?page=2', '?fields=id,username,posts.title', '?omit=posts', '?expand=posts']:
+            with self.subTest(query=query):
+                self.assertSameAsSerializers(self.client, f'/api/users/{query}')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_user_detail(self):
+        self.assertWithinBudget('user-detail')
+
+
+@override_settings(AUTH_USER_CACHE_TIMEOUT=60, NOTIFICATIONS={'DELIVERY': 'sync'})
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('jwt', password='old-password')
+        self.auth = CachedJWTAuthentication()
+
+    def token_for(self, user):
+        return self.auth.get_validated_token(str(CustomTokenObtainPairSerializer.get_token(user).access_token))
+
+    def save(self, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+
+    def test_user_is_served_from_the_cache(self):
+        token = self.token_for(self.user)
+        with self.assertNumQueries(1):
+            self.auth.get_user(token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.auth.get_user(token), self.user)
+
+    def test_saving_the_user_forgets_it(self):
+        token = self.token_for(self.user)
+        self.auth.get_user(token)
+        self.user.bio = 'changed'
+        self.save(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.auth.get_user(token).bio, 'changed')
+
+    def test_password_change_retires_older_tokens(self):
+        stale = self.token_for(self.user)
+        self.auth.get_user(stale)
+        self.user.set_password('new-password')
+        self.save(self.user)
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.get_user(stale)
+        self.assertEqual(self.auth.get_user(self.token_for(self.user)), self.user)
+
+    def test_user_version_is_not_derived_from_the_hash_alone(self):
+        claim = self.token_for(self.user)[USER_VERSION_CLAIM]
+        self.assertEqual(claim, self.user.get_session_auth_hash())
+        with override_settings(SECRET_KEY='another-secret-key-another-secret-key-1234'):
+            self.assertNotEqual(user_version(self.user), claim)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class UsernameLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='pass')
+
+    def rename(self, user, username):
+        user = User.objects.get(pk=user.pk)
+        user.username = username
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+
+    def test_rename_is_seen_whatever_the_fields(self):
+        self.assertEqual(self.client.get('/api/users/alice/?fields=id').data, {'id': self.user.pk})
+        self.rename(self.user, 'alicia')
+        self.assertEqual(self.client.get('/api/users/alice/?fields=id').status_code, 404)
+        self.assertEqual(self.client.get('/api/users/alicia/?fields=id').data, {'id': self.user.pk})
+
+    def test_freed_username_goes_to_its_new_owner(self):
+        self.client.get('/api/users/alice/?fields=id')
+        self.rename(self.user, 'alicia')
+        with self.captureOnCommitCallbacks(execute=True):
+            bob = User.objects.create_user('bob', password='pass')
+        self.rename(bob, 'alice')
+        self.assertEqual(self.client.get('/api/users/alice/?fields=id').data, {'id': bob.pk})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class FollowManyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('fan', password='pass')
+        cls.others = [User.objects.create_user(f'star{n}', password='pass') for n in range(3)]
+        cls.user.following.add(cls.others[0])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def follow(self, url, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, data, format='json')
+
+    def test_only_new_follows_are_reported(self):
+        ids = [other.pk for other in self.others] + [self.user.pk, 9999]
+        response = self.follow('/api/users/follow/', {'ids': ids})
+        self.assertEqual(response.data['followed'], [self.others[1].pk, self.others[2].pk])
+        self.assertEqual(response.data['skipped'], sorted([self.others[0].pk, self.user.pk, 9999]))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 3)
+
+    def test_single_follow(self):
+        target = self.others[1].pk
+        self.assertEqual(self.follow(f'/api/users/follow/{target}/').data['followed'], [target])
+        again = self.follow(f'/api/users/follow/{target}/')
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual((again.data['followed'], again.data['skipped']), ([], [target]))
+        self.assertEqual(self.follow('/api/users/follow/9999/').status_code, 404)
+
+    def test_import_counts_new_follows(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w') as file:
+            file.write('follower,followed\n')
+            file.writelines(f'fan,{other.username}\n' for other in self.others)
+            file.write('fan,nobody\n')
+        for expected in ['Imported 2 follow(s), skipped 2.', 'Imported 0 follow(s), skipped 4.']:
+            with self.subTest(expected=expected):
+                out = StringIO()
+                with self.captureOnCommitCallbacks(execute=True):
+                    call_command('import_follow_graph', path, stdout=out)
+                self.assertIn(expected, out.getvalue())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'})
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='secret-pass')
+
+    def login(self):
+        return self.client.post('/api/users/login/', {'username': 'alice', 'password': 'secret-pass'})
+
+    def test_compact_login_embeds_the_summary(self):
+        with override_settings(LOGIN={'USER': 'compact'}):
+            with CaptureQueriesContext(connection) as compact:
+                response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['user']), UserSummarySerializer.Meta.fields)
+        self.assertIn('access', response.data)
+        with CaptureQueriesContext(connection) as full:
+            self.assertIn('posts', self.login().data['user'])
+        self.assertLess(len(compact), len(full))
+
+    def test_registration_is_a_single_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/users/register/', {'username': 'bob', 'email': 'bob@example.com', 'password': 'secret-pass'}
+            )
+        self.assertEqual(response.status_code, 201)
+        writes = [query['sql'].split()[0] for query in queries if '"users_customuser"' in query['sql']]
+        self.assertEqual(writes.count('INSERT'), 1)
+        self.assertNotIn('UPDATE', writes)
+        self.assertTrue(User.objects.get(username='bob').check_password('secret-pass'))
+
+
+class PooledPasswordHasherTests(TestCase):
+    def test_pbkdf2_hashes_are_verified_on_the_pool(self):
+        encoded = make_password('secret-pass')
+        self.assertIsInstance(identify_hasher(encoded), PooledPBKDF2PasswordHasher)
+        threads = []
+        verify = PBKDF2PasswordHasher.verify
+
+        def recording_verify(hasher, password, encoded):
+            threads.append(threading.current_thread().name)
+            return verify(hasher, password, encoded)
+
+        self.enterContext(mock.patch.object(PBKDF2PasswordHasher, 'verify', recording_verify))
+        for workers, pooled in [(2, True), (0, False)]:
+            threads.clear()
+            with self.subTest(workers=workers), override_settings(PASSWORD_HASHING={'WORKERS': workers}):
+                self.assertTrue(check_password('secret-pass', encoded))
+                self.assertFalse(check_password('wrong', encoded))
+                self.assertEqual([name.startswith('password-hashing') for name in threads], [pooled, pooled])
+
+    def test_plain_pbkdf2_hashes_still_verify(self):
+        encoded = PBKDF2PasswordHasher().encode('secret-pass', PBKDF2PasswordHasher().salt())
+        self.assertTrue(check_password('secret-pass', encoded))
+
+
+class SeedSocialGraphTests(TestCase):
+    def test_notifications_match_the_seeded_activity(self):
+        call_command('seed_social_graph', users=40, comments_per_post=4, skip_timelines=True, stdout=StringIO())
+        commented = Notification.objects.exclude(comment=None).select_related('comment')
+        self.assertTrue(commented.exists())
+        for notification in commented:
+            self.assertEqual(notification.comment.author_id, notification.actor_id)
+            self.assertEqual(notification.comment.post_id, notification.post_id)
+        for notification in Notification.objects.all():
+            self.assertEqual(notification.actors.count(), notification.actor_count)
+
+    def test_follow_notifications_match_the_follow_table(self):
+        call_command('seed_social_graph', users=30, batch_size=7, skip_timelines=True, stdout=StringIO())
+        followed = Notification.objects.filter(verb='followed you').select_related('recipient')
+        self.assertEqual(followed.count(), User.objects.filter(followers_count__gt=0).count())
+        for notification in followed:
+            followers = sorted(notification.recipient.followers.values_list('pk', flat=True), reverse=True)
+            self.assertEqual(notification.actor_count, notification.recipient.followers_count)
+            self.assertEqual(notification.actor_count, len(followers))
+            self.assertEqual((notification.actor_id, notification.recent_actors), (followers[0], followers[:3]))
+            self.assertEqual(set(notification.actors.values_list('actor_id', flat=True)), set(followers))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATIONS={'DELIVERY': 'sync'}, FOLLOW_GRAPH={'SUGGESTIONS': 2})
+class FollowSuggestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_limit_is_capped_at_the_stored_suggestions(self):
+        user = User.objects.create_user('user', password='pass')
+        for n in range(4):
+            User.objects.create_user(f'other{n}', password='pass')
+        self.client.force_authenticate(user)
+        for limit in ['1', '2', '50', 'x']:
+            with self.subTest(limit=limit):
+                response = self.client.get('/api/users/suggestions/', {'limit': limit})
+                self.assertEqual(len(response.data), min(int(limit) if limit.isdigit() else 2, 2))
+
+    def test_users_without_suggestions_are_not_recomputed(self):
+        user = User.objects.create_user('lonely', password='pass')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get('/api/users/suggestions/').data, [])
+        with self.assertNumQueries(1):
+            # only the stored suggestions lookup, the empty result is remembered
+            self.assertEqual(self.client.get('/api/users/suggestions/').data, [])
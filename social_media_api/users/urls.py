@@ -1,5 +1,8 @@
 from django.urls import path
-from .views import RegisterView, UserListView, ProfileView, UserDetailView, CustomTokenObtainPairView
+from .views import (
+    RegisterView, UserListView, ProfileView, UserDetailView, CustomTokenObtainPairView, FollowView, UnfollowView,
+    FollowSuggestionsView,
+)
 from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
@@ -8,5 +11,10 @@ urlpatterns = [
     path('me/', ProfileView.as_view(), name='user-profile'),
     path('login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair_custom'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('follow/', FollowView.as_view(), name='user-follow-many'),
+    path('follow/<int:user_id>/', FollowView.as_view(), name='user-follow'),
+    path('unfollow/', UnfollowView.as_view(), name='user-unfollow-many'),
+    path('unfollow/<int:user_id>/', UnfollowView.as_view(), name='user-unfollow'),
+    path('suggestions/', FollowSuggestionsView.as_view(), name='user-suggestions'),
     path('<str:username>/', UserDetailView.as_view(), name='user-detail'),
 ]
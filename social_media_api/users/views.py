@@ -2,50 +2,157 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model, authenticate
+from django.db import transaction
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from .serializers import RegisterSerializer, UserSerializer
+from social_media_api import object_cache
+from social_media_api.fieldsets import SparseFieldsetViewMixin
+from social_media_api.readpath import FastListMixin
+from uploads.handlers import StreamingUploadMixin
+from uploads.ingest import ingest
+from .authentication import USER_VERSION_CLAIM, user_version
+from .serializers import FollowSuggestionSerializer, RegisterSerializer, UserSerializer
+from . import graph, login
 
 User = get_user_model()
 
-class RegisterView(generics.CreateAPIView):
+class ProfilePictureMixin(StreamingUploadMixin):
+    def ingest_profile_picture(self, serializer):
+        """Store an uploaded ``profile_picture`` as a deduplicated asset."""
+        upload = serializer.validated_data.get('profile_picture')
+        if not upload:
+            return {}
+        asset, _ = ingest(upload, self.request.user)
+        return {'profile_picture': asset.file.name, 'profile_picture_asset': asset}
+
+
+class RegisterView(ProfilePictureMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = RegisterSerializer
     permission_classes = [permissions.AllowAny]
 
+    def perform_create(self, serializer):
+        serializer.save(**self.ingest_profile_picture(serializer))
 
-class UserListView(generics.ListAPIView):
-    queryset = User.objects.all()
+
+class UserListView(SparseFieldsetViewMixin, FastListMixin, generics.ListAPIView):
+    # a stable order, pages must not overlap
+    queryset = User.objects.order_by('id')
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.renders('avatar'):
+            queryset = queryset.select_related('profile_picture_asset')
+        return queryset
+
 
-class ProfileView(generics.RetrieveUpdateAPIView):
+class ProfileView(ProfilePictureMixin, SparseFieldsetViewMixin, generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # request.user may come from the cache (users.authentication) with stale counters
+        return User.objects.select_related('profile_picture_asset').get(pk=self.request.user.pk)
+
+    def perform_update(self, serializer):
+        serializer.save(**self.ingest_profile_picture(serializer))
 
 
-class UserDetailView(generics.RetrieveAPIView):
+class UserDetailView(SparseFieldsetViewMixin, object_cache.CachedRetrieveMixin, generics.RetrieveAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     lookup_field = 'username'
     permission_classes = [permissions.AllowAny]
+    object_cache_label = 'user'
+
+    def get_cached_pk(self):
+        return object_cache.lookup('user', 'username', self.kwargs['username'], self.get_queryset())
+
+    def get_viewer_fields(self, pk):
+        user = self.request.user
+        if not self.renders('followed_by_me'):
+            return {}
+        return {'followed_by_me': user.is_authenticated and graph.follows(user.pk, pk)}
+
+
+class FollowView(APIView):
+    """
+    Follow one user (``follow/<user_id>/``) or many at once with
+    ``{"ids": [...]}`` (``follow/``), e.g. accepted suggestions.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_ids = 500
+
+    def get_ids(self, request, user_id):
+        if user_id is not None:
+            return [user_id]
+        ids = request.data.get('ids')
+        if (
+            not isinstance(ids, list) or not ids or len(ids) > self.max_ids
+            or not all(isinstance(pk, int) for pk in ids)
+        ):
+            return None
+        return ids
+
+    def post(self, request, user_id=None):
+        ids = self.get_ids(request, user_id)
+        if ids is None:
+            return Response(
+                {'ids': f'A list of at most {self.max_ids} user ids is required.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        with transaction.atomic():
+            return self.perform(request.user, ids, single=user_id is not None)
+
+    def perform(self, user, ids, single):
+        followed = user.follow_many(ids)
+        if single and not followed and not user.following.filter(pk=ids[0]).exists():
+            return Response({'detail': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'followed': sorted(followed), 'skipped': sorted(set(ids) - followed)})
+
+
+class UnfollowView(FollowView):
+    """Unfollow one user (``unfollow/<user_id>/``) or many with ``{"ids": [...]}``."""
+
+    def perform(self, user, ids, single):
+        user.unfollow_many(ids)
+        return Response({'unfollowed': sorted(set(ids))})
+
+
+class FollowSuggestionsView(generics.ListAPIView):
+    """People the current user may want to follow, best first (``?limit=``, at most ``FOLLOW_GRAPH['SUGGESTIONS']``)."""
+    serializer_class = FollowSuggestionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = []
+    pagination_class = None
+
+    def get_queryset(self):
+        # only FOLLOW_GRAPH['SUGGESTIONS'] are stored per user
+        most = graph.graph_setting('SUGGESTIONS')
+        try:
+            limit = min(max(int(self.request.query_params.get('limit', most)), 1), most)
+        except ValueError:
+            limit = most
+        return graph.suggestions(self.request.user.pk, limit)
 
 
 # Custom TokenObtainPairSerializer to include user profile in response
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
-        return super().get_token(user)
+        token = super().get_token(user)
+        token[USER_VERSION_CLAIM] = user_version(user)
+        return token
 
     def validate(self, attrs):
         data = super().validate(attrs)
-        data['user'] = UserSerializer(self.user).data
+        data['user'] = login.user_data(self.user)
+        if login.login_setting('WARM_FEED'):
+            login.warm_feed(self.user.pk)
         return data
 
 class CustomTokenObtainPairView(TokenObtainPairView):